@@ -1,28 +1,58 @@
+# Core
+import os
+
 # Third party
 import requests
 
 # Local
 import helpers
 import feeds
+import page_cache
+import post_mirror
+import post_records
+
+
+INSIGHTS_ADMIN_URL = os.getenv(
+    "INSIGHTS_ADMIN_URL", "https://admin.insights.ubuntu.com"
+).rstrip("/")
+API_URL = INSIGHTS_ADMIN_URL + "/wp-json/wp/v2"
 
+# The "lang:jp" and "lang:cn" tags, whose posts aren't listed on the blog
+LANGUAGE_TAG_IDS = [3184, 3265]
 
-API_URL = "https://admin.insights.ubuntu.com/wp-json/wp/v2"
+# Ask the API for only the post fields the blog uses, rather than every
+# field. Needs an API which supports "_fields" along with "_embed".
+RESTRICT_POST_FIELDS = (
+    os.getenv("RESTRICT_POST_FIELDS", "false").lower() == "true"
+)
 
 
-def _embed_resource_data(resource):
-    if "_embedded" not in resource:
-        return resource
-    embedded = resource["_embedded"]
-    if "wp:featuredmedia" not in embedded:
-        return resource
-    resource["featuredmedia"] = embedded["wp:featuredmedia"][0]
-    return resource
+def post_parameters():
+    """
+    The parameters to ask the API for posts with: embedding their
+    author and featured image, and, with RESTRICT_POST_FIELDS,
+    only the fields post_records keeps
+    """
+
+    if not RESTRICT_POST_FIELDS:
+        return {"_embed": True}
+
+    return {
+        "_embed": "author,wp:featuredmedia",
+        # The API needs "_links" to embed anything
+        "_fields": ",".join(
+            post_records.API_FIELDS + ["_links", "_embedded"]
+        ),
+    }
 
 
 def _normalise_resources(posts):
-    for post in posts:
-        post = _embed_resource_data(post)
-    return posts
+    """
+    Compact records of posts from the API,
+    with the featured image at post["featuredmedia"]
+    """
+
+    return [post_records.PostRecord.from_api(post) for post in posts]
 
 
 def get(endpoint, parameters={}):
@@ -30,9 +60,68 @@ def get(endpoint, parameters={}):
     Query the Insights API (admin.insights.ubuntu.com) using the cache
     """
 
-    return feeds.cached_request(
-        helpers.build_url(API_URL, endpoint, parameters)
-    )
+    url = helpers.build_url(API_URL, endpoint, parameters)
+
+    page_cache.record_upstream(url)
+
+    return feeds.cached_request(url)
+
+
+def get_uncached(endpoint, parameters={}):
+    """
+    Query the Insights API directly, without the cache,
+    for large responses which are only needed once
+    """
+
+    url = helpers.build_url(API_URL, endpoint, parameters)
+
+    return feeds.uncached_request(url)
+
+
+def get_modified_posts(modified_after=None, parameters={}):
+    """
+    Page through every post (or those modified after an ISO date),
+    least recently modified first, without filling the cache with them.
+
+    WordPress compares `modified_after` with each post's "modified"
+    date, in the site's timezone, rather than "modified_gmt".
+    """
+
+    page = 1
+    total_pages = 1
+
+    while page <= total_pages:
+        response = get_uncached(
+            "posts",
+            dict(
+                parameters,
+                per_page=100,
+                page=page,
+                orderby="modified",
+                order="asc",
+                modified_after=modified_after,
+            ),
+        )
+
+        for post in response.json():
+            yield post
+
+        total_pages = helpers.to_int(
+            response.headers.get("X-WP-TotalPages"), default=1
+        )
+        page += 1
+
+
+async def get_async(endpoint, parameters={}):
+    """
+    The same as get, for use in a coroutine
+    """
+
+    url = helpers.build_url(API_URL, endpoint, parameters)
+
+    page_cache.record_upstream(url)
+
+    return await feeds.cached_request_async(url)
 
 
 def get_topics(post_id):
@@ -45,19 +134,53 @@ def get_topics(post_id):
     return response.json()
 
 
-def get_tags(slugs=[], post_id=""):
+def get_tags(slugs=[], post_id="", ids=[]):
     """
     Get tag data from API,
-    optionally filtering by slug or post_id
+    optionally filtering by slug, post_id or ID (up to 100 IDs at once)
     """
 
     response = get(
-        endpoint="tags", parameters={"slug": ",".join(slugs), "post": post_id}
+        endpoint="tags",
+        parameters={
+            "slug": ",".join(slugs),
+            "post": post_id,
+            "include": helpers.join_ids(sorted(ids)),
+            "per_page": 100 if ids else None,
+        },
     )
 
     return response.json()
 
 
+def _fetch_posts(parameters):
+    """
+    Get posts from the API, with the number of posts and pages,
+    or no posts (and None) for a page past the last one
+    """
+
+    try:
+        response = get("posts", parameters)
+    except requests.exceptions.HTTPError as request_error:
+        response = request_error.response.json()
+
+        if (
+            type(response) is dict
+            and response.get("code") == "rest_post_invalid_page_number"
+        ):
+            # The page doesn't exist, so set everything to empty
+            return [], None, None
+
+        # We don't recognise this error, re-raise it
+        raise request_error
+
+    return (
+        response.json(),
+        helpers.to_int(response.headers.get("X-WP-Total"), None),
+        helpers.to_int(response.headers.get("X-WP-TotalPages"), None),
+    )
+
+
 def get_posts(
     page=1,
     per_page=12,
@@ -68,14 +191,16 @@ def get_posts(
     category_ids=[],
     tag_ids=[],
     # Exclude "lang:jp, lang:cn" tagged posts
-    tags_exclude_ids=[3184, 3265],
+    tags_exclude_ids=LANGUAGE_TAG_IDS,
     author_ids=[],
     before=None,
     after=None,
     exclude=None,
+    post_ids=[],
 ):
     """
-    Get posts by querying the Wordpress API,
+    Get posts from the post mirror, or by querying the Wordpress API
+    for searches or if the mirror isn't loaded,
     including retrieving pagination information.
 
     Gracefully handle errors for pages that don't exist,
@@ -84,11 +209,31 @@ def get_posts(
     Allow filtering on various criteria, using sensible defaults.
     """
 
-    try:
-        response = get(
-            "posts",
+    mirrored = None
+
+    if not query:
+        mirrored = post_mirror.mirror.find(
+            page=page,
+            per_page=per_page,
+            sticky=sticky,
+            slugs=slugs,
+            group_ids=group_ids,
+            category_ids=category_ids,
+            tag_ids=tag_ids,
+            tags_exclude_ids=tags_exclude_ids,
+            author_ids=author_ids,
+            before=before,
+            after=after,
+            exclude=exclude,
+            post_ids=post_ids,
+        )
+
+    if mirrored is not None:
+        posts, total_posts, total_pages = mirrored
+    else:
+        parameters = post_parameters()
+        parameters.update(
             {
-                "_embed": True,
                 "per_page": per_page,
                 "page": page,
                 "search": query,
@@ -102,30 +247,27 @@ def get_posts(
                 "before": before.isoformat() if before else None,
                 "after": after.isoformat() if after else None,
                 "exclude": exclude,
-            },
+                "include": helpers.join_ids(post_ids),
+            }
         )
-    except requests.exceptions.HTTPError as request_error:
-        response = request_error.response.json()
+        posts, total_posts, total_pages = _fetch_posts(parameters)
+        posts = _normalise_resources(posts)
+
+    # Pages listing these posts, or listing posts by these terms,
+    # should be purged from the page cache when any of them change
+    page_cache.record(
+        posts=[post["id"] for post in posts],
+        groups=group_ids,
+        categories=category_ids,
+        tags=tag_ids,
+    )
 
-        if (
-            type(response) is dict
-            and response.get("code") == "rest_post_invalid_page_number"
-        ):
-            # The page doesn't exist, so set everything to empty
-            posts = []
-            total_posts = None
-            total_pages = None
-        else:
-            # We don't recognise this error, re-raise it
-            raise request_error
-    else:
-        posts = response.json()
-        total_pages = helpers.to_int(
-            response.headers.get("X-WP-TotalPages"), None
+    for post in posts:
+        page_cache.record(
+            groups=post.get("group"),
+            categories=post.get("categories"),
+            tags=post.get("tags"),
         )
-        total_posts = helpers.to_int(response.headers.get("X-WP-Total"), None)
-
-    posts = _normalise_resources(posts)
 
     return posts, total_posts, total_pages
 
@@ -134,14 +276,33 @@ def get_category(category_id):
     return get("categories/" + str(category_id)).json()
 
 
-def get_categories(slugs=[]):
-    response = get("categories", {"slug": ",".join(slugs)})
+def get_categories(slugs=[], ids=[]):
+    """
+    Get category data from API,
+    optionally filtering by slug or ID (up to 100 IDs at once)
+    """
+
+    response = get(
+        "categories",
+        {
+            "slug": ",".join(slugs),
+            "include": helpers.join_ids(sorted(ids)),
+            "per_page": 100 if ids else None,
+        },
+    )
 
     return response.json()
 
 
-def get_users(slugs=[]):
-    response = get("users", {"slug": ",".join(slugs)})
+def get_users(slugs=[], ids=[]):
+    response = get(
+        "users",
+        {
+            "slug": ",".join(slugs),
+            "include": helpers.join_ids(sorted(ids)),
+            "per_page": 100 if ids else None,
+        },
+    )
 
     return response.json()
 
@@ -150,5 +311,19 @@ def get_group(group_id):
     return get("group/" + str(group_id)).json()
 
 
-def get_groups(slugs=[]):
-    return get("group", {"slug": ",".join(slugs)}).json()
+def get_groups(slugs=[], ids=[]):
+    """
+    Get group data from API,
+    optionally filtering by slug or ID (up to 100 IDs at once)
+    """
+
+    response = get(
+        "group",
+        {
+            "slug": ",".join(slugs),
+            "include": helpers.join_ids(sorted(ids)),
+            "per_page": 100 if ids else None,
+        },
+    )
+
+    return response.json()
@@ -1,5 +1,7 @@
 # Core
 import dateutil.parser
+import itertools
+import os
 from datetime import datetime
 from urllib.parse import urlparse, urlunparse, unquote
 
@@ -8,18 +10,25 @@ import flask
 import talisker.flask
 import talisker.logs
 import talisker.requests
-import xmltodict
+import werkzeug.http
 from dateutil.relativedelta import relativedelta
 
 # Local
 import api
+import archive_index
+import feed_filter
 import feeds
 import helpers
+import page_cache
+import post_mirror
+import prewarm
 import redirects
+import related_index
+import search_index
+import taxonomy
+import tracing
 
 
-INSIGHTS_ADMIN_URL = "https://admin.insights.ubuntu.com"
-
 app = flask.Flask(__name__)
 app.jinja_env.filters["monthname"] = helpers.monthname
 app.url_map.strict_slashes = False
@@ -27,6 +36,9 @@ app.url_map.converters["regex"] = helpers.RegexConverter
 talisker.flask.register(app)
 talisker.logs.set_global_extra({"service": "blog.ubuntu.com"})
 
+# First, so that the trace covers everything else
+tracing.register(app)
+
 if not app.testing:
     talisker.requests.configure(feeds.cached_session)
 
@@ -36,6 +48,13 @@ apply_redirects = redirects.prepare_redirects(
 )
 app.before_request(apply_redirects)
 
+taxonomy.start_background_refresh()
+post_mirror.start_background_refresh()
+search_index.start_background_refresh()
+archive_index.start_background_refresh()
+related_index.start_background_refresh()
+feeds.start_connection_warm_up(api.INSIGHTS_ADMIN_URL)
+
 
 def _tag_view(tag_slug, page_slug, template):
     """
@@ -44,7 +63,7 @@ def _tag_view(tag_slug, page_slug, template):
     """
 
     page = helpers.to_int(flask.request.args.get("page"), default=1)
-    tags = api.get_tags(slugs=[tag_slug])
+    tags = taxonomy.tags.get(slugs=[tag_slug])
 
     if not tags:
         flask.abort(404)
@@ -74,7 +93,14 @@ def _group_view(group_slug, page_slug, template):
     page = int(flask.request.args.get("page") or "1")
     category_slug = flask.request.args.get("category")
 
-    groups = api.get_groups(slugs=[group_slug])
+    groups, categories = helpers.run_concurrently(
+        lambda: taxonomy.groups.get(slugs=[group_slug]),
+        lambda: (
+            taxonomy.categories.get(slugs=[category_slug])
+            if category_slug
+            else []
+        ),
+    )
     category = None
 
     if not groups:
@@ -82,11 +108,8 @@ def _group_view(group_slug, page_slug, template):
 
     group = groups[0]
 
-    if category_slug:
-        categories = api.get_categories(slugs=[category_slug])
-
-        if categories:
-            category = categories[0]
+    if categories:
+        category = categories[0]
 
     posts, total_posts, total_pages = helpers.get_formatted_expanded_posts(
         group_ids=[group["id"]],
@@ -123,11 +146,15 @@ def clear_trailing():
         return flask.redirect(new_uri)
 
 
+app.before_request(page_cache.serve_cached_page)
+app.after_request(page_cache.cache_page)
+
+
 @app.route("/status")
 def status():
     """
     A simple response to test that the app is alive and working.
-    This can be targeted by Kubernetes readiness and liveness checks.
+    This can be targeted by Kubernetes liveness checks.
     As used in snapcraft.io:
     https://github.com/canonical-websites/snapcraft.io/pull/327/files
     """
@@ -135,38 +162,161 @@ def status():
     return "alive"
 
 
+@app.route("/status/ready")
+def status_ready():
+    """
+    For Kubernetes readiness checks: until this worker process's caches
+    have been pre-warmed, it responds "warming" with a 503, so it isn't
+    sent traffic while every page is slow
+    """
+
+    if not prewarm.ready.is_set():
+        return flask.Response("warming", status=503)
+
+    return "ready"
+
+
+@app.route("/status/metrics")
+def status_metrics():
+    """
+    How this worker process's caches and upstream requests are doing,
+    to monitor and alert on: whether it's ready, the size and hit ratio
+    of the upstream, page and formatted posts caches, and the latency
+    and error rate of requests to each upstream endpoint.
+
+    As it shows internal details, it's only enabled when
+    CACHE_PURGE_TOKEN is set, which must be sent as
+    "Authorization: Bearer <token>".
+    """
+
+    if not _has_token():
+        flask.abort(404)
+
+    upstream_cache_stats = feeds.copy_cache_stats()
+    page_cache_stats = page_cache.cache.copy_stats()
+    formatted_posts_stats = helpers.formatted_posts.copy_stats()
+
+    return flask.jsonify(
+        {
+            "ready": prewarm.ready.is_set(),
+            "prewarm": prewarm.last_report,
+            "upstream_cache": dict(
+                feeds.cache_size(),
+                hit_ratio=_hit_ratio(upstream_cache_stats),
+                **upstream_cache_stats
+            ),
+            "page_cache": dict(
+                entries=len(page_cache.cache),
+                bytes=page_cache.cache.bytes,
+                hit_ratio=_hit_ratio(page_cache_stats),
+                **page_cache_stats
+            ),
+            "formatted_posts_cache": dict(
+                entries=len(helpers.formatted_posts),
+                hit_ratio=_hit_ratio(formatted_posts_stats),
+                hits=formatted_posts_stats["hits"],
+                misses=formatted_posts_stats["misses"],
+                evictions=formatted_posts_stats["evictions"],
+            ),
+            "connections": feeds.connection_stats(),
+            "upstream": feeds.upstream_stats.report(),
+        }
+    )
+
+
+def _hit_ratio(stats):
+    lookups = stats["hits"] + stats["misses"]
+
+    return stats["hits"] / lookups if lookups else None
+
+
+def _has_token():
+    """
+    Whether the request sends CACHE_PURGE_TOKEN, as
+    "Authorization: Bearer <token>" (never, if it isn't set)
+    """
+
+    token = os.getenv("CACHE_PURGE_TOKEN")
+    authorization = flask.request.headers.get("Authorization")
+
+    return bool(token) and authorization == "Bearer " + token
+
+
+@app.route("/_cache/purge", methods=["POST"])
+def purge_page_cache():
+    """
+    Purge rendered pages showing any of the posts, groups, categories
+    or tags in the posted JSON, e.g. {"posts": [1234], "tags": [56]},
+    so WordPress can let us know when content changes.
+
+    Only enabled when CACHE_PURGE_TOKEN is set, which must be sent as
+    "Authorization: Bearer <token>".
+
+    Only purges the pages of the worker process which receives it,
+    see page_cache.purge.
+    """
+
+    if not _has_token():
+        flask.abort(404)
+
+    ids = flask.request.get_json(force=True, silent=True) or {}
+
+    if ids.get("posts") and post_mirror.mirror.loaded_at:
+        # Fetches the changed posts, and drops any which are no longer
+        # published, then purges their pages again, so pages rendered
+        # from the mirror in the meantime don't stay cached
+        post_mirror.refresh_in_background(ids["posts"])
+
+    purged = page_cache.purge(
+        posts=ids.get("posts"),
+        groups=ids.get("groups"),
+        categories=ids.get("categories"),
+        tags=ids.get("tags"),
+    )
+
+    return flask.jsonify(purged=purged)
+
+
 @app.route("/")
 def homepage():
     category_slug = flask.request.args.get("category")
 
     category = None
-    sticky_posts, _, _ = helpers.get_formatted_expanded_posts(sticky=True)
-    featured_posts = sticky_posts[:3] if sticky_posts else None
     page = helpers.to_int(flask.request.args.get("page"), default=1)
     posts_per_page = 12
 
-    upcoming_categories = api.get_categories(slugs=["events", "webinars"])
+    sticky, upcoming_categories, categories = helpers.run_concurrently(
+        lambda: helpers.get_formatted_expanded_posts(sticky=True),
+        lambda: taxonomy.categories.get(slugs=["events", "webinars"]),
+        lambda: (
+            taxonomy.categories.get(slugs=[category_slug])
+            if category_slug
+            else []
+        ),
+    )
+    sticky_posts, _, _ = sticky
+    featured_posts = sticky_posts[:3] if sticky_posts else None
     upcoming_category_ids = []
 
     for upcoming_category_id in upcoming_categories:
         upcoming_category_ids.append(upcoming_category_id["id"])
 
-    upcoming_events, _, _ = helpers.get_formatted_expanded_posts(
-        per_page=3, category_ids=upcoming_category_ids
-    )
-
-    if category_slug:
-        categories = api.get_categories(slugs=[category_slug])
-
-        if categories:
-            category = categories[0]
-
-    posts, total_posts, total_pages = helpers.get_formatted_expanded_posts(
-        per_page=posts_per_page,
-        category_ids=[category["id"]] if category else [],
-        page=page,
-        sticky=False,
+    if categories:
+        category = categories[0]
+
+    upcoming, listing = helpers.run_concurrently(
+        lambda: helpers.get_formatted_expanded_posts(
+            per_page=3, category_ids=upcoming_category_ids
+        ),
+        lambda: helpers.get_formatted_expanded_posts(
+            per_page=posts_per_page,
+            category_ids=[category["id"]] if category else [],
+            page=page,
+            sticky=False,
+        ),
     )
+    upcoming_events, _, _ = upcoming
+    posts, total_posts, total_pages = listing
 
     # Manipulate the posts to add a newsletter placeholder
     if page == 1:
@@ -195,7 +345,7 @@ def search():
     total_posts = None
 
     if query:
-        posts, total_posts, total_pages = helpers.get_formatted_posts(
+        posts, total_posts, total_pages = helpers.search_posts(
             query=query, page=page
         )
 
@@ -211,7 +361,7 @@ def search():
 
 @app.route("/press-centre")
 def press_centre():
-    group = api.get_groups(slugs=["canonical-announcements"])[0]
+    group = taxonomy.groups.get(slugs=["canonical-announcements"])[0]
 
     posts, total_posts, total_pages = helpers.get_formatted_expanded_posts(
         group_ids=[group["id"]]
@@ -319,29 +469,49 @@ def archives():
             before = after + relativedelta(years=1)
             friendly_date = after.strftime("%Y")
 
-    if group_slug:
-        groups = api.get_groups(slugs=[group_slug])
-
-        if groups:
-            group = groups[0]
-
-    if category_slug:
-        categories = api.get_categories(slugs=[category_slug])
-        category_ids = [category["id"] for category in categories]
-    else:
-        categories = []
-        category_ids = []
-
-    posts, total_posts, total_pages = helpers.get_formatted_posts(
-        page=page,
-        after=after,
-        before=before,
-        group_ids=[group["id"]] if group else [],
-        category_ids=category_ids if category_ids else [],
+    groups, categories = helpers.run_concurrently(
+        lambda: taxonomy.groups.get(slugs=[group_slug]) if group_slug else [],
+        lambda: (
+            taxonomy.categories.get(slugs=[category_slug])
+            if category_slug
+            else []
+        ),
     )
+    category_ids = [category["id"] for category in categories]
+
+    if groups:
+        group = groups[0]
+
+    archive_years = None
+
+    if archive_index.index.loaded_at and len(category_ids) < 2:
+        # List and count posts from the archive index, so that only
+        # the posts shown are requested, and empty months aren't
+        group_id = group["id"] if group else None
+        category_id = category_ids[0] if category_ids else None
+        post_ids, total_posts, total_pages = archive_index.index.find(
+            year=year,
+            month=month,
+            group_id=group_id,
+            category_id=category_id,
+            page=page,
+        )
+        posts = helpers.get_formatted_posts_by_id(post_ids)
+        archive_years = archive_index.index.calendar(
+            group_id=group_id, category_id=category_id
+        )
+    else:
+        posts, total_posts, total_pages = helpers.get_formatted_posts(
+            page=page,
+            after=after,
+            before=before,
+            group_ids=[group["id"]] if group else [],
+            category_ids=category_ids if category_ids else [],
+        )
 
     return flask.render_template(
         "archives.html",
+        archive_years=archive_years,
         categories=categories,
         category_ids=category_ids,
         category_slug=category_slug if category_slug else None,
@@ -359,44 +529,35 @@ def archives():
 @app.route("/<slug>/feed")
 @app.route("/feed")
 def feed(type=None, slug=None):  # noqa
-    feed_url = "".join([INSIGHTS_ADMIN_URL, flask.request.full_path])
-    feed_text = feeds.cached_request(feed_url).text
+    feed_url = "".join([api.INSIGHTS_ADMIN_URL, flask.request.full_path])
+    upstream, filtered_feed = feed_filter.get_filtered_feed(feed_url)
 
-    feed_text = feed_text.replace(
-        "admin.insights.ubuntu.com", "insights.ubuntu.com"
-    )
-
-    feed = xmltodict.parse(feed_text)
-
-    if (
-        "rss" in feed
-        and "channel" in feed["rss"]
-        and "item" in feed["rss"]["channel"]
+    if werkzeug.http.is_resource_modified(
+        flask.request.environ,
+        etag=filtered_feed.etag,
+        last_modified=filtered_feed.last_modified,
     ):
-        indexes_to_delete = []
-        for index, item in enumerate(feed["rss"]["channel"]["item"]):
-            if "category" in item:
-                for category in item["category"]:
-                    if "lang:cn" in category or "lang:jp" in category:
-                        indexes_to_delete.append(index)
+        chunks = feed_filter.filtered_chunks(upstream, filtered_feed)
 
-        # the original dict will change in size
-        # so whenever we remove an item we need to decrease
-        # all following index accesses by 1
-        for index, index_to_delete_at in enumerate(indexes_to_delete):
+        # Filter the start of the feed before responding, so that if
+        # it isn't a valid feed we return an error, not a truncated response
+        first_chunk = next(chunks, b"")
 
-            temp = dict(feed)
-            del temp["rss"]["channel"]["item"][index_to_delete_at - index]
-            feed = temp
+        response = flask.Response(
+            itertools.chain([first_chunk], chunks), mimetype="text/xml"
+        )
+    else:
+        response = flask.Response(status=304)
 
-    feed = xmltodict.unparse(feed, pretty=True)
+    response.set_etag(filtered_feed.etag)
+    response.last_modified = filtered_feed.last_modified
 
-    return flask.Response(feed, mimetype="text/xml")
+    return response
 
 
 @app.route("/author/<slug>")
 def user(slug):
-    authors = api.get_users(slugs=[slug])
+    authors = taxonomy.users.get(slugs=[slug])
     page = helpers.to_int(flask.request.args.get("page"), default=1)
 
     if not authors:
@@ -443,16 +604,27 @@ def post(slug, year=None, month=None, day=None):
         )
 
     post = posts[0]
-
-    topics = api.get_topics(post_id=post["id"])
+    related_post_ids = related_index.index.get(post["id"])
+
+    topics, tags, related_posts = helpers.run_concurrently(
+        lambda: api.get_topics(post_id=post["id"]),
+        # In order of name, as the API lists a post's tags
+        lambda: sorted(
+            taxonomy.tags.get(ids=post["tags"]),
+            key=lambda tag: tag["name"].lower(),
+        ),
+        lambda: helpers.get_formatted_posts_by_id(related_post_ids or []),
+    )
 
     if topics:
         post["topic"] = topics[0]
 
-    tags = api.get_tags(post_id=post["id"])
-    related_posts, total_posts, total_pages = helpers.get_formatted_posts(
-        tag_ids=[tag["id"] for tag in tags], per_page=3, exclude=post["id"]
-    )
+    if related_post_ids is None:
+        # Not in the related posts index, so the newest posts sharing
+        # any of its tags
+        related_posts, total_posts, total_pages = helpers.get_formatted_posts(
+            tag_ids=[tag["id"] for tag in tags], per_page=3, exclude=post["id"]
+        )
 
     # Even though we're filtering tags below, we need to know the snapcraft.io
     # tag, specifically to add the canonical meta tag
@@ -478,19 +650,24 @@ def upcoming():
     page = helpers.to_int(flask.request.args.get("page"), default=1)
     posts_per_page = 12
 
-    upcoming_categories = api.get_categories(slugs=["events", "webinars"])
+    upcoming_categories = taxonomy.categories.get(slugs=["events", "webinars"])
     upcoming_category_ids = []
 
     for upcoming_category_id in upcoming_categories:
         upcoming_category_ids.append(upcoming_category_id["id"])
 
-    upcoming_events, _, _ = helpers.get_formatted_expanded_posts(
-        per_page=3, category_ids=upcoming_category_ids
-    )
-
-    posts, total_posts, total_pages = helpers.get_formatted_expanded_posts(
-        per_page=posts_per_page, category_ids=upcoming_category_ids, page=page
+    upcoming, listing = helpers.run_concurrently(
+        lambda: helpers.get_formatted_expanded_posts(
+            per_page=3, category_ids=upcoming_category_ids
+        ),
+        lambda: helpers.get_formatted_expanded_posts(
+            per_page=posts_per_page,
+            category_ids=upcoming_category_ids,
+            page=page,
+        ),
     )
+    upcoming_events, _, _ = upcoming
+    posts, total_posts, total_pages = listing
 
     return flask.render_template(
         "upcoming.html",
@@ -514,3 +691,7 @@ def page_deleted(e):
 @app.errorhandler(500)
 def server_error(e):
     return flask.render_template("500.html"), 500
+
+
+# Once every route is defined
+prewarm.start(app)
@@ -0,0 +1,372 @@
+"""
+An index of every post by the year and month it was published,
+overall, by group and by category, kept in each worker process,
+so that /archives can list posts, count them and show which months
+have any without asking WordPress.
+
+The index is loaded in full on startup, and then kept up to date with
+only the posts modified since the last update. With the post mirror,
+it's updated whenever the mirror is, before the mirror purges the pages
+showing the changed posts, so they're rendered again with them.
+Otherwise, it asks the API for them, and purges those pages itself.
+"""
+
+# Core
+import bisect
+import itertools
+import logging
+import math
+import os
+import threading
+import time
+
+# Local
+import api
+import page_cache
+import post_mirror
+
+
+# Archive index settings
+# ===
+# Seconds between checks for posts modified since the last one
+# (0 turns the index off, so /archives uses the API)
+ARCHIVE_INDEX_REFRESH_INTERVAL = int(
+    os.getenv("ARCHIVE_INDEX_REFRESH_INTERVAL", 300)
+)
+
+# Deleted posts are never listed as modified,
+# so once a day the whole index is rebuilt
+FULL_RELOAD_INTERVAL = 24 * 60 * 60
+
+# Only the fields the index needs are requested from the API
+POST_FIELDS = ["id", "date", "modified", "group", "categories", "tags"]
+
+# The index of all posts, rather than those in a group or category
+ALL_POSTS = ("all", None)
+
+
+class ArchiveIndex:
+    """
+    For all posts, and for each group and category, the posts
+    published in each month, sorted by date.
+    """
+
+    def __init__(self):
+        self.loaded_at = None
+        self.modified_after = None
+
+        # Post ID -> date, group IDs and category IDs
+        self._posts = {}
+
+        # ("all", None), ("group", ID) or ("category", ID)
+        # -> (year, month) -> sorted (date, post ID) pairs
+        self._months = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._posts)
+
+    def add(self, post):
+        """
+        Add or replace a post, given its ID, date, groups, categories
+        and tags. Posts with language tags aren't listed on the blog,
+        so they're removed instead.
+        """
+
+        with self._lock:
+            self._remove(post["id"])
+
+            if post.get("modified"):
+                self.modified_after = max(
+                    self.modified_after or "", post["modified"]
+                )
+
+            if set(post.get("tags") or []) & set(api.LANGUAGE_TAG_IDS):
+                return
+
+            group_ids = tuple(post.get("group") or [])
+            category_ids = tuple(post.get("categories") or [])
+            self._posts[post["id"]] = (post["date"], group_ids, category_ids)
+
+            for scope in self._scopes(group_ids, category_ids):
+                bisect.insort(
+                    self._months.setdefault(scope, {}).setdefault(
+                        _month(post["date"]), []
+                    ),
+                    (post["date"], post["id"]),
+                )
+
+    def remove(self, post_id):
+        with self._lock:
+            self._remove(post_id)
+
+    def _remove(self, post_id):
+        if post_id not in self._posts:
+            return
+
+        date, group_ids, category_ids = self._posts.pop(post_id)
+
+        for scope in self._scopes(group_ids, category_ids):
+            months = self._months[scope]
+            dates = months[_month(date)]
+            del dates[bisect.bisect_left(dates, (date, post_id))]
+
+            if not dates:
+                del months[_month(date)]
+
+            if not months:
+                del self._months[scope]
+
+    def _scopes(self, group_ids, category_ids):
+        return (
+            [ALL_POSTS]
+            + [("group", group_id) for group_id in group_ids]
+            + [("category", category_id) for category_id in category_ids]
+        )
+
+    def _dates(self, year=None, month=None, group_id=None, category_id=None):
+        """
+        The lists of (date, post ID) pairs for each month in a year,
+        a month or every month, newest first, and a filter for
+        posts in the group as well as the category, if both are given
+        """
+
+        if category_id:
+            scope = ("category", category_id)
+        elif group_id:
+            scope = ("group", group_id)
+        else:
+            scope = ALL_POSTS
+
+        months = self._months.get(scope, {})
+
+        if year and month:
+            keys = [(year, month)]
+        elif year:
+            keys = [(year, number) for number in range(12, 0, -1)]
+        else:
+            keys = sorted(months, reverse=True)
+
+        def in_group(post_id):
+            return group_id in self._posts[post_id][1]
+
+        return (
+            [months[key] for key in keys if key in months],
+            in_group if category_id and group_id else None,
+        )
+
+    def find(
+        self,
+        year=None,
+        month=None,
+        group_id=None,
+        category_id=None,
+        page=1,
+        per_page=12,
+    ):
+        """
+        The IDs of a page of posts published in a year, a month or
+        ever, in a group and category or not, newest first, with the
+        number of posts and pages, as api.get_posts returns posts
+        """
+
+        with self._lock:
+            month_dates, in_group = self._dates(
+                year, month, group_id, category_id
+            )
+            post_ids = (
+                post_id
+                for dates in month_dates
+                for date, post_id in reversed(dates)
+            )
+            start = (page - 1) * per_page
+
+            if in_group:
+                post_ids = list(filter(in_group, post_ids))
+                total_posts = len(post_ids)
+                page_ids = post_ids[start:start + per_page]
+            else:
+                total_posts = sum(len(dates) for dates in month_dates)
+                page_ids = list(
+                    itertools.islice(post_ids, start, start + per_page)
+                )
+
+        total_pages = int(math.ceil(total_posts / per_page))
+
+        if page > 1 and page > total_pages:
+            # Like the API, for a page past the last one
+            return [], None, None
+
+        return page_ids, total_posts, total_pages
+
+    def calendar(self, group_id=None, category_id=None):
+        """
+        The years with posts, newest first, in a group and category
+        or not, each with its number of posts and a list of
+        its months with posts, with their number of posts
+        """
+
+        with self._lock:
+            month_dates, in_group = self._dates(
+                group_id=group_id, category_id=category_id
+            )
+            counts = []
+
+            for dates in month_dates:
+                count = len(dates)
+
+                if in_group:
+                    count = sum(
+                        1 for date, post_id in dates if in_group(post_id)
+                    )
+
+                counts.append((_month(dates[0][0]), count))
+
+        years = []
+
+        for year, year_counts in itertools.groupby(
+            counts, key=lambda item: item[0][0]
+        ):
+            # Months in order, as the calendar shows them
+            months = [
+                (year_month[1], count)
+                for year_month, count in reversed(list(year_counts))
+                if count
+            ]
+
+            if months:
+                years.append(
+                    (year, sum(count for month, count in months), months)
+                )
+
+        return years
+
+
+def _month(date):
+    """
+    The year and month of an ISO date, e.g. (2018, 1)
+    """
+
+    return int(date[:4]), int(date[5:7])
+
+
+index = ArchiveIndex()
+
+
+def fetch_posts(modified_after=None):
+    """
+    Every post (or those modified after an ISO date), from the post
+    mirror if it's turned on, or otherwise from the API with only
+    the fields the index needs
+    """
+
+    if post_mirror.POST_MIRROR_REFRESH_INTERVAL:
+        # Rather than fetching every post twice when the worker starts
+        post_mirror.loaded.wait()
+
+        return post_mirror.mirror.modified_since(modified_after)
+
+    return api.get_modified_posts(
+        modified_after, {"_fields": ",".join(POST_FIELDS)}
+    )
+
+
+def load():
+    """
+    Build a new index of every post, then replace the current one
+    """
+
+    global index
+
+    new_index = ArchiveIndex()
+
+    for post in fetch_posts():
+        new_index.add(post)
+
+    new_index.loaded_at = time.time()
+    index = new_index
+
+
+def refresh():
+    """
+    Add posts modified since the last load or refresh to the index,
+    then purge the pages listing them, or listing posts by their
+    terms (before or after they changed), which could have been
+    rendered again since they changed, without them
+    """
+
+    posts = list(fetch_posts(modified_after=index.modified_after))
+
+    if not posts:
+        return
+
+    group_ids = set()
+    category_ids = set()
+
+    for post in posts:
+        date, previous_groups, previous_categories = index._posts.get(
+            post["id"], (None, (), ())
+        )
+        group_ids.update(previous_groups, post.get("group") or [])
+        category_ids.update(previous_categories, post.get("categories") or [])
+        index.add(post)
+
+    page_cache.purge(
+        posts=[post["id"] for post in posts],
+        groups=group_ids,
+        categories=category_ids,
+        tags=set(
+            tag_id for post in posts for tag_id in post.get("tags") or []
+        ),
+    )
+
+
+def _mirror_refreshed(posts, removed_ids):
+    """
+    Update the index with the changes from a refresh of the post mirror,
+    before the mirror purges the pages showing them
+    """
+
+    for post_id in removed_ids:
+        index.remove(post_id)
+
+    for post in posts:
+        index.add(post)
+
+
+def start_background_refresh(interval=ARCHIVE_INDEX_REFRESH_INTERVAL):
+    """
+    Load the index in a background thread, then refresh it
+    every `interval` seconds, and reload it every day
+    """
+
+    if not interval:
+        return
+
+    if post_mirror.POST_MIRROR_REFRESH_INTERVAL:
+        post_mirror.listeners.append(_mirror_refreshed)
+
+    logger = logging.getLogger(__name__)
+
+    def refresh_forever():
+        while True:
+            try:
+                if (
+                    not index.loaded_at
+                    or time.time() - index.loaded_at > FULL_RELOAD_INTERVAL
+                ):
+                    load()
+                else:
+                    refresh()
+            except Exception as refresh_error:
+                logger.warning(
+                    "Failed to update the archive index: {}".format(
+                        str(refresh_error)
+                    )
+                )
+
+            time.sleep(interval)
+
+    threading.Thread(
+        target=refresh_forever, name="archive-index-refresh", daemon=True
+    ).start()
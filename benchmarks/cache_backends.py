@@ -0,0 +1,138 @@
+"""
+Compare the "memory" and shared "sqlite" cache backends for
+feeds.cached_session.
+
+Each backend is exercised by a group of worker processes (like gunicorn's
+sync workers) which all warm up at the same time by requesting every
+URL in tests.tests.working_uris, in their own random order,
+against a local stub WordPress API.
+
+Usage:
+
+    python3 -m benchmarks.cache_backends [--workers 8] [--latency 0.02]
+"""
+
+# Core
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+# Local
+from benchmarks.utils import milliseconds, percentile, quiet_logging
+from tests.stub_wordpress import StubWordPress
+
+
+def _warm_up_sweep(environment, seed, results):
+    """
+    Run in a fresh worker process: import the app with the given
+    environment and request every working URI once
+    """
+
+    os.environ.update(environment)
+    quiet_logging()
+
+    import app
+    import feeds
+    from tests.tests import working_uris
+
+    uris = list(working_uris)
+    random.Random(seed).shuffle(uris)
+    client = app.app.test_client()
+    timings = []
+
+    for uri in uris:
+        start = time.perf_counter()
+        client.get(uri)
+        timings.append(time.perf_counter() - start)
+
+    results.put({"timings": timings, "cache_stats": dict(feeds.cache_stats)})
+
+
+def run(backend, wordpress, workers):
+    cache_path = os.path.join(tempfile.mkdtemp(), "hour-cache")
+    environment = {
+        "INSIGHTS_ADMIN_URL": wordpress.url,
+        "CACHE_BACKEND": backend,
+        "CACHE_PATH": cache_path,
+    }
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    processes = [
+        context.Process(
+            target=_warm_up_sweep, args=(environment, seed, results)
+        )
+        for seed in range(workers)
+    ]
+
+    wordpress.reset()
+
+    for process in processes:
+        process.start()
+
+    sweeps = [results.get() for process in processes]
+
+    for process in processes:
+        process.join()
+
+    timings = [timing for sweep in sweeps for timing in sweep["timings"]]
+    hits = sum(sweep["cache_stats"].get("hits", 0) for sweep in sweeps)
+    misses = sum(sweep["cache_stats"].get("misses", 0) for sweep in sweeps)
+
+    return {
+        "backend": backend,
+        "workers": workers,
+        "upstream_requests": wordpress.request_count,
+        "cache_hits": hits,
+        "cache_misses": misses,
+        "p50_ms": milliseconds(percentile(timings, 50)),
+        "p95_ms": milliseconds(percentile(timings, 95)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.02,
+        help="Seconds the stub WordPress API takes to answer each request",
+    )
+    parser.add_argument("--json", action="store_true")
+    arguments = parser.parse_args()
+
+    with StubWordPress(latency=arguments.latency) as wordpress:
+        reports = [
+            run(backend, wordpress, arguments.workers)
+            for backend in ["memory", "sqlite"]
+        ]
+
+    if arguments.json:
+        print(json.dumps(reports, indent=2))
+        return
+
+    print(
+        "{:<8} {:>8} {:>10} {:>8} {:>8} {:>9} {:>9}".format(
+            "backend",
+            "workers",
+            "upstream",
+            "hits",
+            "misses",
+            "p50 ms",
+            "p95 ms",
+        )
+    )
+    for report in reports:
+        print(
+            "{backend:<8} {workers:>8} {upstream_requests:>10} "
+            "{cache_hits:>8} {cache_misses:>8} {p50_ms:>9} "
+            "{p95_ms:>9}".format(**report)
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Count the TLS handshakes (new connections) needed for 1,000 upstream
+requests made in bursts from several threads at once, with requests' default
+connection pool size and with pools sized by feeds.upstream_adapter,
+against a local stub WordPress API served over HTTPS in its own process.
+
+Needs the openssl command, to make a self-signed certificate.
+
+Usage:
+
+    python3 -m benchmarks.connection_pooling [--requests 1000]
+"""
+
+# Core
+import argparse
+import json
+import multiprocessing
+import os
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+
+# Third-party
+import requests
+from requests.adapters import HTTPAdapter
+
+# Local
+import feeds
+from tests.stub_wordpress import StubWordPress
+
+
+def make_certificate(directory):
+    certificate = os.path.join(directory, "certificate.pem")
+    key = os.path.join(directory, "key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes"]
+        + ["-keyout", key, "-out", certificate, "-days", "1"]
+        + ["-subj", "/CN=127.0.0.1", "-addext", "subjectAltName=IP:127.0.0.1"],
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+    return certificate, key
+
+
+def _serve_wordpress(certificate, key, latency, urls, stop):
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(certificate, key)
+
+    with StubWordPress(latency=latency, ssl_context=context) as wordpress:
+        urls.put(wordpress.url)
+        stop.wait()
+
+
+def measure(wordpress_url, certificate, adapter, threads, request_count):
+    """
+    Make the requests in bursts of `threads` at once,
+    as a page fans out its API calls, until `request_count` are done
+    """
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+
+    def request(index):
+        session.get(
+            "{}/wp-json/wp/v2/tags?slug=tag-{}".format(wordpress_url, index),
+            verify=certificate,
+            timeout=10,
+        )
+
+    start = time.perf_counter()
+
+    for burst_start in range(0, request_count, threads):
+        burst = [
+            threading.Thread(target=request, args=(index,))
+            for index in range(
+                burst_start, min(burst_start + threads, request_count)
+            )
+        ]
+
+        for thread in burst:
+            thread.start()
+
+        for thread in burst:
+            thread.join()
+
+    elapsed = time.perf_counter() - start
+    pools = adapter.poolmanager.pools
+    handshakes = sum(pools[key].num_connections for key in pools.keys())
+    session.close()
+
+    return {
+        "handshakes_per_1000": round(handshakes / request_count * 1000, 1),
+        "requests_per_second": round(request_count / elapsed, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--threads", type=int, nargs="+", default=[8, 32])
+    parser.add_argument("--latency", type=float, default=0.01)
+    parser.add_argument("--json", action="store_true")
+    arguments = parser.parse_args()
+
+    pools = {
+        "requests default (10)": lambda threads: HTTPAdapter(),
+        "sized to threads": lambda threads: feeds.upstream_adapter(
+            pool_maxsize=threads
+        ),
+    }
+    reports = {}
+
+    with tempfile.TemporaryDirectory() as directory:
+        certificate, key = make_certificate(directory)
+        context = multiprocessing.get_context("spawn")
+        urls = context.Queue()
+        stop = context.Event()
+        wordpress = context.Process(
+            target=_serve_wordpress,
+            args=(certificate, key, arguments.latency, urls, stop),
+        )
+        wordpress.start()
+        wordpress_url = urls.get()
+
+        try:
+            for name, make_adapter in pools.items():
+                reports[name] = {
+                    threads: measure(
+                        wordpress_url,
+                        certificate,
+                        make_adapter(threads),
+                        threads,
+                        arguments.requests,
+                    )
+                    for threads in arguments.threads
+                }
+        finally:
+            stop.set()
+            wordpress.join()
+
+    if arguments.json:
+        print(json.dumps(reports, indent=2))
+        return
+
+    print(
+        "{:<22} {:>8} {:>20} {:>8}".format(
+            "pool", "threads", "handshakes / 1000", "req/s"
+        )
+    )
+    for name, report in reports.items():
+        for threads, result in report.items():
+            print(
+                "{:<22} {:>8} {handshakes_per_1000:>20} "
+                "{requests_per_second:>8}".format(name, threads, **result)
+            )
+
+
+if __name__ == "__main__":
+    main()
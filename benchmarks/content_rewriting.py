@@ -0,0 +1,108 @@
+"""
+Compare the old regular expressions for rewriting images in post content
+with content.rewrite_images, over a corpus of post bodies of realistic
+sizes, plus some long single-line bodies (as the WordPress editor
+sometimes produces) with many images.
+
+Reports the time per post and the peak memory allocated while
+rewriting one post, as traced by tracemalloc.
+
+Usage:
+
+    python3 -m benchmarks.content_rewriting [--posts 200] [--repeat 5]
+"""
+
+# Core
+import argparse
+import json
+import time
+import tracemalloc
+
+# Local
+import content
+from benchmarks.utils import percentile
+from tests.stub_wordpress import generate_corpus
+from tests.test_content import legacy_rewrite_images
+
+
+def build_corpus(post_count):
+    bodies = [
+        post["content"]["rendered"]
+        for post in generate_corpus(post_count=post_count)
+    ]
+
+    # Every tenth post as one long line
+    for index in range(0, len(bodies), 10):
+        bodies.append(bodies[index].replace("\n", " "))
+
+    return bodies
+
+
+def measure(rewrite, bodies, repeat):
+    timings = []
+
+    for body in bodies:
+        start = time.perf_counter()
+
+        for iteration in range(repeat):
+            rewrite(body)
+
+        timings.append((time.perf_counter() - start) / repeat)
+
+    peaks = []
+
+    for body in bodies:
+        tracemalloc.start()
+        rewrite(body)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    return {
+        "mean_us": round(sum(timings) / len(timings) * 1e6, 1),
+        "p95_us": round(percentile(timings, 95) * 1e6, 1),
+        "max_us": round(max(timings) * 1e6, 1),
+        "mean_peak_kib": round(sum(peaks) / len(peaks) / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--posts", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", action="store_true")
+    arguments = parser.parse_args()
+
+    bodies = build_corpus(arguments.posts)
+    sizes = [len(body) for body in bodies]
+    reports = {
+        "regular expressions": measure(
+            legacy_rewrite_images, bodies, arguments.repeat
+        ),
+        "content.rewrite_images": measure(
+            content.rewrite_images, bodies, arguments.repeat
+        ),
+    }
+
+    if arguments.json:
+        print(json.dumps(reports, indent=2))
+        return
+
+    print(
+        "{} post bodies, {} to {} characters".format(
+            len(bodies), min(sizes), max(sizes)
+        )
+    )
+    print(
+        "{:<24} {:>10} {:>10} {:>10} {:>12}".format(
+            "", "mean µs", "p95 µs", "max µs", "peak KiB"
+        )
+    )
+    for name, report in reports.items():
+        print(
+            "{:<24} {mean_us:>10} {p95_us:>10} {max_us:>10} "
+            "{mean_peak_kib:>12}".format(name, **report)
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Measure cold-cache render latency of the views which fan out their API
+calls with helpers.run_concurrently, with the calls made one after
+another (FETCH_THREADS=1) and concurrently (FETCH_THREADS=8).
+
+Every render starts with an empty cache, against a local stub WordPress
+API which takes --latency seconds to answer each request.
+
+Usage:
+
+    python3 -m benchmarks.fan_out [--latency 0.05] [--repeat 5]
+"""
+
+# Core
+import argparse
+import json
+import multiprocessing
+import os
+import time
+
+# Local
+from benchmarks.utils import milliseconds, percentile, quiet_logging
+from tests.stub_wordpress import StubWordPress
+
+
+ROUTES = [
+    "/",
+    "/upcoming",
+    "/cloud-and-server?category=case-studies",
+    "/archives?group=cloud-and-server&category=articles",
+    "/2018/01/24/meltdown-spectre-and-ubuntu-what-you-need-to-know",
+]
+
+
+def _render_cold(environment, repeat, results):
+    """
+    Run in a fresh worker process: render each route `repeat` times,
+    clearing the cache before each render
+    """
+
+    os.environ.update(environment)
+    quiet_logging()
+
+    import app
+    import feeds
+
+    client = app.app.test_client()
+    report = {}
+
+    for route in ROUTES:
+        timings = []
+        upstream_calls = []
+
+        for iteration in range(repeat):
+            feeds.cached_session.cache.clear()
+            misses = feeds.cache_stats["misses"]
+            start = time.perf_counter()
+            client.get(route)
+            timings.append(time.perf_counter() - start)
+            upstream_calls.append(feeds.cache_stats["misses"] - misses)
+
+        report[route] = {
+            "upstream_calls": max(upstream_calls),
+            "p50_ms": milliseconds(percentile(timings, 50)),
+            "p95_ms": milliseconds(percentile(timings, 95)),
+        }
+
+    results.put(report)
+
+
+def run(fetch_threads, wordpress, repeat):
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    environment = {
+        "INSIGHTS_ADMIN_URL": wordpress.url,
+        "FETCH_THREADS": str(fetch_threads),
+    }
+    process = context.Process(
+        target=_render_cold, args=(environment, repeat, results)
+    )
+    process.start()
+    report = results.get()
+    process.join()
+
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", action="store_true")
+    arguments = parser.parse_args()
+
+    with StubWordPress(latency=arguments.latency) as wordpress:
+        reports = {
+            "sequential": run(1, wordpress, arguments.repeat),
+            "concurrent": run(8, wordpress, arguments.repeat),
+        }
+
+    if arguments.json:
+        print(json.dumps(reports, indent=2))
+        return
+
+    print(
+        "{:<52} {:>6} {:>15} {:>15}".format(
+            "route", "calls", "sequential p50", "concurrent p50"
+        )
+    )
+    for route in ROUTES:
+        print(
+            "{:<52} {:>6} {:>12} ms {:>12} ms".format(
+                route[:52],
+                reports["sequential"][route]["upstream_calls"],
+                reports["sequential"][route]["p50_ms"],
+                reports["concurrent"][route]["p50_ms"],
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""
+Compare the old way of filtering RSS feeds in app.feed (xmltodict)
+with feed_filter.filter_feed, on a synthetic feed of --items items.
+
+Each runs in a fresh worker process, which reports the time to the first
+byte of output, the total time, and how much its peak resident memory
+grew while filtering.
+
+The old way needs xmltodict, which the app itself no longer uses.
+
+Usage:
+
+    python3 -m benchmarks.feed_filtering [--items 5000]
+"""
+
+# Core
+import argparse
+import io
+import json
+import multiprocessing
+import random
+import resource
+import time
+
+# Local
+import feed_filter
+from benchmarks.utils import milliseconds
+
+
+def build_feed(item_count, seed=1):
+    generator = random.Random(seed)
+    words = ["ubuntu", "snap", "kubernetes", "maas", "juju", "openstack"]
+    items = []
+
+    for index in range(item_count):
+        categories = generator.sample(
+            ["security", "cloud", "desktop", "iot", "lang:cn", "lang:jp"]
+            + ["news"] * 10,
+            3,
+        )
+        paragraphs = "".join(
+            "<p>{}</p>".format(" ".join(generator.choices(words, k=60)))
+            for paragraph in range(4)
+        )
+        items.append(
+            "<item><title>Post {index}</title>"
+            "<link>https://admin.insights.ubuntu.com/post-{index}/</link>"
+            "<dc:creator><![CDATA[Canonical]]></dc:creator>"
+            "<pubDate>Wed, 24 Jan 2018 10:00:00 +0000</pubDate>"
+            "{categories}"
+            '<guid isPermaLink="false">'
+            "https://admin.insights.ubuntu.com/?p={index}</guid>"
+            "<description><![CDATA[{summary}]]></description>"
+            "<content:encoded><![CDATA[{content}]]></content:encoded>"
+            "</item>\n".format(
+                index=index,
+                categories="".join(
+                    "<category><![CDATA[{}]]></category>".format(category)
+                    for category in categories
+                ),
+                summary=paragraphs[:300],
+                content=paragraphs,
+            )
+        )
+
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<rss version="2.0" '
+        'xmlns:content="http://purl.org/rss/1.0/modules/content/" '
+        'xmlns:dc="http://purl.org/dc/elements/1.1/">\n'
+        "<channel><title>Ubuntu Insights</title>\n"
+        + "".join(items)
+        + "</channel></rss>\n"
+    ).encode("utf-8")
+
+
+def legacy_filter_feed(chunks):
+    """
+    The filtering app.feed used to do
+    """
+
+    import xmltodict
+
+    feed_text = b"".join(chunks).decode("utf-8")
+    feed_text = feed_text.replace(
+        "admin.insights.ubuntu.com", "insights.ubuntu.com"
+    )
+
+    feed = xmltodict.parse(feed_text)
+
+    if (
+        "rss" in feed
+        and "channel" in feed["rss"]
+        and "item" in feed["rss"]["channel"]
+    ):
+        indexes_to_delete = []
+        for index, item in enumerate(feed["rss"]["channel"]["item"]):
+            if "category" in item:
+                for category in item["category"]:
+                    if "lang:cn" in category or "lang:jp" in category:
+                        indexes_to_delete.append(index)
+
+        for index, index_to_delete_at in enumerate(indexes_to_delete):
+            temp = dict(feed)
+            del temp["rss"]["channel"]["item"][index_to_delete_at - index]
+            feed = temp
+
+    yield xmltodict.unparse(feed, pretty=True).encode("utf-8")
+
+
+def _peak_rss_kib():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _measure(name, item_count, results):
+    """
+    Run in a fresh worker process: filter the feed, as a client
+    reading the response would, without holding on to the output
+    """
+
+    filter_function = {
+        "xmltodict": legacy_filter_feed,
+        "streaming": feed_filter.filter_feed,
+    }[name]
+
+    feed = build_feed(item_count)
+    stream = io.BytesIO(feed)
+    chunks = list(iter(lambda: stream.read(feed_filter.CHUNK_SIZE), b""))
+    baseline = _peak_rss_kib()
+
+    start = time.perf_counter()
+    first_byte = None
+    output_bytes = 0
+
+    for output in filter_function(chunks):
+        if first_byte is None:
+            first_byte = time.perf_counter() - start
+
+        output_bytes += len(output)
+
+    results.put(
+        {
+            "feed_kib": len(feed) // 1024,
+            "output_kib": output_bytes // 1024,
+            "first_byte_ms": milliseconds(first_byte),
+            "total_ms": milliseconds(time.perf_counter() - start),
+            "peak_rss_growth_kib": _peak_rss_kib() - baseline,
+        }
+    )
+
+
+def run(name, item_count):
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(
+        target=_measure, args=(name, item_count, results)
+    )
+    process.start()
+    report = results.get()
+    process.join()
+
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--items", type=int, default=5000)
+    parser.add_argument("--json", action="store_true")
+    arguments = parser.parse_args()
+
+    reports = {
+        name: run(name, arguments.items) for name in ["xmltodict", "streaming"]
+    }
+
+    if arguments.json:
+        print(json.dumps(reports, indent=2))
+        return
+
+    print(
+        "{} items, {} KiB".format(
+            arguments.items, reports["streaming"]["feed_kib"]
+        )
+    )
+    print(
+        "{:<12} {:>15} {:>12} {:>20}".format(
+            "", "first byte ms", "total ms", "peak RSS growth KiB"
+        )
+    )
+    for name, report in reports.items():
+        print(
+            "{:<12} {first_byte_ms:>15} {total_ms:>12} "
+            "{peak_rss_growth_kib:>20}".format(name, **report)
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""
+Load test the app under gunicorn, served the usual way (sync workers)
+and in async upstream mode (threaded workers sharing one event loop
+per process for upstream requests, with ASYNC_UPSTREAM=true),
+against a local stub WordPress API in its own process.
+
+For each number of concurrent clients, reports requests per second
+and latency percentiles. The page cache is off, and the upstream cache
+expires immediately, so every page waits on the stub.
+
+Needs gunicorn installed.
+
+Usage:
+
+    python3 -m benchmarks.load_test [--clients 50 200 500] [--duration 10]
+"""
+
+# Core
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import time
+
+# Third-party
+import aiohttp
+
+# Local
+from benchmarks.utils import milliseconds, percentile
+from tests.stub_wordpress import StubWordPress
+
+
+MODES = {
+    "sync": {
+        "arguments": ["--worker-class", "sync", "--workers", "8"],
+        "environment": {"ASYNC_UPSTREAM": "false"},
+    },
+    "async": {
+        "arguments": [
+            "--worker-class",
+            "gthread",
+            "--workers",
+            "8",
+            "--threads",
+            "64",
+        ],
+        "environment": {"ASYNC_UPSTREAM": "true"},
+    },
+}
+
+ROUTES = ["/tag/security?page={}", "/archives?page={}", "/?page={}"]
+
+
+def _serve_wordpress(latency, urls, stop):
+    with StubWordPress(latency=latency) as wordpress:
+        urls.put(wordpress.url)
+        stop.wait()
+
+
+def _free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+
+        return probe.getsockname()[1]
+
+
+def start_app(mode, wordpress_url):
+    port = _free_port()
+    environment = dict(
+        os.environ,
+        INSIGHTS_ADMIN_URL=wordpress_url,
+        PAGE_CACHE_MAX_BYTES="0",
+        CACHE_SOFT_TTL="0",
+        TAXONOMY_REFRESH_INTERVAL="0",
+        **MODES[mode]["environment"]
+    )
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "app:app"]
+        + ["--bind", "127.0.0.1:{}".format(port), "--log-level", "error"]
+        + MODES[mode]["arguments"],
+        env=environment,
+    )
+
+    for attempt in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            break
+        except OSError:
+            time.sleep(0.1)
+
+    app_url = "http://127.0.0.1:{}".format(port)
+
+    # Let every worker start up and import the app before measuring
+    asyncio.run(generate_load(app_url, clients=32, duration=3))
+
+    return process, app_url
+
+
+async def generate_load(app_url, clients, duration):
+    timings = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def client(session, index):
+        nonlocal errors
+        request_number = 0
+
+        while time.perf_counter() < deadline:
+            route = ROUTES[(index + request_number) % len(ROUTES)]
+            page = (index + request_number) % 10 + 1
+            request_number += 1
+            start = time.perf_counter()
+
+            try:
+                async with session.get(
+                    app_url + route.format(page)
+                ) as response:
+                    await response.read()
+
+                    if response.status != 200:
+                        errors += 1
+                        continue
+            except aiohttp.ClientError:
+                errors += 1
+                continue
+
+            timings.append(time.perf_counter() - start)
+
+    async with aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=0),
+        timeout=aiohttp.ClientTimeout(total=60),
+    ) as session:
+        started = time.perf_counter()
+        await asyncio.gather(
+            *[client(session, index) for index in range(clients)]
+        )
+        elapsed = time.perf_counter() - started
+
+    return {
+        "requests_per_second": round(len(timings) / elapsed, 1),
+        "p50_ms": milliseconds(percentile(timings, 50)),
+        "p99_ms": milliseconds(percentile(timings, 99)),
+        "errors": errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument(
+        "--clients", type=int, nargs="+", default=[50, 200, 500]
+    )
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--json", action="store_true")
+    arguments = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    urls = context.Queue()
+    stop = context.Event()
+    wordpress = context.Process(
+        target=_serve_wordpress, args=(arguments.latency, urls, stop)
+    )
+    wordpress.start()
+    wordpress_url = urls.get()
+    reports = {}
+
+    try:
+        for mode in MODES:
+            process, app_url = start_app(mode, wordpress_url)
+
+            try:
+                reports[mode] = {
+                    clients: asyncio.run(
+                        generate_load(app_url, clients, arguments.duration)
+                    )
+                    for clients in arguments.clients
+                }
+            finally:
+                process.terminate()
+                process.wait()
+    finally:
+        stop.set()
+        wordpress.join()
+
+    if arguments.json:
+        print(json.dumps(reports, indent=2))
+        return
+
+    print(
+        "{:<6} {:>8} {:>8} {:>10} {:>10} {:>7}".format(
+            "mode", "clients", "req/s", "p50 ms", "p99 ms", "errors"
+        )
+    )
+    for mode, report in reports.items():
+        for clients, result in report.items():
+            print(
+                "{:<6} {:>8} {requests_per_second:>8} {p50_ms:>10} "
+                "{p99_ms:>10} {errors:>7}".format(mode, clients, **result)
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Measure the memory each post takes in a worker process, as the
+dictionaries parsed from the API's JSON and as compact
+post_records.PostRecord objects, and the JSON the API sends for each
+post, with every field or only those the blog uses (RESTRICT_POST_FIELDS).
+
+Posts are generated by the stub WordPress, or loaded from --fixtures
+recorded from the real API with benchmarks.record_fixtures.
+
+Usage:
+
+    python3 -m benchmarks.post_records [--posts 2000]
+    python3 -m benchmarks.post_records --fixtures fixtures.json
+"""
+
+# Core
+import argparse
+import json
+import tracemalloc
+
+# Local
+import post_records
+from tests.stub_wordpress import generate_corpus, load_fixtures
+
+
+def restrict_fields(post):
+    """
+    A post as the API returns it with RESTRICT_POST_FIELDS
+    """
+
+    restricted = {
+        key: post[key] for key in post_records.API_FIELDS if key in post
+    }
+    restricted["_links"] = post.get("_links", {})
+    restricted["_embedded"] = {
+        key: value
+        for key, value in post.get("_embedded", {}).items()
+        if key in ["author", "wp:featuredmedia"]
+    }
+
+    return restricted
+
+
+def traced_bytes(build):
+    """
+    The memory still allocated by what `build` returns
+    """
+
+    tracemalloc.start()
+    result = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    return result, size
+
+
+def measure(response_json, post_count):
+    def parse():
+        return json.loads(response_json)
+
+    def parse_records():
+        return [
+            post_records.PostRecord.from_api(post)
+            for post in json.loads(response_json)
+        ]
+
+    dicts, dict_bytes = traced_bytes(parse)
+    del dicts
+    records, record_bytes = traced_bytes(parse_records)
+    del records
+
+    return {
+        "json_bytes": round(len(response_json) / post_count),
+        "dict_bytes": round(dict_bytes / post_count),
+        "record_bytes": round(record_bytes / post_count),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--posts", type=int, default=2000)
+    parser.add_argument("--fixtures", help="Recorded API responses")
+    parser.add_argument("--json", action="store_true")
+    arguments = parser.parse_args()
+
+    if arguments.fixtures:
+        posts = load_fixtures(arguments.fixtures)["posts"]
+    else:
+        posts = generate_corpus(arguments.posts)
+
+    report = {
+        "posts": len(posts),
+        "fixtures": arguments.fixtures,
+        "every_field": measure(json.dumps(posts), len(posts)),
+        "restricted_fields": measure(
+            json.dumps([restrict_fields(post) for post in posts]), len(posts)
+        ),
+    }
+
+    if arguments.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print("Bytes per post, for {} posts".format(report["posts"]))
+    print(
+        "{:<20} {:>12} {:>12} {:>12}".format(
+            "API request", "JSON", "dicts", "records"
+        )
+    )
+
+    for name in ["every_field", "restricted_fields"]:
+        print(
+            "{:<20} {:>12} {:>12} {:>12}".format(
+                name.replace("_", " "),
+                report[name]["json_bytes"],
+                report[name]["dict_bytes"],
+                report[name]["record_bytes"],
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
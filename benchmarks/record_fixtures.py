@@ -0,0 +1,84 @@
+"""
+Record posts, taxonomies and users from a WordPress API into a JSON
+file, which StubWordPress(fixtures=...) then serves offline, so that
+benchmarks can run against real content.
+
+Needs network access to the API.
+
+Usage:
+
+    python3 -m benchmarks.record_fixtures fixtures.json [--posts 500]
+"""
+
+# Core
+import argparse
+import json
+
+# Third-party
+import requests
+
+
+TERM_ENDPOINTS = ["categories", "tags", "group", "topic", "users"]
+
+
+def fetch_all(session, url, parameters={}, limit=None):
+    """
+    Page through an API endpoint, returning up to `limit` items
+    """
+
+    items = []
+    page = 1
+
+    while True:
+        response = session.get(
+            url, params=dict(parameters, per_page=100, page=page), timeout=30
+        )
+        response.raise_for_status()
+        items.extend(response.json())
+        total_pages = int(response.headers.get("X-WP-TotalPages", 1))
+
+        if page >= total_pages or (limit and len(items) >= limit):
+            break
+
+        page += 1
+
+    return items[:limit] if limit else items
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("output")
+    parser.add_argument(
+        "--url",
+        default="https://admin.insights.ubuntu.com/wp-json/wp/v2",
+        help="The root of the WordPress API",
+    )
+    parser.add_argument("--posts", type=int, default=500)
+    arguments = parser.parse_args()
+
+    session = requests.Session()
+    fixtures = {
+        "posts": fetch_all(
+            session,
+            arguments.url + "/posts",
+            {"_embed": "true"},
+            limit=arguments.posts,
+        )
+    }
+
+    for endpoint in TERM_ENDPOINTS:
+        fixtures[endpoint] = fetch_all(session, arguments.url + "/" + endpoint)
+
+    with open(arguments.output, "w") as output:
+        json.dump(fixtures, output)
+
+    print(
+        ", ".join(
+            "{} {}".format(len(items), name)
+            for name, items in fixtures.items()
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
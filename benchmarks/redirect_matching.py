@@ -0,0 +1,158 @@
+"""
+Compare finding a redirect by trying every rule's regex in turn
+with redirects.RedirectMatcher, for --rules synthetic rules
+like those in redirects.yaml.
+
+Reports the time to look up one path, for paths which match an entirely
+literal rule, paths which match a regex rule and paths (like most
+requests) which match no rule.
+
+Usage:
+
+    python3 -m benchmarks.redirect_matching [--rules 10000]
+"""
+
+# Core
+import argparse
+import json
+import random
+import re
+import time
+
+# Local
+import redirects
+from benchmarks.utils import percentile
+
+
+def build_rules(rule_count, seed=1):
+    """
+    A mix of moved posts, with and without a trailing slash,
+    and archive pages with parameters
+    """
+
+    generator = random.Random(seed)
+    patterns = []
+
+    for index in range(rule_count):
+        kind = generator.random()
+
+        if kind < 0.4:
+            patterns.append("/old-post-{}".format(index))
+        elif kind < 0.9:
+            patterns.append(
+                "/{}/moved-post-{}/?".format(2010 + index % 9, index)
+            )
+        else:
+            patterns.append(
+                "/section-{}/(?P<slug>[^/]+)/page/(?P<page>[0-9]+)/?".format(
+                    index
+                )
+            )
+
+    return [
+        (re.compile(pattern), "/new{}".format(index))
+        for index, pattern in enumerate(patterns)
+    ]
+
+
+def build_paths(rules, seed=1):
+    generator = random.Random(seed)
+    literal = [
+        regex.pattern for regex, target in rules if "?" not in regex.pattern
+    ]
+    optional_slash = [
+        regex.pattern[:-1] for regex, target in rules if "?" in regex.pattern
+    ]
+
+    return {
+        "literal": generator.sample(literal, 200),
+        "regex": [
+            path.replace("(?P<slug>[^/]+)", "a-post").replace(
+                "(?P<page>[0-9]+)", "2"
+            )
+            for path in generator.sample(optional_slash, 200)
+        ],
+        "no match": [
+            "/2018/01/24/post-{}".format(index) for index in range(200)
+        ],
+    }
+
+
+def linear_match(rules, path):
+    for regex, target in rules:
+        result = regex.fullmatch(path)
+
+        if result:
+            return result, target
+
+
+def measure(match, paths, repeat):
+    timings = []
+
+    for path in paths:
+        start = time.perf_counter()
+
+        for iteration in range(repeat):
+            match(path)
+
+        timings.append((time.perf_counter() - start) / repeat)
+
+    return {
+        "mean_us": round(sum(timings) / len(timings) * 1e6, 2),
+        "p95_us": round(percentile(timings, 95) * 1e6, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--rules", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", action="store_true")
+    arguments = parser.parse_args()
+
+    rules = build_rules(arguments.rules)
+
+    start = time.perf_counter()
+    matcher = redirects.RedirectMatcher(rules)
+    build_ms = round((time.perf_counter() - start) * 1000, 1)
+
+    reports = {}
+
+    for kind, paths in build_paths(rules).items():
+        reports[kind] = {
+            "linear": measure(
+                lambda path: linear_match(rules, path),
+                paths,
+                arguments.repeat,
+            ),
+            "matcher": measure(matcher.match, paths, arguments.repeat),
+        }
+
+    if arguments.json:
+        print(json.dumps({"build_ms": build_ms, "paths": reports}, indent=2))
+        return
+
+    print("{} rules, matcher built in {} ms".format(arguments.rules, build_ms))
+    print(
+        "{:<10} {:>16} {:>16} {:>16} {:>16}".format(
+            "path",
+            "linear mean µs",
+            "linear p95 µs",
+            "matcher mean µs",
+            "matcher p95 µs",
+        )
+    )
+    for kind, report in reports.items():
+        print(
+            "{:<10} {:>16} {:>16} {:>16} {:>16}".format(
+                kind,
+                report["linear"]["mean_us"],
+                report["linear"]["p95_us"],
+                report["matcher"]["mean_us"],
+                report["matcher"]["p95_us"],
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Measure related_index.RelatedIndex on a synthetic set of --posts posts
+with --tags tags (some far more popular than others, as in real blogs)
+and --categories categories: the time to build it, the memory it takes,
+the time to update it when one post changes, and to look posts up.
+
+Usage:
+
+    python3 -m benchmarks.related [--posts 20000] [--tags 5000]
+"""
+
+# Core
+import argparse
+import itertools
+import json
+import random
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+# Local
+import related_index
+from benchmarks.utils import milliseconds, percentile
+
+
+def build_posts(post_count, tag_count, category_count, seed=1):
+    """
+    Posts with 1-8 tags, drawn from a Zipf-like distribution,
+    and 1-2 categories, newest first
+    """
+
+    generator = random.Random(seed)
+    tag_weights = list(
+        itertools.accumulate(1 / (rank + 1) for rank in range(tag_count))
+    )
+    newest = datetime(2019, 6, 1)
+    posts = []
+
+    for index in range(post_count):
+        date = (newest - timedelta(hours=index * 6)).isoformat()
+        posts.append(
+            {
+                "id": post_count - index,
+                "date": date,
+                "modified": date,
+                "tags": sorted(
+                    set(
+                        generator.choices(
+                            range(1, tag_count + 1),
+                            cum_weights=tag_weights,
+                            k=generator.randint(1, 8),
+                        )
+                    )
+                ),
+                "categories": generator.sample(
+                    range(1, category_count + 1), generator.randint(1, 2)
+                ),
+            }
+        )
+
+    return posts
+
+
+def build_index(posts):
+    index = related_index.RelatedIndex()
+    index.update(posts)
+
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--posts", type=int, default=20000)
+    parser.add_argument("--tags", type=int, default=5000)
+    parser.add_argument("--categories", type=int, default=20)
+    parser.add_argument("--json", action="store_true")
+    arguments = parser.parse_args()
+
+    posts = build_posts(arguments.posts, arguments.tags, arguments.categories)
+
+    start = time.perf_counter()
+    index = build_index(posts)
+    build_seconds = time.perf_counter() - start
+
+    tracemalloc.start()
+    traced_index = build_index(posts)
+    index_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del traced_index
+
+    # Edit some posts, as if they were modified in WordPress
+    generator = random.Random(2)
+    update_timings = []
+
+    for post in generator.sample(posts, 20):
+        post = dict(post, tags=post["tags"] + [arguments.tags + 1])
+        start = time.perf_counter()
+        index.update([post])
+        update_timings.append(time.perf_counter() - start)
+
+    lookup_timings = []
+
+    for post in generator.sample(posts, 1000):
+        start = time.perf_counter()
+        index.get(post["id"])
+        lookup_timings.append(time.perf_counter() - start)
+
+    report = {
+        "posts": arguments.posts,
+        "tags": arguments.tags,
+        "categories": arguments.categories,
+        "build_s": round(build_seconds, 2),
+        "index_mib": round(index_bytes / 1024 / 1024, 1),
+        "update_p50_ms": milliseconds(percentile(update_timings, 50)),
+        "update_p95_ms": milliseconds(percentile(update_timings, 95)),
+        "lookup_p50_ms": milliseconds(percentile(lookup_timings, 50)),
+    }
+
+    if arguments.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(
+        "{posts} posts, {tags} tags, {categories} categories: "
+        "built in {build_s} s, taking {index_mib} MiB\n"
+        "Updating one post: {update_p50_ms} ms p50, {update_p95_ms} ms p95\n"
+        "Looking up a post's related posts: {lookup_p50_ms} ms".format(
+            **report
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,352 @@
+"""
+Measure every view in app.py against a local stub WordPress API,
+in a fresh worker process, and write a machine-readable report
+which can be compared with one from another commit.
+
+For each route it reports:
+- cold: render time and upstream requests with every cache empty
+- warm: render time with the upstream cache full but no page cache
+- cached: time to serve the page from the page cache
+
+It also reports the worker process's startup time and memory.
+With --post-mirror, the post mirror, search index and archive index
+are loaded before measuring, so listings are answered without the API.
+The stub serves a generated corpus, or --fixtures recorded from
+the real API with benchmarks.record_fixtures.
+
+Usage:
+
+    python3 -m benchmarks.routes [--output report.json]
+    python3 -m benchmarks.routes --compare before.json
+    python3 -m benchmarks.routes --post-mirror --compare before.json
+"""
+
+# Core
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from urllib.parse import urlsplit
+
+# Local
+from benchmarks.utils import milliseconds, percentile, quiet_logging
+from tests.stub_wordpress import StubWordPress
+
+
+def build_routes(wordpress):
+    """
+    An example URL for each view in app.py,
+    using a post, author and tag which exist in the stub
+    """
+
+    post_path = urlsplit(wordpress.posts[0]["link"]).path.rstrip("/")
+    author = wordpress.terms["users"][0]["slug"]
+    tag = wordpress.terms["tags"][0]["slug"]
+
+    return {
+        "homepage": "/",
+        "homepage page 2": "/?page=2",
+        "search": "/search?q=ubuntu",
+        "press_centre": "/press-centre",
+        "cloud_and_server": "/cloud-and-server",
+        "internet_of_things": "/internet-of-things",
+        "desktop": "/desktop",
+        "tag": "/tag/" + tag,
+        "design": "/topics/design",
+        "juju": "/topics/juju",
+        "maas": "/topics/maas",
+        "snappy": "/topics/snappy",
+        "robotics": "/topics/robotics",
+        "archives": "/archives",
+        "archives by month": "/archives?year=2018&month=1",
+        "archives, no posts": "/archives?year=2099",
+        "feed": "/feed",
+        "user": "/author/" + author,
+        "post": post_path,
+        "upcoming": "/upcoming",
+    }
+
+
+def _rss_mib():
+    """
+    This process's current resident memory, if /proc is available
+    """
+
+    try:
+        with open("/proc/self/statm") as statm:
+            pages = int(statm.read().split()[1])
+    except OSError:
+        return None
+
+    return round(pages * resource.getpagesize() / 1024 / 1024, 1)
+
+
+def _measure_routes(environment, routes, repeat, use_post_mirror, results):
+    """
+    Run in a fresh worker process: import the app,
+    load the taxonomy index (and post mirror), then measure each route
+    """
+
+    os.environ.update(environment)
+    quiet_logging()
+
+    # Keep anything the app prints out of the JSON report
+    sys.stdout = sys.stderr
+
+    start = time.perf_counter()
+
+    import app
+    import feed_filter
+    import feeds
+    import helpers
+    import page_cache
+    import taxonomy
+
+    taxonomy.load_all()
+
+    if use_post_mirror:
+        import archive_index
+        import post_mirror
+        import related_index
+        import search_index
+
+        post_mirror.load()
+        search_index.load()
+        archive_index.load()
+        related_index.load()
+
+    startup = time.perf_counter() - start
+    rss_after_startup = _rss_mib()
+    client = app.app.test_client()
+    page_cache_size = page_cache.cache.max_bytes
+
+    def upstream_requests():
+        return sum(feeds.upstream_stats.requests.values())
+
+    def render(url):
+        start = time.perf_counter()
+        response = client.get(url)
+        response.get_data()
+
+        return response, time.perf_counter() - start
+
+    def clear_caches():
+        feeds.cached_session.cache.clear()
+        helpers.formatted_posts.clear()
+        feed_filter.filtered_feeds.clear()
+        page_cache.cache = page_cache.PageCache(
+            max_bytes=page_cache_size, ttl=page_cache.PAGE_CACHE_TTL
+        )
+
+    report = {}
+
+    for name, url in routes.items():
+        cold = []
+
+        for iteration in range(repeat):
+            clear_caches()
+            requests_before = upstream_requests()
+            response, duration = render(url)
+            cold.append(duration)
+            cold_upstream_requests = upstream_requests() - requests_before
+
+        page_cache.cache.max_bytes = 0
+        requests_before = upstream_requests()
+        warm = [render(url)[1] for iteration in range(repeat)]
+        warm_upstream_requests = upstream_requests() - requests_before
+
+        page_cache.cache.max_bytes = page_cache_size
+        render(url)
+        cached = [render(url)[1] for iteration in range(repeat)]
+
+        report[name] = {
+            "url": url,
+            "status": response.status_code,
+            "bytes": len(response.get_data()),
+            "cold_p50_ms": milliseconds(percentile(cold, 50)),
+            "cold_p95_ms": milliseconds(percentile(cold, 95)),
+            "cold_upstream_requests": cold_upstream_requests,
+            "warm_p50_ms": milliseconds(percentile(warm, 50)),
+            "warm_p95_ms": milliseconds(percentile(warm, 95)),
+            "warm_upstream_requests": warm_upstream_requests,
+            "cached_p50_ms": milliseconds(percentile(cached, 50)),
+        }
+
+    results.put(
+        {
+            "worker": {
+                "startup_ms": milliseconds(startup),
+                "rss_after_startup_mib": rss_after_startup,
+                "rss_after_routes_mib": _rss_mib(),
+                # ru_maxrss is in KiB on Linux
+                "peak_rss_mib": round(
+                    resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                    1,
+                ),
+            },
+            "routes": report,
+        }
+    )
+
+
+def _commit():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    return commit + ("-dirty" if dirty else "")
+
+
+def run(arguments):
+    with StubWordPress(
+        latency=arguments.latency, fixtures=arguments.fixtures
+    ) as wordpress:
+        routes = build_routes(wordpress)
+        context = multiprocessing.get_context("spawn")
+        results = context.Queue()
+        environment = {
+            "INSIGHTS_ADMIN_URL": wordpress.url,
+            "TAXONOMY_REFRESH_INTERVAL": "0",
+            "PREWARM_ENABLED": "false",
+            "UPSTREAM_WARM_CONNECTIONS": "0",
+            "SEARCH_INDEX_REFRESH_INTERVAL": "0",
+            "ARCHIVE_INDEX_REFRESH_INTERVAL": "0",
+            "RELATED_INDEX_REFRESH_INTERVAL": "0",
+            # Loaded once by the worker instead, with --post-mirror
+            "POST_MIRROR_REFRESH_INTERVAL": "0",
+        }
+        process = context.Process(
+            target=_measure_routes,
+            args=(
+                environment,
+                routes,
+                arguments.repeat,
+                arguments.post_mirror,
+                results,
+            ),
+        )
+        process.start()
+        measurements = results.get()
+        process.join()
+
+    return dict(
+        commit=_commit(),
+        python=platform.python_version(),
+        latency=arguments.latency,
+        repeat=arguments.repeat,
+        post_mirror=arguments.post_mirror,
+        fixtures=arguments.fixtures,
+        **measurements
+    )
+
+
+def _change(before, after):
+    if before is None or after is None:
+        return ""
+
+    if not before:
+        return "{:+}".format(after - before)
+
+    return "{:+.0f}%".format((after - before) / before * 100)
+
+
+def print_report(report, baseline=None):
+    worker = report["worker"]
+    print(
+        "Commit {}: startup {} ms, {} MiB after startup, "
+        "{} MiB after all routes, {} MiB peak".format(
+            report["commit"],
+            worker["startup_ms"],
+            worker["rss_after_startup_mib"],
+            worker["rss_after_routes_mib"],
+            worker["peak_rss_mib"],
+        )
+    )
+
+    if baseline:
+        print("Compared with commit {}".format(baseline["commit"]))
+
+    columns = [
+        ("cold_p50_ms", "cold p50 ms"),
+        ("cold_upstream_requests", "cold calls"),
+        ("warm_p50_ms", "warm p50 ms"),
+        ("cached_p50_ms", "cached ms"),
+    ]
+    print(
+        "{:<20} {:>6}".format("route", "status")
+        + "".join(" {:>12}".format(title) for key, title in columns)
+        + (
+            "".join(" {:>12}".format("Δ " + title) for key, title in columns)
+            if baseline
+            else ""
+        )
+    )
+
+    for name, result in report["routes"].items():
+        line = "{:<20} {:>6}".format(name[:20], result["status"]) + "".join(
+            " {:>12}".format(result[key]) for key, title in columns
+        )
+
+        if baseline:
+            before = baseline["routes"].get(name, {})
+            line += "".join(
+                " {:>12}".format(_change(before.get(key), result[key]))
+                for key, title in columns
+            )
+
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--fixtures", help="Recorded API responses")
+    parser.add_argument(
+        "--post-mirror",
+        action="store_true",
+        help="Answer listings from the post mirror",
+    )
+    parser.add_argument("--output", help="Write the JSON report here")
+    parser.add_argument("--compare", help="A JSON report to compare with")
+    parser.add_argument("--json", action="store_true")
+    arguments = parser.parse_args()
+
+    report = run(arguments)
+
+    if arguments.output:
+        with open(arguments.output, "w") as output:
+            json.dump(report, output, indent=2)
+
+    if arguments.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    baseline = None
+
+    if arguments.compare:
+        with open(arguments.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+
+    print_report(report, baseline)
+
+
+if __name__ == "__main__":
+    main()
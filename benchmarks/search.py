@@ -0,0 +1,209 @@
+"""
+Measure search_index.SearchIndex on a synthetic corpus of --posts posts:
+the time to build it, the memory it takes, and the time to answer
+queries of common, uncommon and rare words, compared with
+scanning every post for each word, as WordPress's LIKE search does.
+
+Usage:
+
+    python3 -m benchmarks.search [--posts 20000]
+"""
+
+# Core
+import argparse
+import itertools
+import json
+import random
+import sys
+import time
+
+# Local
+import search_index
+from benchmarks.utils import milliseconds, percentile
+
+
+def build_vocabulary(size, seed=1):
+    generator = random.Random(seed)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+
+    return [
+        "".join(generator.choices(letters, k=generator.randint(3, 10)))
+        for index in range(size)
+    ]
+
+
+def build_corpus(post_count, vocabulary, seed=1):
+    """
+    Posts with words drawn from a Zipf-like distribution, as in real text,
+    with 400-1,200 words of content each
+    """
+
+    generator = random.Random(seed)
+    cumulative_weights = list(
+        itertools.accumulate(
+            1 / (rank + 1) for rank in range(len(vocabulary))
+        )
+    )
+
+    def words(count):
+        return " ".join(
+            generator.choices(
+                vocabulary, cum_weights=cumulative_weights, k=count
+            )
+        )
+
+    return [
+        {
+            "id": post_id,
+            "modified": "2018-01-01T00:00:00",
+            "title": {"rendered": words(6)},
+            "excerpt": {"rendered": "<p>{}</p>".format(words(40))},
+            "content": {
+                "rendered": "".join(
+                    "<p>{}</p>\n".format(words(100))
+                    for paragraph in range(generator.randint(4, 12))
+                )
+            },
+            "tags": [],
+        }
+        for post_id in range(1, post_count + 1)
+    ]
+
+
+def build_queries(vocabulary, seed=1):
+    generator = random.Random(seed)
+    common = vocabulary[:50]
+    uncommon = vocabulary[500:5000]
+    rare = vocabulary[-10000:]
+
+    return {
+        "1 common word": [[word] for word in generator.sample(common, 20)],
+        "2 common words": [
+            generator.sample(common, 2) for index in range(20)
+        ],
+        "1 uncommon word": [
+            [word] for word in generator.sample(uncommon, 20)
+        ],
+        "common + rare": [
+            [generator.choice(common), generator.choice(rare)]
+            for index in range(20)
+        ],
+    }
+
+
+def scan(posts, words):
+    """
+    Find posts containing every word anywhere, like a LIKE query
+    """
+
+    return [
+        post["id"]
+        for post in posts
+        if all(
+            word in post["title"]["rendered"]
+            or word in post["excerpt"]["rendered"]
+            or word in post["content"]["rendered"]
+            for word in words
+        )
+    ]
+
+
+def index_size(index):
+    """
+    Roughly how many bytes the index's words, arrays and dictionaries take
+    """
+
+    size = sum(
+        sys.getsizeof(item)
+        for item in [
+            index._postings,
+            index._post_ids,
+            index._lengths,
+            index._numbers,
+        ]
+    )
+
+    for word, (numbers, word_counts) in index._postings.items():
+        size += sys.getsizeof(word) + sys.getsizeof((numbers, word_counts))
+        size += sys.getsizeof(numbers) + sys.getsizeof(word_counts)
+
+    for post_id, number in index._numbers.items():
+        size += sys.getsizeof(post_id) + sys.getsizeof(number)
+
+    return size
+
+
+def measure(search, queries):
+    timings = []
+
+    for words in queries:
+        start = time.perf_counter()
+        search(words)
+        timings.append(time.perf_counter() - start)
+
+    return {
+        "p50_ms": milliseconds(percentile(timings, 50)),
+        "p95_ms": milliseconds(percentile(timings, 95)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--posts", type=int, default=20000)
+    parser.add_argument("--vocabulary", type=int, default=50000)
+    parser.add_argument("--json", action="store_true")
+    arguments = parser.parse_args()
+
+    vocabulary = build_vocabulary(arguments.vocabulary)
+    posts = build_corpus(arguments.posts, vocabulary)
+
+    start = time.perf_counter()
+    index = search_index.SearchIndex()
+
+    for post in posts:
+        index.add(post)
+
+    build_seconds = time.perf_counter() - start
+    index_bytes = index_size(index)
+
+    report = {
+        "posts": arguments.posts,
+        "build_s": round(build_seconds, 2),
+        "index_mib": round(index_bytes / 1024 / 1024, 1),
+        "queries": {},
+    }
+
+    for kind, queries in build_queries(vocabulary).items():
+        report["queries"][kind] = {
+            "index": measure(
+                lambda words: index.search(" ".join(words)), queries
+            ),
+            "scan": measure(lambda words: scan(posts, words), queries[:3]),
+        }
+
+    if arguments.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(
+        "{posts} posts: index built in {build_s} s, "
+        "taking {index_mib} MiB".format(**report)
+    )
+    print(
+        "{:<16} {:>14} {:>14} {:>14}".format(
+            "query", "index p50 ms", "index p95 ms", "scan p50 ms"
+        )
+    )
+    for kind, result in report["queries"].items():
+        print(
+            "{:<16} {:>14} {:>14} {:>14}".format(
+                kind,
+                result["index"]["p50_ms"],
+                result["index"]["p95_ms"],
+                result["scan"]["p50_ms"],
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
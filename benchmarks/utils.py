@@ -0,0 +1,18 @@
+# Core
+import logging
+
+# Local
+from metrics import percentile  # noqa: F401
+
+
+def milliseconds(seconds):
+    return round(seconds * 1000, 2) if seconds is not None else None
+
+
+def quiet_logging():
+    """
+    Talisker warns about every upstream request made outside of a
+    real Flask request context, which drowns out benchmark output
+    """
+
+    logging.getLogger("talisker").setLevel(logging.ERROR)
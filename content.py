@@ -0,0 +1,178 @@
+"""
+Rewriting of post HTML from WordPress.
+
+These functions give exactly the same output as the regular expressions
+format_post used to run, like:
+
+    re.sub(r'img(.*) src="(.[^"]*)"', ..., html)
+
+but without their greedy "img(.*)", which backtracks through the rest
+of every line for each "img" it finds. Instead each line is searched
+with str.find and str.rfind, which is linear in the length of the HTML.
+"""
+
+# Core
+import re
+
+
+CLOUDINARY = "https://res.cloudinary.com/canonical/image/fetch/q_auto,f_auto,"
+CLOUDINARY_SOURCE = 'src="https://res.cloudinary.com/canonical'
+SOURCE = ' src="'
+
+_heading_tag = re.compile(r"h\d>")
+_image_tag = re.compile(r"<img(.[^>]*)?")
+_h_t_or_p = re.compile("[htp]")
+
+
+def _quoted_value(html, start):
+    """
+    Match `(.[^"]*)"` at `start`: the text up to the next quote,
+    which must be at least one character, the first not a newline.
+    Returns the value and the position after the quote.
+    """
+
+    if start >= len(html) or html[start] == "\n":
+        return None
+
+    end = html.find('"', start + 1)
+
+    if end == -1:
+        return None
+
+    return html[start:end], end + 1
+
+
+def _cloudinary_path(html, start):
+    """
+    Match `(.[^http]*)/http(.[^"]*)"` at `start`, i.e. the Cloudinary
+    options, then the original image URL without its leading "http".
+    Returns the URL and the position after its closing quote.
+    """
+
+    if start >= len(html) or html[start] == "\n":
+        return None
+
+    # The options can't contain "h", "t" or "p", so "/http"
+    # must come just before the first of those characters
+    first_h_t_or_p = _h_t_or_p.search(html, start + 1)
+
+    if not first_h_t_or_p:
+        return None
+
+    slash = first_h_t_or_p.start() - 1
+
+    if slash < start + 1 or not html.startswith("/http", slash):
+        return None
+
+    return _quoted_value(html, slash + len("/http"))
+
+
+def _replace_in_image_lines(html, literal, match_value, replace):
+    """
+    The equivalent of re.sub(r"img(.*)" + literal + value, ...),
+    where `match_value(html, position)` matches the value after the literal.
+
+    As in the regular expression, "(.*)" can't cross a newline, and
+    is greedy, so it's the last match of the literal on the line that
+    counts. `replace` is called with the text between "img" and the
+    literal, and the value, to get the replacement for the whole match.
+    """
+
+    output = []
+    position = 0
+
+    while True:
+        image = html.find("img", position)
+
+        if image == -1:
+            break
+
+        line_end = html.find("\n", image)
+
+        if line_end == -1:
+            line_end = len(html)
+
+        candidate = html.rfind(literal, image + 3, line_end)
+        match = None
+
+        while candidate != -1:
+            match = match_value(html, candidate + len(literal))
+
+            if match:
+                break
+
+            candidate = html.rfind(
+                literal, image + 3, candidate + len(literal) - 1
+            )
+
+        if not match:
+            # Nothing after any "img" on this line can match
+            if line_end == len(html):
+                break
+
+            next_line = line_end + 1
+            output.append(html[position:next_line])
+            position = next_line
+            continue
+
+        value, end = match
+        attributes_start = image + len("img")
+        output.append(html[position:image])
+        output.append(replace(html[attributes_start:candidate], value))
+        position = end
+
+    output.append(html[position:])
+
+    return "".join(output)
+
+
+def remove_cloudinary_urls(html):
+    """
+    Take images' original URLs back out of Cloudinary URLs
+    """
+
+    return _replace_in_image_lines(
+        html,
+        CLOUDINARY_SOURCE,
+        _cloudinary_path,
+        lambda attributes, url: 'img{} src="{}"'.format(attributes, url),
+    )
+
+
+def add_cloudinary_srcset(html):
+    """
+    Serve images through Cloudinary, at a choice of sizes
+    """
+
+    def replace(attributes, url):
+        return (
+            'img{attributes} decoding="async" src="{cdn}w_560/{url}"'
+            'srcset="{cdn}w_375/{url} 375w,'
+            '{cdn}w_480/{url} 480w, {cdn}w_560/{url} 560w"'
+            'sizes="(max-width: 375px) 280px,'
+            "(max-width: 480px) 440px,"
+            '560px"'
+        ).format(attributes=attributes, url=url, cdn=CLOUDINARY)
+
+    return _replace_in_image_lines(html, SOURCE, _quoted_value, replace)
+
+
+def rewrite_images(html):
+    """
+    Replace any existing Cloudinary URLs for images in post content
+    with our own, with a srcset
+    """
+
+    return add_cloudinary_srcset(remove_cloudinary_urls(html))
+
+
+def tidy_summary(summary):
+    """
+    Make headings into paragraphs, remove images,
+    and replace "[...]" with "..."
+    """
+
+    summary = _heading_tag.sub("p>", summary)
+    summary = _image_tag.sub("", summary)
+
+    return summary.replace("[&hellip;]", "&hellip;")
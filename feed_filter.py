@@ -0,0 +1,246 @@
+"""
+Filtering of the RSS feeds we proxy from WordPress.
+
+The feed is parsed incrementally with SAX, and written back out as it's
+parsed, so a feed of any size is filtered in one pass, holding at most
+one <item> in memory at a time.
+
+The filtered feeds are then kept, with an ETag and Last-Modified date,
+until the upstream response they came from changes.
+"""
+
+# Core
+import hashlib
+import os
+import xml.sax
+import xml.sax.handler
+from xml.sax.saxutils import escape, quoteattr
+
+# Third-party
+import werkzeug.http
+
+# Local
+import feeds
+import lru
+
+
+ADMIN_HOST = "admin.insights.ubuntu.com"
+PUBLIC_HOST = "insights.ubuntu.com"
+
+# Items in any of these categories aren't shown in our feeds
+EXCLUDED_CATEGORIES = ["lang:cn", "lang:jp"]
+
+# Bytes of the upstream feed to parse at a time
+CHUNK_SIZE = 64 * 1024
+
+# How many filtered feeds each worker process keeps (0 turns it off)
+FILTERED_FEEDS_CACHE_SIZE = int(os.getenv("FILTERED_FEEDS_CACHE_SIZE", 50))
+filtered_feeds = lru.LRUCache(maxsize=FILTERED_FEEDS_CACHE_SIZE)
+
+# Upstream headers which change whenever the cached response is replaced
+UPSTREAM_VERSION_HEADERS = ["Date", "ETag", "Last-Modified", "Content-Length"]
+
+
+class _FeedFilter(xml.sax.handler.ContentHandler):
+    """
+    Write out the feed, without excluded items,
+    with the admin hostname replaced by the public one
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.output = ['<?xml version="1.0" encoding="utf-8"?>\n']
+        self._path = []
+        self._text = []
+        self._item = None
+        self._category = None
+        self._excluded = False
+
+    def take_output(self):
+        """
+        Return and forget the output written so far
+        """
+
+        output = "".join(self.output)
+        self.output = []
+
+        return output
+
+    def _write(self, text):
+        if self._item is not None:
+            self._item.append(text)
+        else:
+            self.output.append(text)
+
+    def _flush_text(self):
+        # The parser can split text, even in the middle of a hostname,
+        # so it's collected up until the next tag
+        if self._text:
+            text = "".join(self._text).replace(ADMIN_HOST, PUBLIC_HOST)
+            self._text = []
+
+            if self._category is not None:
+                self._category.append(text)
+
+            self._write(escape(text))
+
+    def startElement(self, name, attrs):
+        self._flush_text()
+        self._path.append(name)
+
+        if self._path == ["rss", "channel", "item"]:
+            self._item = []
+            self._excluded = False
+        elif self._item is not None and name == "category":
+            self._category = []
+
+        self._write(
+            "<"
+            + name
+            + "".join(
+                " {}={}".format(
+                    key, quoteattr(value.replace(ADMIN_HOST, PUBLIC_HOST))
+                )
+                for key, value in attrs.items()
+            )
+            + ">"
+        )
+
+    def endElement(self, name):
+        self._flush_text()
+        self._write("</{}>".format(name))
+
+        if self._category is not None and name == "category":
+            category = "".join(self._category)
+            self._category = None
+
+            if any(excluded in category for excluded in EXCLUDED_CATEGORIES):
+                self._excluded = True
+
+        if self._path == ["rss", "channel", "item"]:
+            item = self._item
+            self._item = None
+
+            if not self._excluded:
+                self.output.extend(item)
+
+        self._path.pop()
+
+    def characters(self, content):
+        self._text.append(content)
+
+    def ignorableWhitespace(self, whitespace):
+        self._text.append(whitespace)
+
+    def processingInstruction(self, target, data):
+        self._flush_text()
+        self._write(
+            "<?{} {}?>".format(target, data.replace(ADMIN_HOST, PUBLIC_HOST))
+        )
+
+    def endDocument(self):
+        self._flush_text()
+
+
+def filter_feed(chunks):
+    """
+    Filter an RSS feed, given as an iterable of byte strings,
+    yielding the filtered feed as UTF-8 encoded byte strings:
+    - Removing items in any of the EXCLUDED_CATEGORIES
+    - Replacing the admin hostname with the public one
+    """
+
+    handler = _FeedFilter()
+    parser = xml.sax.make_parser()
+    parser.setFeature(xml.sax.handler.feature_external_ges, False)
+    parser.setContentHandler(handler)
+
+    for chunk in chunks:
+        parser.feed(chunk)
+        output = handler.take_output()
+
+        if output:
+            yield output.encode("utf-8")
+
+    parser.close()
+    output = handler.take_output()
+
+    if output:
+        yield output.encode("utf-8")
+
+
+class FilteredFeed:
+    """
+    A filtered copy of one version of an upstream feed,
+    with validators for conditional requests.
+
+    The body is only known once the feed has been filtered in full.
+    """
+
+    def __init__(self, upstream_version, last_modified):
+        self.upstream_version = upstream_version
+        self.etag = hashlib.sha1(upstream_version.encode("utf-8")).hexdigest()
+        self.last_modified = last_modified
+        self.body = None
+
+
+def _upstream_version(upstream):
+    """
+    Identify a version of an upstream response by its headers,
+    or by a hash of its content if it has no Date or ETag
+    """
+
+    values = [upstream.headers.get(name) for name in UPSTREAM_VERSION_HEADERS]
+
+    if not values[0] and not values[1]:
+        return hashlib.sha1(upstream.content).hexdigest()
+
+    return repr(values)
+
+
+def get_filtered_feed(url):
+    """
+    Retrieve an upstream feed with feeds.cached_request,
+    returning the upstream response and a FilteredFeed for it -
+    the cached one, unless the upstream response has changed
+    """
+
+    upstream = feeds.cached_request(url)
+    upstream_version = _upstream_version(upstream)
+    feed = filtered_feeds.get(url)
+
+    if not feed or feed.upstream_version != upstream_version:
+        feed = FilteredFeed(
+            upstream_version,
+            werkzeug.http.parse_date(
+                upstream.headers.get("Last-Modified")
+                or upstream.headers.get("Date")
+            ),
+        )
+        filtered_feeds.set(url, feed)
+
+    return upstream, feed
+
+
+def filtered_chunks(upstream, feed):
+    """
+    Yield the body of a FilteredFeed, from memory if it has been
+    filtered before, otherwise by filtering the upstream response,
+    keeping the result for next time
+    """
+
+    if feed.body is not None:
+        yield feed.body
+        return
+
+    keep = filtered_feeds.maxsize > 0
+    chunks = []
+
+    for chunk in filter_feed(upstream.iter_content(CHUNK_SIZE)):
+        if keep:
+            chunks.append(chunk)
+
+        yield chunk
+
+    if keep:
+        feed.body = b"".join(chunks)
@@ -1,30 +1,282 @@
 # Core
+import asyncio
+import atexit
+import contextvars
+import os
+import threading
 import time
 import datetime
+import weakref
+from collections import Counter
 
 # Third-party
+import aiohttp
 import feedparser
 import logging
+import requests
 import requests_cache
+import talisker.requests
 from requests.packages.urllib3.util.retry import Retry
 from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
 
+# Local
+import metrics
+import tracing
+
+
+# Cache backend settings
+# ===
+# "memory" keeps a private cache in each worker process.
+# "sqlite" stores responses in a file at CACHE_PATH + ".sqlite", so every
+# worker on the same node shares one cache (and warms it only once).
+# Any other backend supported by requests_cache (e.g. "redis") also works.
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_PATH = os.getenv("CACHE_PATH", "/tmp/blog-hour-cache")
+
+# Cache expiry settings, in seconds
+# ===
+# Responses older than CACHE_SOFT_TTL are refreshed from upstream.
+# If CACHE_HARD_TTL is longer than CACHE_SOFT_TTL, responses between the two
+# ages are served stale straight away while being refreshed in the
+# background ("stale-while-revalidate"), instead of making the visitor wait.
+CACHE_SOFT_TTL = datetime.timedelta(
+    seconds=int(os.getenv("CACHE_SOFT_TTL", 3600))
+)
+CACHE_HARD_TTL = max(
+    datetime.timedelta(seconds=int(os.getenv("CACHE_HARD_TTL", 0))),
+    CACHE_SOFT_TTL,
+)
+
+
+def _backend_options(backend):
+    """
+    Extra options to pass to the requests_cache backend
+    """
+
+    if backend == "sqlite":
+        # It's only a cache, so trade durability for much faster writes
+        return {"fast_save": True}
+
+    return {}
+
+
+# Upstream connection settings
+# ===
+# Retry server errors from upstream, both in the cached session
+# and the async client
+RETRY_STATUSES = [500, 502, 503, 504]
+RETRY_TOTAL = 5
+RETRY_BACKOFF_FACTOR = 0.1
+
+# The cached session keeps connections alive to at most
+# UPSTREAM_POOL_CONNECTIONS hosts, and UPSTREAM_POOL_MAXSIZE connections
+# to each. Any more connections needed at once are closed after use,
+# so this should be at least the number of threads making requests.
+UPSTREAM_POOL_CONNECTIONS = int(os.getenv("UPSTREAM_POOL_CONNECTIONS", 10))
+UPSTREAM_POOL_MAXSIZE = int(os.getenv("UPSTREAM_POOL_MAXSIZE", 16))
+
+# How many connections each worker process opens to the API on startup
+UPSTREAM_WARM_CONNECTIONS = int(os.getenv("UPSTREAM_WARM_CONNECTIONS", 4))
+
+# How many of the most recent upstream requests to each endpoint
+# the latency percentiles are worked out from
+UPSTREAM_LATENCY_WINDOW = int(os.getenv("UPSTREAM_LATENCY_WINDOW", 1000))
+
+# Latency and errors of requests actually sent upstream (not served from
+# the cache, so including errors masked by "old_data_on_error"),
+# by endpoint, for this worker process
+upstream_stats = metrics.LatencyStats(window=UPSTREAM_LATENCY_WINDOW)
 
 # Cache session settings
 cached_session = requests_cache.CachedSession(
-    name="hour-cache",
-    expire_after=datetime.timedelta(hours=1),
-    backend="memory",
+    cache_name=CACHE_PATH,
+    expire_after=CACHE_HARD_TTL,
+    backend=CACHE_BACKEND,
     old_data_on_error=True,
+    **_backend_options(CACHE_BACKEND)
 )
-cached_session.mount(
-    "https://",
-    HTTPAdapter(
+
+
+class _MeasuredAdapter(HTTPAdapter):
+    """
+    An HTTPAdapter which records the latency of each request it sends,
+    and whether it failed, in upstream_stats
+    """
+
+    def send(self, request, **kwargs):
+        start = time.perf_counter()
+
+        try:
+            response = super().send(request, **kwargs)
+        except Exception:
+            upstream_stats.record(
+                request.url, time.perf_counter() - start, error=True
+            )
+            raise
+
+        upstream_stats.record(
+            request.url,
+            time.perf_counter() - start,
+            error=response.status_code >= 500,
+        )
+
+        return response
+
+
+def upstream_adapter(
+    pool_connections=UPSTREAM_POOL_CONNECTIONS,
+    pool_maxsize=UPSTREAM_POOL_MAXSIZE,
+):
+    """
+    An HTTPAdapter for upstream requests, which retries server errors,
+    keeps up to `pool_maxsize` connections alive to each of
+    `pool_connections` hosts, and records their latency
+    """
+
+    return _MeasuredAdapter(
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
         max_retries=Retry(
-            total=5, backoff_factor=0.1, status_forcelist=[500, 502, 503, 504]
+            total=RETRY_TOTAL,
+            backoff_factor=RETRY_BACKOFF_FACTOR,
+            status_forcelist=RETRY_STATUSES,
+        ),
+    )
+
+
+cached_session.mount("https://", upstream_adapter())
+cached_session.mount("http://", upstream_adapter())
+
+# Async upstream settings
+# ===
+# With ASYNC_UPSTREAM, cached_request makes all its upstream requests on
+# one event loop per worker process, through a pool of at most
+# ASYNC_UPSTREAM_CONNECTIONS connections, so a threaded worker can have
+# hundreds of requests in flight without a connection for each thread.
+# Cache lookups and saves are made in a thread pool, rather than blocking
+# the event loop, unless CACHE_BACKEND is "memory".
+ASYNC_UPSTREAM = os.getenv("ASYNC_UPSTREAM", "false").lower() == "true"
+ASYNC_UPSTREAM_CONNECTIONS = int(os.getenv("ASYNC_UPSTREAM_CONNECTIONS", 100))
+
+# Cache hit, miss and stale counters for this worker process
+cache_stats = Counter()
+_cache_stats_lock = threading.Lock()
+
+# Lookups currently in progress, by URL
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+# URLs currently being refreshed in the background
+_refreshing_urls = set()
+_refreshing_urls_lock = threading.Lock()
+
+
+def _record(stat):
+    with _cache_stats_lock:
+        cache_stats[stat] += 1
+
+
+def copy_cache_stats():
+    """
+    A copy of cache_stats, taken while no other thread is updating it
+    """
+
+    with _cache_stats_lock:
+        return Counter(cache_stats)
+
+
+def cache_size():
+    """
+    How many responses the cache holds, and roughly how many bytes of
+    content (the size of the file, for the "sqlite" backend), if known
+    """
+
+    responses = cached_session.cache.responses
+    size = {"entries": len(responses), "bytes": None}
+
+    if CACHE_BACKEND == "memory":
+        size["bytes"] = sum(
+            len(getattr(stored, "_content", None) or b"")
+            for stored, saved_at in list(responses.values())
         )
-    ),
-)
+    elif CACHE_BACKEND == "sqlite" and os.path.exists(CACHE_PATH + ".sqlite"):
+        size["bytes"] = os.path.getsize(CACHE_PATH + ".sqlite")
+
+    return size
+
+
+def connection_stats():
+    """
+    How many requests the cached session has made from this process,
+    how many connections it opened for them, and so how many requests
+    reused a connection kept alive from an earlier request
+    """
+
+    requests_made = 0
+    new_connections = 0
+
+    for adapter in set(cached_session.adapters.values()):
+        pools = adapter.poolmanager.pools
+
+        for key in pools.keys():
+            pool = pools.get(key)
+
+            if pool:
+                requests_made += pool.num_requests
+                new_connections += pool.num_connections
+
+    return {
+        "requests": requests_made,
+        "new_connections": new_connections,
+        "reused_connections": max(requests_made - new_connections, 0),
+    }
+
+
+def warm_up_connections(url, count=UPSTREAM_WARM_CONNECTIONS):
+    """
+    Open `count` connections to the host of `url` at once,
+    with HEAD requests, so that they're kept alive in the pool
+    ready for the first pages to be rendered
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def open_connection():
+        try:
+            requests.Session.request(cached_session, "HEAD", url, timeout=3)
+        except Exception as request_error:
+            logger.warning(
+                "Failed to warm up connection to {}: {}".format(
+                    url, str(request_error)
+                )
+            )
+
+    threads = [
+        threading.Thread(target=open_connection) for index in range(count)
+    ]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+
+def start_connection_warm_up(url, count=UPSTREAM_WARM_CONNECTIONS):
+    """
+    Warm up connections to the host of `url` in a background thread
+    """
+
+    if not count:
+        return
+
+    threading.Thread(
+        target=warm_up_connections,
+        args=(url, count),
+        name="connection-warm-up",
+        daemon=True,
+    ).start()
 
 
 def get_rss_feed_content(url, offset=0, limit=6, exclude_items_in=None):
@@ -36,7 +288,6 @@ def get_rss_feed_content(url, offset=0, limit=6, exclude_items_in=None):
     """
 
     logger = logging.getLogger(__name__)
-    end = limit + offset if limit is not None else None
 
     try:
         response = cached_request(url)
@@ -46,6 +297,37 @@ def get_rss_feed_content(url, offset=0, limit=6, exclude_items_in=None):
         )
         return False
 
+    return _feed_entries(url, response, offset, limit, exclude_items_in)
+
+
+async def get_rss_feed_content_async(
+    url, offset=0, limit=6, exclude_items_in=None
+):
+    """
+    The same as get_rss_feed_content, for use in a coroutine
+    """
+
+    logger = logging.getLogger(__name__)
+
+    try:
+        response = await cached_request_async(url)
+    except Exception as request_error:
+        logger.warning(
+            "Attempt to get feed failed: {}".format(str(request_error))
+        )
+        return False
+
+    return _feed_entries(url, response, offset, limit, exclude_items_in)
+
+
+def _feed_entries(url, response, offset, limit, exclude_items_in):
+    """
+    Parse the entries from a feed response for get_rss_feed_content
+    """
+
+    logger = logging.getLogger(__name__)
+    end = limit + offset if limit is not None else None
+
     try:
         feed_data = feedparser.parse(response.text)
         if not feed_data.feed:
@@ -78,10 +360,503 @@ def cached_request(url):
     Retrieve the response from the requests cache.
     If the cache has expired then it will attempt to update the cache.
     If it gets an error, it will use the cached response, if it exists.
+
+    In stale-while-revalidate mode (CACHE_HARD_TTL > CACHE_SOFT_TTL),
+    a response past its soft TTL is returned immediately and refreshed
+    in a background thread.
+
+    Concurrent calls for the same URL share a single lookup.
+
+    With ASYNC_UPSTREAM, the lookup is made as cached_request_async
+    makes it, on this process's upstream event loop.
+
+    Each lookup is added to the request's trace, with REQUEST_TRACING.
+    """
+
+    start = time.perf_counter()
+
+    try:
+        if ASYNC_UPSTREAM:
+            response = run_async(_lookup_async(url))
+        else:
+            response = _single_flight(url, _get_response)
+    except Exception:
+        tracing.record_upstream(url, None, time.perf_counter() - start)
+        raise
+
+    tracing.record_upstream(url, response, time.perf_counter() - start)
+    response.raise_for_status()
+
+    return response
+
+
+class _Flight:
+    """
+    A lookup in progress, which other callers can wait for
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.response = None
+        self.error = None
+
+
+def _single_flight(url, get_response):
+    """
+    Call get_response(url), unless another thread is already doing so for
+    the same URL, in which case wait for it and share its result.
+    This stops a crowd of requests for an expired URL from all hitting
+    the upstream server at once.
+    """
+
+    with _in_flight_lock:
+        flight = _in_flight.get(url)
+        is_leader = flight is None
+
+        if is_leader:
+            flight = _in_flight[url] = _Flight()
+
+    if not is_leader:
+        flight.done.wait()
+        _record("coalesced")
+
+        if flight.error:
+            raise flight.error
+
+        return flight.response
+
+    try:
+        flight.response = get_response(url)
+    except Exception as request_error:
+        flight.error = request_error
+        raise
+    finally:
+        with _in_flight_lock:
+            del _in_flight[url]
+
+        flight.done.set()
+
+    return flight.response
+
+
+def _get_response(url):
+    """
+    Look up a URL through the cache, counting hits and misses
+    """
+
+    if CACHE_HARD_TTL > CACHE_SOFT_TTL:
+        response = _get_stale_while_revalidate(url)
+    else:
+        response = cached_session.get(url, timeout=3)
+
+    if getattr(response, "from_cache", False):
+        _record("hits")
+    else:
+        _record("misses")
+
+    return response
+
+
+def uncached_request(url, timeout=30):
+    """
+    Request a URL with the cached session's connections and retries,
+    but without the cache, for large responses only needed once
+    (e.g. to build an index), which would only crowd out the cache
+    """
+
+    # Sent with requests.Session.send, as CachedSession.send would
+    # look the response up in the cache, and save it there
+    request = cached_session.prepare_request(requests.Request("GET", url))
+    response = requests.Session.send(cached_session, request, timeout=timeout)
+    response.raise_for_status()
+
+    return response
+
+
+def delete_cached(url):
     """
+    Remove any cached response for a URL, so the next request fetches it
+    """
+
+    cached_session.cache.delete(_cache_key(url))
+
+
+def _cache_key(url):
+    request = cached_session.prepare_request(requests.Request("GET", url))
+
+    return cached_session.cache.create_key(request)
+
+
+def _get_stale_while_revalidate(url):
+    """
+    Return the cached response for a URL if it is younger than the hard TTL,
+    starting a background refresh if it is older than the soft TTL.
+    Otherwise, fetch it through the cached session as usual.
+    """
+
+    response, saved_at = cached_session.cache.get_response_and_time(
+        _cache_key(url)
+    )
+
+    if response is not None:
+        age = datetime.datetime.utcnow() - saved_at
+
+        if age <= CACHE_HARD_TTL:
+            if age > CACHE_SOFT_TTL:
+                _record("stale")
+                _refresh_in_background(url)
+
+            response.from_cache = True
+
+            return response
+
+    return cached_session.get(url, timeout=3)
+
+
+def _refresh_in_background(url):
+    """
+    Start a thread to refresh the cached response for a URL,
+    unless one is already running for it in this process
+    """
+
+    with _refreshing_urls_lock:
+        if url in _refreshing_urls:
+            return
+
+        _refreshing_urls.add(url)
+
+    threading.Thread(target=_refresh, args=(url,), daemon=True).start()
+
+
+def _refresh(url):
+    """
+    Fetch a URL from upstream, bypassing the cache lookup,
+    and store the response in the cache if it succeeded.
+    The stale response stays in the cache if anything goes wrong.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    try:
+        request = cached_session.prepare_request(requests.Request("GET", url))
+        response = requests.Session.send(cached_session, request, timeout=3)
+
+        if response.status_code == 200:
+            cached_session.cache.save_response(
+                cached_session.cache.create_key(request), response
+            )
+            _record("refreshes")
+        else:
+            _record("refresh_errors")
+    except Exception as request_error:
+        _record("refresh_errors")
+        logger.warning(
+            "Background refresh of {} failed: {}".format(
+                url, str(request_error)
+            )
+        )
+    finally:
+        with _refreshing_urls_lock:
+            _refreshing_urls.discard(url)
 
-    response = cached_session.get(url, timeout=3)
 
+class _AsyncUpstream:
+    """
+    The HTTP client session and lookups in progress for one event loop
+    """
+
+    def __init__(self):
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=ASYNC_UPSTREAM_CONNECTIONS),
+            timeout=aiohttp.ClientTimeout(total=3),
+        )
+        self.in_flight = {}
+
+
+_async_upstreams = weakref.WeakKeyDictionary()
+
+# The event loop which synchronous callers use in ASYNC_UPSTREAM mode
+_event_loop = None
+_event_loop_lock = threading.Lock()
+
+
+def _async_upstream():
+    loop = asyncio.get_event_loop()
+
+    if loop not in _async_upstreams:
+        _async_upstreams[loop] = _AsyncUpstream()
+
+    return _async_upstreams[loop]
+
+
+async def close_async_upstream():
+    """
+    Close the HTTP client session for the current event loop, if any
+    """
+
+    upstream = _async_upstreams.pop(asyncio.get_event_loop(), None)
+
+    if upstream:
+        await upstream.session.close()
+
+
+def run_async(coroutine):
+    """
+    Run a coroutine on this process's upstream event loop,
+    started in a background thread on first use, and wait for its result.
+
+    It runs in a copy of the caller's context, so that its upstream
+    requests are recorded against the page being rendered, by tracing
+    and by talisker.
+    """
+
+    global _event_loop
+
+    with _event_loop_lock:
+        if _event_loop is None:
+            _event_loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=_event_loop.run_forever,
+                name="upstream-event-loop",
+                daemon=True,
+            ).start()
+            atexit.register(lambda: run_async(close_async_upstream()))
+
+    context = contextvars.copy_context()
+
+    async def run_in_context():
+        return await context.run(asyncio.ensure_future, coroutine)
+
+    return asyncio.run_coroutine_threadsafe(
+        run_in_context(), _event_loop
+    ).result()
+
+
+async def cached_request_async(url):
+    """
+    The same as cached_request, for use in a coroutine:
+    retrieve the response from the requests cache, fetching it with
+    a pooled asynchronous HTTP client if it has expired.
+
+    It shares the cache and the cache_stats with cached_request.
+    """
+
+    start = time.perf_counter()
+
+    try:
+        response = await _lookup_async(url)
+    except Exception:
+        tracing.record_upstream(url, None, time.perf_counter() - start)
+        raise
+
+    tracing.record_upstream(url, response, time.perf_counter() - start)
     response.raise_for_status()
 
     return response
+
+
+async def _lookup_async(url):
+    """
+    Look up a URL with _get_response_async, unless a lookup for it
+    is already in progress on this event loop, in which case share it
+    """
+
+    upstream = _async_upstream()
+    flight = upstream.in_flight.get(url)
+
+    if flight:
+        _record("coalesced")
+        response = await asyncio.shield(flight)
+    else:
+        flight = upstream.in_flight[url] = asyncio.ensure_future(
+            _get_response_async(url)
+        )
+
+        try:
+            response = await flight
+        finally:
+            del upstream.in_flight[url]
+
+    return response
+
+
+async def _get_response_async(url):
+    """
+    Look up a URL in the cache, as cached_session would,
+    fetching it if it's missing or has expired
+    """
+
+    cached_response, saved_at = await _run_cache_call(
+        cached_session.cache.get_response_and_time, _cache_key(url)
+    )
+
+    if cached_response is not None:
+        cached_response.from_cache = True
+        age = datetime.datetime.utcnow() - saved_at
+
+        if age <= CACHE_SOFT_TTL:
+            _record("hits")
+
+            return cached_response
+
+        if age <= CACHE_HARD_TTL and CACHE_HARD_TTL > CACHE_SOFT_TTL:
+            _record("hits")
+            _record("stale")
+            _refresh_in_background_async(url)
+
+            return cached_response
+
+    try:
+        response = await _fetch_async(url)
+    except Exception:
+        # Like the cached session's "old_data_on_error"
+        if cached_response is not None:
+            _record("hits")
+
+            return cached_response
+
+        raise
+
+    if response.status_code != 200 and cached_response is not None:
+        _record("hits")
+
+        return cached_response
+
+    _record("misses")
+
+    return response
+
+
+async def _run_cache_call(function, *args):
+    """
+    Call a method of the cache, in a thread of the event loop's default
+    executor, so that backends which read files or the network don't
+    block every other request in flight. The memory backend can't block,
+    so its methods are called directly.
+    """
+
+    if CACHE_BACKEND == "memory":
+        return function(*args)
+
+    return await asyncio.get_event_loop().run_in_executor(
+        None, function, *args
+    )
+
+
+def _record_with_talisker(request, response=None, error=None):
+    """
+    Record an async upstream request in talisker's metrics and logs,
+    as its response hook does for cached_session's requests, if
+    talisker.requests.configure has been called on cached_session
+    """
+
+    if (
+        talisker.requests.metrics_response_hook
+        in cached_session.hooks["response"]
+    ):
+        talisker.requests.record_request(request, response, error)
+
+
+def _refresh_in_background_async(url):
+    """
+    Start a task to refresh the cached response for a URL,
+    unless one is already running for it in this process
+    """
+
+    with _refreshing_urls_lock:
+        if url in _refreshing_urls:
+            return
+
+        _refreshing_urls.add(url)
+
+    async def refresh():
+        try:
+            await _fetch_async(url)
+            _record("refreshes")
+        except Exception as request_error:
+            _record("refresh_errors")
+            logging.getLogger(__name__).warning(
+                "Background refresh of {} failed: {}".format(
+                    url, str(request_error)
+                )
+            )
+        finally:
+            with _refreshing_urls_lock:
+                _refreshing_urls.discard(url)
+
+    asyncio.ensure_future(refresh())
+
+
+async def _fetch_async(url):
+    """
+    Fetch a URL from upstream with the pooled asynchronous client,
+    retrying server errors, and store a successful response in the cache.
+    Returns a requests.Response, like cached_session.get.
+    """
+
+    request = cached_session.prepare_request(requests.Request("GET", url))
+    start = time.perf_counter()
+
+    try:
+        upstream_response, content = await _send_async(
+            url, dict(request.headers)
+        )
+    except Exception as request_error:
+        upstream_stats.record(url, time.perf_counter() - start, error=True)
+        _record_with_talisker(request, error=request_error)
+        raise
+
+    elapsed = time.perf_counter() - start
+    upstream_stats.record(url, elapsed, error=upstream_response.status >= 500)
+
+    response = requests.Response()
+    response._content = content
+    response._content_consumed = True
+    response.status_code = upstream_response.status
+    response.reason = upstream_response.reason
+    response.headers = CaseInsensitiveDict(upstream_response.headers)
+    response.url = url
+    response.request = request
+    response.elapsed = datetime.timedelta(seconds=elapsed)
+    response.from_cache = False
+    _record_with_talisker(request, response)
+
+    if response.status_code == 200:
+        await _run_cache_call(
+            cached_session.cache.save_response,
+            cached_session.cache.create_key(request),
+            response,
+        )
+
+    return response
+
+
+async def _send_async(url, headers):
+    """
+    Request a URL with the pooled asynchronous client, retrying
+    connection errors and server errors, and return the response
+    with its content
+    """
+
+    session = _async_upstream().session
+
+    for attempt in range(RETRY_TOTAL + 1):
+        if attempt > 1:
+            await asyncio.sleep(RETRY_BACKOFF_FACTOR * 2 ** (attempt - 1))
+
+        try:
+            async with session.get(url, headers=headers) as upstream_response:
+                content = await upstream_response.read()
+        except aiohttp.ClientConnectionError:
+            if attempt == RETRY_TOTAL:
+                raise
+
+            continue
+
+        if (
+            upstream_response.status not in RETRY_STATUSES
+            or attempt == RETRY_TOTAL
+        ):
+            break
+
+    return upstream_response, content
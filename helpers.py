@@ -1,17 +1,80 @@
 # Core
-import re
+import contextvars
+import functools
+import math
+import os
 import textwrap
+import threading
 import warnings
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlencode, urlsplit
 import datetime
 
 # External
 import dateutil.parser
 import calendar
-import werkzeug
+import werkzeug.routing
 
 # Local
 import api
+import content
+import lru
+import search_index
+import taxonomy
+import tracing
+
+
+# Number of threads each worker process uses to make independent
+# API calls at the same time. 1 makes them one after another.
+FETCH_THREADS = int(os.getenv("FETCH_THREADS", 8))
+
+_fetch_thread = threading.local()
+
+# How many formatted posts (and dates) each worker process remembers
+FORMATTED_POSTS_CACHE_SIZE = int(os.getenv("FORMATTED_POSTS_CACHE_SIZE", 2000))
+formatted_posts = lru.LRUCache(maxsize=FORMATTED_POSTS_CACHE_SIZE)
+
+
+def _mark_fetch_thread():
+    _fetch_thread.is_pooled = True
+
+
+_fetch_executor = (
+    ThreadPoolExecutor(
+        max_workers=FETCH_THREADS,
+        thread_name_prefix="fetch",
+        initializer=_mark_fetch_thread,
+    )
+    if FETCH_THREADS > 1
+    else None
+)
+
+
+def run_concurrently(*calls):
+    """
+    Run some independent functions (e.g. API calls) at the same time,
+    and return their results in the same order, e.g.:
+
+        tags, topics = run_concurrently(
+            lambda: api.get_tags(post_id=post_id),
+            lambda: api.get_topics(post_id=post_id),
+        )
+
+    If any of the functions raise an error, it is raised here.
+    Calls made from inside one of the functions are run one after another,
+    so the thread pool can't deadlock waiting on itself.
+    """
+
+    if not _fetch_executor or getattr(_fetch_thread, "is_pooled", False):
+        return [call() for call in calls]
+
+    # Copy the context so Talisker can still track upstream requests
+    futures = [
+        _fetch_executor.submit(contextvars.copy_context().run, call)
+        for call in calls
+    ]
+
+    return [future.result() for future in futures]
 
 
 def get_formatted_posts(**kwargs):
@@ -27,10 +90,52 @@ def get_formatted_posts(**kwargs):
     return posts, total_posts, total_pages
 
 
+def search_posts(query, page=1, per_page=12):
+    """
+    Search for posts, with the local search index once it has loaded,
+    or otherwise the API, returning formatted posts, the number found
+    and the number of pages, as get_formatted_posts does
+    """
+
+    if not search_index.index.loaded_at:
+        return get_formatted_posts(query=query, page=page, per_page=per_page)
+
+    post_ids, total_posts = search_index.index.search(query, page, per_page)
+    total_pages = int(math.ceil(total_posts / per_page))
+
+    if page > 1 and page > total_pages:
+        # Like the API, for a page past the last one
+        return [], None, None
+
+    return get_formatted_posts_by_id(post_ids), total_posts, total_pages
+
+
+def get_formatted_posts_by_id(post_ids):
+    """
+    Get posts by ID, in the same order as the IDs, then format them,
+    skipping any posts which no longer exist
+    """
+
+    if not post_ids:
+        return []
+
+    posts, _, _ = get_formatted_posts(
+        post_ids=post_ids, per_page=len(post_ids)
+    )
+    posts_by_id = {post["id"]: post for post in posts}
+
+    return [
+        posts_by_id[post_id] for post_id in post_ids if post_id in posts_by_id
+    ]
+
+
 def get_formatted_expanded_posts(**kwargs):
     """
     Get posts from API, then format them and add the data for the first group
-    and category
+    and category.
+
+    The groups and categories for all the posts are looked up together,
+    so this makes the same number of API calls however many posts there are.
     """
 
     posts, total_posts, total_pages = api.get_posts(**kwargs)
@@ -43,34 +148,56 @@ def get_formatted_expanded_posts(**kwargs):
     for post in posts:
         post = format_post(post)
 
-        post["group"] = get_first_group(
-            post.get("group", ""), force_group=force_group
-        )
+    group_ids = [force_group or _first(post.get("group")) for post in posts]
+    category_ids = [_first(post["categories"]) for post in posts]
+
+    groups, categories = run_concurrently(
+        lambda: get_groups_by_id(group_ids),
+        lambda: get_categories_by_id(category_ids),
+    )
 
-        post["category"] = get_first_category(post["categories"])
+    for post, group_id, category_id in zip(posts, group_ids, category_ids):
+        post["group"] = groups.get(group_id)
+        post["category"] = categories.get(category_id)
 
     return posts, total_posts, total_pages
 
 
-def get_first_group(group_ids, force_group=None):
+def get_groups_by_id(group_ids):
     """
-    Retrieve the first group from a list of group_ids
+    Retrieve a set of groups from the index, or with one API call,
+    returning a dictionary of groups by ID
     """
 
-    if force_group:
-        group_id = force_group
-    else:
-        group_id = group_ids[0] if group_ids else None
+    group_ids = set(filter(None, group_ids))
 
-    return api.get_group(group_id) if group_id else None
+    if not group_ids:
+        return {}
 
+    return {
+        group["id"]: group for group in taxonomy.groups.get(ids=group_ids)
+    }
 
-def get_first_category(category_ids):
+
+def get_categories_by_id(category_ids):
     """
-    Retrieve the first group from a list of group_ids
+    Retrieve a set of categories from the index, or with one API call,
+    returning a dictionary of categories by ID
     """
 
-    return api.get_category(category_ids[0]) if category_ids else None
+    category_ids = set(filter(None, category_ids))
+
+    if not category_ids:
+        return {}
+
+    return {
+        category["id"]: category
+        for category in taxonomy.categories.get(ids=category_ids)
+    }
+
+
+def _first(items):
+    return items[0] if items else None
 
 
 def format_post(post):
@@ -80,60 +207,67 @@ def format_post(post):
     - Putting the author at post['author']
     - Formatting the data as e.g. 1 January 2017
     - Making the link relative
+    - Serving images in the content through Cloudinary
+
+    The formatted fields are remembered by post ID and modified date,
+    so each version of a post is only formatted once.
     """
 
+    key = (post.get("id"), post.get("modified_gmt"))
+
+    with tracing.timer("format_post"):
+        if None in key:
+            formatted = _format_post_fields(post)
+        else:
+            formatted = formatted_posts.get(key)
+
+            if formatted is None:
+                formatted = _format_post_fields(post)
+                formatted_posts.set(key, formatted)
+
+        post.update(formatted)
+
+    return post
+
+
+def _format_post_fields(post):
+    """
+    Work out the formatted fields for format_post
+    """
+
+    formatted = {}
+
     if "author" in post["_embedded"] and post["_embedded"]["author"]:
-        post["author"] = post["_embedded"]["author"][0]
-        post["author"]["link"] = urlsplit(post["author"]["link"]).path.rstrip(
-            "/"
+        author = post["_embedded"]["author"][0]
+        formatted["author"] = dict(
+            author, link=urlsplit(author["link"]).path.rstrip("/")
         )
-    post["link"] = urlsplit(post["link"]).path.rstrip("/")
-    post["summary"] = format_summary(post["excerpt"]["rendered"])
-    post["date"] = format_date(post["date"])
+    formatted["link"] = urlsplit(post["link"]).path.rstrip("/")
+    formatted["summary"] = format_summary(post["excerpt"]["rendered"])
+    formatted["date"] = format_date(post["date"])
 
     if post["_start_month"]:
         start_month_name = get_month_name(int(post["_start_month"]))
-        post["start_date"] = "{} {} {}".format(
+        formatted["start_date"] = "{} {} {}".format(
             post["_start_day"], start_month_name, post["_start_year"]
         )
 
     if post["_end_month"]:
         end_month_name = get_month_name(int(post["_end_month"]))
-        post["end_date"] = "{} {} {}".format(
+        formatted["end_date"] = "{} {} {}".format(
             post["_end_day"], end_month_name, post["_end_year"]
         )
 
     if post["content"]:
-        CLOUDINARY = (
-            "https://res.cloudinary.com/"
-            "canonical/image/fetch/q_auto,f_auto,"
-        )
-        """
-        Remove existing cloudinary urls
-        """
-        post["content"]["rendered"] = re.sub(
-            r'img(.*)src="https://res.cloudinary.com/canonical'
-            r'(.[^http]*)/http(.[^"]*)"',
-            r'img\1 src="\3"',
-            post["content"]["rendered"],
-        )
-        """
-        Add cloudinary urls with a srcset
-        """
-        post["content"]["rendered"] = re.sub(
-            r"img(.*) src=\"(.[^\"]*)\"",
-            r'img\1 decoding="async" src="{url}w_560/\2"'
-            r'srcset="{url}w_375/\2 375w,'
-            r'{url}w_480/\2 480w, {url}w_560/\2 560w"'
-            r'sizes="(max-width: 375px) 280px,'
-            r"(max-width: 480px) 440px,"
-            r'560px"'.format(url=CLOUDINARY),
-            post["content"]["rendered"],
+        formatted["content"] = dict(
+            post["content"],
+            rendered=content.rewrite_images(post["content"]["rendered"]),
         )
 
-    return post
+    return formatted
 
 
+@functools.lru_cache(maxsize=12)
 def get_month_name(month_index):
     """
     Get the month name from it's number, e.g.:
@@ -143,6 +277,7 @@ def get_month_name(month_index):
     return datetime.date(1900, month_index, 1).strftime("%B")
 
 
+@functools.lru_cache(maxsize=FORMATTED_POSTS_CACHE_SIZE)
 def format_date(date):
     """
     Make the date just how we like it, e.g.:
@@ -163,16 +298,7 @@ def format_summary(excerpt):
     # shorten to 250 chars, on a wordbreak and with a ...
     summary = textwrap.shorten(excerpt, width=250, placeholder="&hellip;")
 
-    # replace headings (e.g. h1) to paragraphs
-    summary = re.sub(r"h\d>", "p>", summary)
-
-    # remove images
-    summary = re.sub(r"<img(.[^>]*)?", "", summary)
-
-    # if there is a [...] replace with ...
-    summary = re.sub(r"\[\&hellip;\]", "&hellip;", summary)
-
-    return summary
+    return content.tidy_summary(summary)
 
 
 def monthname(month_number):
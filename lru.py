@@ -0,0 +1,57 @@
+# Core
+import threading
+from collections import Counter, OrderedDict
+
+
+class LRUCache:
+    """
+    A thread-safe dictionary holding at most `maxsize` items,
+    which drops the least recently used item to make room for new ones.
+
+    Counts hits, misses and evictions in `stats`.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.stats = Counter()
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._items:
+                self.stats["misses"] += 1
+
+                return default
+
+            self._items.move_to_end(key)
+            self.stats["hits"] += 1
+
+            return self._items[key]
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def copy_stats(self):
+        """
+        A copy of the stats, taken while no other thread is updating them
+        """
+
+        with self._lock:
+            return Counter(self.stats)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
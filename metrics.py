@@ -0,0 +1,95 @@
+# Core
+import math
+import re
+import threading
+from collections import Counter, deque
+from urllib.parse import urlsplit
+
+
+def percentile(values, percent):
+    """
+    Nearest-rank percentile of a list of numbers, e.g.:
+    percentile([1, 2, 3, 4], 50) == 2
+    """
+
+    if not values:
+        return None
+
+    ordered = sorted(values)
+    rank = max(int(math.ceil(percent / 100 * len(ordered))), 1)
+
+    return ordered[rank - 1]
+
+
+def endpoint(url):
+    """
+    The path of a URL, with any numeric IDs replaced, so that
+    requests for different posts are counted together, e.g.:
+    endpoint("https://a.com/wp-json/wp/v2/posts/12?x=1")
+        == "/wp-json/wp/v2/posts/<id>"
+    """
+
+    return re.sub(r"/[0-9]+(?=/|$)", "/<id>", urlsplit(url).path)
+
+
+class LatencyStats:
+    """
+    Request counts, error counts and the durations of the most recent
+    `window` requests, for each endpoint
+    """
+
+    def __init__(self, window=1000):
+        self.window = window
+        self.requests = Counter()
+        self.errors = Counter()
+        self._durations = {}
+        self._lock = threading.Lock()
+
+    def record(self, url, seconds, error=False):
+        name = endpoint(url)
+
+        with self._lock:
+            self.requests[name] += 1
+
+            if error:
+                self.errors[name] += 1
+
+            if name not in self._durations:
+                self._durations[name] = deque(maxlen=self.window)
+
+            self._durations[name].append(seconds)
+
+    def clear(self):
+        with self._lock:
+            self.requests.clear()
+            self.errors.clear()
+            self._durations.clear()
+
+    def report(self):
+        """
+        For each endpoint, the number of requests and errors,
+        and the latency percentiles in milliseconds
+        """
+
+        with self._lock:
+            durations = {
+                name: list(values) for name, values in self._durations.items()
+            }
+            requests = dict(self.requests)
+            errors = dict(self.errors)
+
+        report = {}
+
+        for name, values in durations.items():
+            report[name] = {
+                "requests": requests[name],
+                "errors": errors.get(name, 0),
+                "error_rate": round(errors.get(name, 0) / requests[name], 4),
+            }
+
+            for percent in [50, 95, 99]:
+                report[name]["p{}_ms".format(percent)] = round(
+                    percentile(values, percent) * 1000, 2
+                )
+
+        return report
@@ -0,0 +1,282 @@
+# Core
+import contextvars
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+from urllib.parse import urlencode
+
+# Third-party
+import flask
+
+# Local
+import feeds
+
+
+# Rendered page cache settings
+# ===
+# PAGE_CACHE_MAX_BYTES bounds the memory used by each worker process for
+# rendered pages, evicting the least recently used first (0 turns it off).
+# PAGE_CACHE_TTL is how long a rendered page can be served, in seconds.
+PAGE_CACHE_MAX_BYTES = int(os.getenv("PAGE_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+PAGE_CACHE_TTL = int(os.getenv("PAGE_CACHE_TTL", 300))
+
+# The only query parameters any view reads. Others (e.g. utm_source)
+# can't change the page, so they're left out of the cache key.
+QUERY_PARAMETERS = [
+    "category",
+    "group",
+    "month",
+    "newsletter",
+    "page",
+    "q",
+    "year",
+]
+
+# What the page being rendered depends on, shared with any threads
+# started by helpers.run_concurrently
+_dependencies = contextvars.ContextVar("page_dependencies", default=None)
+
+
+class _Dependencies:
+    def __init__(self):
+        self.tags = set()
+        self.upstream_urls = set()
+
+
+def _tags(posts=[], groups=[], categories=[], tags=[]):
+    """
+    Dependency tags for sets of IDs, e.g. {"post:1234", "group:1479"}
+    """
+
+    return {
+        "{}:{}".format(name, item_id)
+        for name, ids in [
+            ("post", posts),
+            ("group", groups),
+            ("category", categories),
+            ("tag", tags),
+        ]
+        for item_id in ids or []
+    }
+
+
+def record(posts=[], groups=[], categories=[], tags=[]):
+    """
+    Note that the page being rendered shows (or lists by) these
+    post, group, category and tag IDs, so that it is purged from the cache
+    if any of them change
+    """
+
+    dependencies = _dependencies.get()
+
+    if dependencies is not None:
+        dependencies.tags.update(
+            _tags(posts=posts, groups=groups, categories=categories, tags=tags)
+        )
+
+
+def record_upstream(url):
+    """
+    Note that the page being rendered used this upstream URL,
+    so its cached response is dropped when the page is purged
+    """
+
+    dependencies = _dependencies.get()
+
+    if dependencies is not None:
+        dependencies.upstream_urls.add(url)
+
+
+class PageCache:
+    """
+    A least-recently-used cache of rendered pages, limited by size in bytes.
+
+    Each page is stored with the IDs of the posts, groups, categories
+    and tags it depends on, so that changes in WordPress can purge
+    only the pages they affect.
+    """
+
+    def __init__(self, max_bytes, ttl):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.stats = Counter()
+        self.bytes = 0
+        self._pages = OrderedDict()
+        self._keys_by_tag = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._pages)
+
+    def get(self, key):
+        with self._lock:
+            page = self._pages.get(key)
+
+            if page and page["expires"] < time.time():
+                self._remove(key)
+                page = None
+
+            if not page:
+                self.stats["misses"] += 1
+
+                return None
+
+            self._pages.move_to_end(key)
+            self.stats["hits"] += 1
+
+            return page
+
+    def set(self, key, body, mimetype, dependencies):
+        size = len(body)
+
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._pages:
+                self._remove(key)
+
+            while self._pages and self.bytes + size > self.max_bytes:
+                self._remove(next(iter(self._pages)))
+                self.stats["evictions"] += 1
+
+            self._pages[key] = {
+                "body": body,
+                "mimetype": mimetype,
+                "expires": time.time() + self.ttl,
+                "tags": dependencies.tags,
+                "upstream_urls": dependencies.upstream_urls,
+            }
+            self.bytes += size
+
+            for tag in dependencies.tags:
+                self._keys_by_tag.setdefault(tag, set()).add(key)
+
+    def invalidate(self, tags):
+        """
+        Remove and return every page depending on any of the given tags
+        """
+
+        with self._lock:
+            keys = set()
+
+            for tag in tags:
+                keys.update(self._keys_by_tag.get(tag, []))
+
+            pages = [self._remove(key) for key in keys]
+            self.stats["purged"] += len(pages)
+
+        return pages
+
+    def copy_stats(self):
+        """
+        A copy of the stats, taken while no other thread is updating them
+        """
+
+        with self._lock:
+            return Counter(self.stats)
+
+    def _remove(self, key):
+        page = self._pages.pop(key)
+        self.bytes -= len(page["body"])
+
+        for tag in page["tags"]:
+            keys = self._keys_by_tag.get(tag)
+            keys.discard(key)
+
+            if not keys:
+                del self._keys_by_tag[tag]
+
+        return page
+
+
+cache = PageCache(max_bytes=PAGE_CACHE_MAX_BYTES, ttl=PAGE_CACHE_TTL)
+
+
+def _cache_key(request):
+    """
+    The request host and path, plus a normalised query string
+    of only the parameters which views use. Pages can show the host
+    (e.g. the newsletter form's return URL), so it's part of the key.
+    """
+
+    # Encoded, so that values containing "&" or "=" can't make
+    # the same key as other parameters
+    query = urlencode(
+        [
+            (name, request.args[name])
+            for name in QUERY_PARAMETERS
+            if request.args.get(name)
+        ]
+    )
+
+    return request.host + request.path + "?" + query
+
+
+def serve_cached_page():
+    """
+    A "before_request" function to return a page from the cache,
+    or start recording what the page depends on before it's rendered
+    """
+
+    _dependencies.set(None)
+
+    if not cache.max_bytes or flask.request.method != "GET":
+        return
+
+    key = _cache_key(flask.request)
+    page = cache.get(key)
+
+    if page:
+        response = flask.Response(page["body"], mimetype=page["mimetype"])
+        response.headers["X-Page-Cache"] = "hit"
+
+        return response
+
+    flask.g.page_cache_key = key
+    _dependencies.set(_Dependencies())
+
+
+def cache_page(response):
+    """
+    An "after_request" function to store successfully rendered pages
+    """
+
+    key = flask.g.pop("page_cache_key", None)
+    dependencies = _dependencies.get()
+    _dependencies.set(None)
+
+    if (
+        key
+        and dependencies
+        and response.status_code == 200
+        and response.mimetype == "text/html"
+        and not response.direct_passthrough
+    ):
+        cache.set(key, response.get_data(), response.mimetype, dependencies)
+        response.headers["X-Page-Cache"] = "miss"
+
+    return response
+
+
+def purge(posts=[], groups=[], categories=[], tags=[]):
+    """
+    Remove every page that shows any of the given posts, groups,
+    categories or tags, and the upstream responses those pages used,
+    so they are rebuilt from fresh data. Returns the number of pages removed.
+
+    Only this worker process's pages are removed, as each has its own
+    page cache, as are its upstream responses with the "memory" cache
+    backend. Other workers serve their copies until PAGE_CACHE_TTL.
+    """
+
+    pages = cache.invalidate(
+        _tags(posts=posts, groups=groups, categories=categories, tags=tags)
+    )
+
+    for page in pages:
+        for url in page["upstream_urls"]:
+            feeds.delete_cached(url)
+
+    return len(pages)
@@ -0,0 +1,477 @@
+"""
+A copy of every post, kept in each worker process, so that
+api.get_posts can answer listings (by group, category, tag, author,
+date, slug and so on) without asking WordPress, whatever the filters.
+
+The mirror is loaded in full from the API on startup, and then
+kept up to date by asking only for posts modified since the last
+update. Trashed, unpublished and private posts are never listed as
+modified, so posts are also checked by ID when a purge request names
+them, and every post's ID is checked if the API counts fewer posts
+than the mirror has. Pages showing posts which have changed or been
+removed are purged from the page cache.
+
+Each worker process refreshes its own mirror, so a purge request
+only refreshes the mirror of the worker which receives it. Every
+other worker catches up on its next refresh.
+"""
+
+# Core
+import logging
+import math
+import os
+import threading
+import time
+
+# Local
+import api
+import helpers
+import page_cache
+import post_records
+
+
+# Post mirror settings
+# ===
+# Seconds between checks for posts modified since the last one
+# (0 turns the mirror off, so every listing comes from the API)
+POST_MIRROR_REFRESH_INTERVAL = int(
+    os.getenv("POST_MIRROR_REFRESH_INTERVAL", 60)
+)
+
+# Once a day the whole mirror is reloaded anyway
+FULL_RELOAD_INTERVAL = 24 * 60 * 60
+
+# The API won't return more than this many posts per page
+MAX_PER_PAGE = 100
+
+# The taxonomies posts can be listed by, by their field in each post
+TERM_FIELDS = ["group", "categories", "tags"]
+
+# Set once the mirror has first been loaded
+loaded = threading.Event()
+
+# Functions to call with the changed posts and the IDs of removed posts
+# after each refresh, before pages are purged, so that indexes built
+# from the mirror are up to date when the pages are rendered again
+listeners = []
+
+# So that a refresh for a purge request and the background refresh
+# don't both fetch and apply the same changes
+_refresh_lock = threading.Lock()
+
+
+def _ids(value):
+    """
+    A set of integer IDs from a list of IDs, a single ID or None
+    """
+
+    if value is None or value == "":
+        return set()
+
+    if isinstance(value, (list, tuple, set)):
+        return set(int(item) for item in value)
+
+    return set(int(item) for item in str(value).split(","))
+
+
+def _term_ids(posts, field):
+    return set(term_id for post in posts for term_id in post.get(field) or [])
+
+
+class _Listing:
+    """
+    Every post, with indexes for each way posts are listed.
+    Never changed once built.
+    """
+
+    def __init__(self, posts_by_id):
+        self.posts_by_id = posts_by_id
+
+        # Post IDs, newest first, as the API orders them,
+        # and each one's position in that order
+        self.ordered_ids = [
+            post["id"]
+            for post in sorted(
+                posts_by_id.values(),
+                key=lambda post: (post["date"], post["id"]),
+                reverse=True,
+            )
+        ]
+        self.positions = {
+            post_id: position
+            for position, post_id in enumerate(self.ordered_ids)
+        }
+
+        # Field -> term (or author) ID -> IDs of the posts with it
+        self.by_term = {field: {} for field in TERM_FIELDS + ["author"]}
+        self.by_slug = {}
+
+        for post in posts_by_id.values():
+            self.by_slug.setdefault(post["slug"], set()).add(post["id"])
+
+            for field in TERM_FIELDS:
+                for term_id in post.get(field) or []:
+                    self.by_term[field].setdefault(term_id, set()).add(
+                        post["id"]
+                    )
+
+            self.by_term["author"].setdefault(post["author"], set()).add(
+                post["id"]
+            )
+
+
+class PostMirror:
+    """
+    A copy of every published post, which can be listed
+    with the same filters and pagination as the API
+    """
+
+    def __init__(self):
+        self.loaded_at = None
+        self.modified_after = None
+
+        # Replaced in a single assignment on every update,
+        # so readers never see a half-updated listing
+        self._listing = _Listing({})
+        self._update_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._listing.posts_by_id)
+
+    def update(self, posts, replace=False):
+        """
+        Add or replace posts (or replace every post),
+        returning the previous versions of any replaced posts
+        """
+
+        with self._update_lock:
+            posts_by_id = {} if replace else dict(self._listing.posts_by_id)
+            previous = []
+
+            for post in posts:
+                post = post_records.PostRecord.from_api(post)
+
+                if not replace and post["id"] in posts_by_id:
+                    previous.append(posts_by_id[post["id"]])
+
+                posts_by_id[post["id"]] = post
+
+                if post.get("modified"):
+                    self.modified_after = max(
+                        self.modified_after or "", post["modified"]
+                    )
+
+            self._listing = _Listing(posts_by_id)
+
+        return previous
+
+    def remove(self, post_ids):
+        """
+        Remove posts by ID, returning the removed posts
+        """
+
+        with self._update_lock:
+            posts_by_id = dict(self._listing.posts_by_id)
+            removed = [
+                posts_by_id.pop(post_id)
+                for post_id in post_ids
+                if post_id in posts_by_id
+            ]
+
+            if removed:
+                self._listing = _Listing(posts_by_id)
+
+        return removed
+
+    def ids(self):
+        return set(self._listing.posts_by_id)
+
+    def modified_since(self, modified_after=None):
+        """
+        The posts modified after an ISO date (or every post),
+        least recently modified first, as api.get_modified_posts
+        """
+
+        posts = [
+            post
+            for post in self._listing.posts_by_id.values()
+            if not modified_after or post["modified"] > modified_after
+        ]
+
+        return sorted(posts, key=lambda post: (post["modified"], post["id"]))
+
+    def find(
+        self,
+        page=1,
+        per_page=12,
+        sticky=None,
+        slugs=[],
+        group_ids=[],
+        category_ids=[],
+        tag_ids=[],
+        tags_exclude_ids=[],
+        author_ids=[],
+        before=None,
+        after=None,
+        exclude=None,
+        post_ids=[],
+    ):
+        """
+        List posts as api.get_posts does, returning a page of posts,
+        the number of posts and the number of pages, or [], None, None
+        for a page past the last one.
+
+        Returns None if the mirror isn't loaded, or for requests the API
+        would reject, so that the API can respond to them instead.
+        """
+
+        if not self.loaded_at or page < 1 or not 0 < per_page <= MAX_PER_PAGE:
+            return None
+
+        listing = self._listing
+        matching_ids = None
+
+        # Narrow down to the posts with any of the IDs in each filter
+        for field, ids in [
+            ("group", group_ids),
+            ("categories", category_ids),
+            ("tags", tag_ids),
+            ("author", author_ids),
+        ]:
+            if ids:
+                field_ids = set().union(
+                    *(listing.by_term[field].get(item, ()) for item in ids)
+                )
+                matching_ids = (
+                    field_ids
+                    if matching_ids is None
+                    else matching_ids & field_ids
+                )
+
+        if slugs:
+            slug_ids = set().union(
+                *(listing.by_slug.get(slug, ()) for slug in slugs)
+            )
+            matching_ids = (
+                slug_ids if matching_ids is None else matching_ids & slug_ids
+            )
+
+        if post_ids:
+            matching_ids = (
+                _ids(post_ids)
+                if matching_ids is None
+                else matching_ids & _ids(post_ids)
+            )
+
+        if matching_ids is None:
+            ordered_ids = listing.ordered_ids
+        else:
+            ordered_ids = sorted(
+                (
+                    post_id
+                    for post_id in matching_ids
+                    if post_id in listing.positions
+                ),
+                key=listing.positions.get,
+            )
+
+        excluded_ids = _ids(exclude)
+        excluded_tags = _ids(tags_exclude_ids)
+        before = before.isoformat() if before else None
+        after = after.isoformat() if after else None
+        posts = []
+
+        for post_id in ordered_ids:
+            post = listing.posts_by_id[post_id]
+
+            if (
+                post_id in excluded_ids
+                or (sticky is not None and post["sticky"] != sticky)
+                or (before and not post["date"] < before)
+                or (after and not post["date"] > after)
+                or (excluded_tags and excluded_tags.intersection(post["tags"]))
+            ):
+                continue
+
+            posts.append(post)
+
+        total_posts = len(posts)
+        total_pages = int(math.ceil(total_posts / per_page))
+
+        if page > 1 and page > total_pages:
+            # Like the API's "rest_post_invalid_page_number" error
+            return [], None, None
+
+        start = (page - 1) * per_page
+
+        # Callers add formatted fields to the posts they get,
+        # so they get copies
+        return (
+            [post.copy() for post in posts[start:start + per_page]],
+            total_posts,
+            total_pages,
+        )
+
+
+mirror = PostMirror()
+
+
+def load():
+    """
+    Fetch every post, then replace the mirror's copy of them all
+    """
+
+    mirror.update(
+        api.get_modified_posts(parameters=api.post_parameters()), replace=True
+    )
+    mirror.loaded_at = time.time()
+    loaded.set()
+
+
+def _fetch_by_id(post_ids):
+    """
+    The posts with these IDs which are still published
+    """
+
+    post_ids = sorted(_ids(post_ids))
+    posts = []
+
+    for start in range(0, len(post_ids), MAX_PER_PAGE):
+        response = api.get_uncached(
+            "posts",
+            dict(
+                api.post_parameters(),
+                include=",".join(
+                    str(post_id)
+                    for post_id in post_ids[start:start + MAX_PER_PAGE]
+                ),
+                per_page=MAX_PER_PAGE,
+            ),
+        )
+        posts.extend(response.json())
+
+    return posts
+
+
+def _missing_ids():
+    """
+    The IDs of posts in the mirror which the API no longer lists,
+    only paging through every post's ID if the API counts fewer
+    posts than the mirror has
+    """
+
+    response = api.get_uncached("posts", {"per_page": 1, "_fields": "id"})
+    total_posts = helpers.to_int(response.headers.get("X-WP-Total"), None)
+
+    if total_posts is None or total_posts >= len(mirror):
+        return set()
+
+    listed_ids = set(
+        post["id"]
+        for post in api.get_modified_posts(parameters={"_fields": "id"})
+    )
+
+    return mirror.ids() - listed_ids
+
+
+def refresh(post_ids=[]):
+    """
+    Add posts modified since the last load or refresh to the mirror,
+    along with any posts in `post_ids`, remove posts which are
+    no longer published, and purge the pages showing them,
+    or listing posts by their terms, from the page cache
+    """
+
+    with _refresh_lock:
+        posts = list(
+            api.get_modified_posts(
+                mirror.modified_after, api.post_parameters()
+            )
+        )
+        removed_ids = set()
+
+        if post_ids:
+            found = _fetch_by_id(post_ids)
+            posts.extend(found)
+            removed_ids.update(
+                _ids(post_ids) - set(post["id"] for post in found)
+            )
+
+        changed = posts + mirror.update(posts)
+        removed_ids.update(_missing_ids())
+        removed = mirror.remove(removed_ids)
+
+        if not changed and not removed:
+            return
+
+        for listener in listeners:
+            listener(
+                [post_records.PostRecord.from_api(post) for post in posts],
+                set(post["id"] for post in removed),
+            )
+
+        changed += removed
+        page_cache.purge(
+            posts=[post["id"] for post in changed],
+            groups=_term_ids(changed, "group"),
+            categories=_term_ids(changed, "categories"),
+            tags=_term_ids(changed, "tags"),
+        )
+
+
+def refresh_in_background(post_ids=[]):
+    """
+    Refresh the mirror, checking `post_ids`, in a new thread,
+    so that purge requests don't wait for the API
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def refresh_and_log():
+        try:
+            refresh(post_ids)
+        except Exception as refresh_error:
+            logger.warning(
+                "Failed to refresh the post mirror: {}".format(
+                    str(refresh_error)
+                )
+            )
+
+    threading.Thread(
+        target=refresh_and_log, name="post-mirror-purge", daemon=True
+    ).start()
+
+
+def start_background_refresh(interval=POST_MIRROR_REFRESH_INTERVAL):
+    """
+    Load the mirror in a background thread, then refresh it
+    every `interval` seconds, and reload it every day
+    """
+
+    if not interval:
+        return
+
+    logger = logging.getLogger(__name__)
+
+    def refresh_forever():
+        while True:
+            try:
+                if (
+                    not mirror.loaded_at
+                    or time.time() - mirror.loaded_at > FULL_RELOAD_INTERVAL
+                ):
+                    load()
+                else:
+                    refresh()
+            except Exception as refresh_error:
+                logger.warning(
+                    "Failed to update the post mirror: {}".format(
+                        str(refresh_error)
+                    )
+                )
+
+            time.sleep(interval)
+
+    threading.Thread(
+        target=refresh_forever, name="post-mirror-refresh", daemon=True
+    ).start()
@@ -0,0 +1,145 @@
+"""
+Compact records of posts, holding only the fields the views and
+templates use, in place of the full JSON the API returns for each post
+(with every WordPress field, embedded terms, every image size and links).
+"""
+
+# Core
+from collections.abc import MutableMapping
+
+
+# The fields of each post from the API which are kept
+API_FIELDS = [
+    "id",
+    "date",
+    "date_gmt",
+    "modified",
+    "modified_gmt",
+    "slug",
+    "link",
+    "title",
+    "excerpt",
+    "content",
+    "author",
+    "sticky",
+    "categories",
+    "tags",
+    "group",
+    "topic",
+    "_start_day",
+    "_start_month",
+    "_start_year",
+    "_end_day",
+    "_end_month",
+    "_end_year",
+    "_event_venue",
+    "_event_location",
+]
+
+# The fields views add, e.g. in helpers.format_post
+ADDED_FIELDS = [
+    "_embedded",
+    "featuredmedia",
+    "summary",
+    "start_date",
+    "end_date",
+    "category",
+]
+
+# Of the featured image, only its URL and alt text are shown
+MEDIA_FIELDS = ["source_url", "alt_text"]
+
+_fields = set(API_FIELDS + ADDED_FIELDS)
+
+
+def _without_links(resource):
+    return {key: value for key, value in resource.items() if key != "_links"}
+
+
+class PostRecord(MutableMapping):
+    """
+    A post, with its fields in slots rather than a dictionary.
+    It can be read and updated like the dictionary it's built from,
+    by views, and by templates, but only with the fields above.
+    """
+
+    __slots__ = API_FIELDS + ADDED_FIELDS
+
+    def __init__(self, fields={}):
+        for key, value in fields.items():
+            self[key] = value
+
+    @classmethod
+    def from_api(cls, post):
+        """
+        Build a record of a post from the API, with its
+        embedded author and featured image, if it has them
+        """
+
+        record = cls()
+
+        for field in API_FIELDS:
+            if field in post:
+                value = post[field]
+
+                # Only the HTML of the title, excerpt and content is used
+                if isinstance(value, dict) and "rendered" in value:
+                    value = {"rendered": value["rendered"]}
+
+                setattr(record, field, value)
+
+        embedded = post.get("_embedded")
+
+        if embedded is not None:
+            record._embedded = {
+                "author": [
+                    _without_links(author)
+                    for author in embedded.get("author") or []
+                ]
+            }
+
+            for media in embedded.get("wp:featuredmedia") or []:
+                record.featuredmedia = {
+                    key: media[key] for key in MEDIA_FIELDS if key in media
+                }
+                break
+
+        return record
+
+    def copy(self):
+        return PostRecord(self)
+
+    def __getitem__(self, key):
+        if key not in _fields:
+            raise KeyError(key)
+
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key not in _fields:
+            raise KeyError("Posts don't keep the field {}".format(key))
+
+        setattr(self, key, value)
+
+    def __delitem__(self, key):
+        if key not in _fields:
+            raise KeyError(key)
+
+        try:
+            delattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __iter__(self):
+        for field in self.__slots__:
+            if hasattr(self, field):
+                yield field
+
+    def __len__(self):
+        return sum(1 for field in self)
+
+    def __repr__(self):
+        return "PostRecord({!r})".format(dict(self))
@@ -0,0 +1,189 @@
+# Core
+import fcntl
+import logging
+import os
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit
+
+# Local
+import api
+import feeds
+
+
+# Pre-warm settings
+# ===
+# When each worker process starts, it renders PREWARM_URLS (by default,
+# every page in the app without parameters) and the PREWARM_RECENT_POSTS
+# most recent posts, to fill the caches before /status/ready reports it
+# ready. It does so again every PREWARM_INTERVAL seconds (0 only on
+# startup). Worker processes take turns, holding a lock on
+# PREWARM_LOCK_FILE, so that they don't all ask the API for the same
+# pages at once, and with the "sqlite" cache backend, workers after the
+# first are warmed from the shared cache. Pages are rendered as if
+# requested from PREWARM_BASE_URL, as pages are cached by host.
+PREWARM_ENABLED = os.getenv("PREWARM_ENABLED", "true").lower() == "true"
+PREWARM_URLS = [url for url in os.getenv("PREWARM_URLS", "").split(",") if url]
+PREWARM_RECENT_POSTS = int(os.getenv("PREWARM_RECENT_POSTS", 10))
+PREWARM_INTERVAL = int(os.getenv("PREWARM_INTERVAL", 1800))
+PREWARM_BASE_URL = os.getenv("PREWARM_BASE_URL", "https://blog.ubuntu.com")
+PREWARM_LOCK_FILE = os.getenv(
+    "PREWARM_LOCK_FILE", os.path.join(tempfile.gettempdir(), "prewarm.lock")
+)
+
+# Routes which aren't pages, so aren't worth warming
+EXCLUDED_ENDPOINTS = [
+    "status",
+    "status_ready",
+    "status_metrics",
+    "static",
+    "purge_page_cache",
+]
+
+# Set once the first warm-up has finished (or if it's disabled)
+ready = threading.Event()
+
+# What the latest warm-up did
+last_report = None
+
+
+def default_urls(app):
+    """
+    Every route in the app which takes no parameters, e.g. "/upcoming"
+    """
+
+    return sorted(
+        rule.rule
+        for rule in app.url_map.iter_rules()
+        if "GET" in rule.methods
+        and not rule.arguments
+        and rule.endpoint not in EXCLUDED_ENDPOINTS
+    )
+
+
+def recent_post_urls(count=PREWARM_RECENT_POSTS):
+    """
+    The paths of the most recent posts
+    """
+
+    if not count:
+        return []
+
+    posts, total_posts, total_pages = api.get_posts(per_page=count)
+
+    return [urlsplit(post["link"]).path.rstrip("/") for post in posts]
+
+
+def warm_up(app, urls=None):
+    """
+    Render each URL with the app's test client, filling the caches
+    of everything it uses, and return a report of how long it took
+    and how many upstream calls it made
+    """
+
+    global last_report
+
+    logger = logging.getLogger(__name__)
+    start = time.perf_counter()
+    misses_before = feeds.cache_stats["misses"]
+
+    if urls is None:
+        urls = list(PREWARM_URLS or default_urls(app))
+
+        try:
+            urls.extend(recent_post_urls())
+        except Exception as request_error:
+            logger.warning(
+                "Failed to find recent posts to pre-warm: {}".format(
+                    str(request_error)
+                )
+            )
+
+    client = app.test_client()
+    pages = []
+
+    for url in urls:
+        page_start = time.perf_counter()
+        misses = feeds.cache_stats["misses"]
+
+        try:
+            response = client.get(url, base_url=PREWARM_BASE_URL)
+            response.get_data()
+            status = response.status_code
+        except Exception as render_error:
+            logger.warning(
+                "Failed to pre-warm {}: {}".format(url, str(render_error))
+            )
+            status = None
+
+        pages.append(
+            {
+                "url": url,
+                "status": status,
+                "seconds": round(time.perf_counter() - page_start, 3),
+                "upstream_calls": feeds.cache_stats["misses"] - misses,
+            }
+        )
+
+    last_report = {
+        "finished_at": time.time(),
+        "seconds": round(time.perf_counter() - start, 3),
+        "upstream_calls": feeds.cache_stats["misses"] - misses_before,
+        "pages": pages,
+    }
+
+    logger.info(
+        "Pre-warmed {} pages in {} seconds, with {} upstream calls".format(
+            len(pages), last_report["seconds"], last_report["upstream_calls"]
+        )
+    )
+
+    return last_report
+
+
+def warm_up_in_turn(app):
+    """
+    Warm up once no other worker process is warming up
+    """
+
+    with open(PREWARM_LOCK_FILE, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+        try:
+            return warm_up(app)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def start(app, interval=PREWARM_INTERVAL):
+    """
+    Warm up the caches in a background thread, marking the process ready
+    when done, then again every `interval` seconds
+    """
+
+    if not PREWARM_ENABLED:
+        ready.set()
+        return
+
+    logger = logging.getLogger(__name__)
+
+    def warm_up_logged():
+        try:
+            warm_up_in_turn(app)
+        except Exception as warm_up_error:
+            logger.warning(
+                "Failed to pre-warm: {}".format(str(warm_up_error))
+            )
+
+    def warm_up_forever():
+        warm_up_logged()
+        ready.set()
+
+        while interval:
+            time.sleep(interval)
+            warm_up_logged()
+
+    threading.Thread(
+        target=warm_up_forever, name="prewarm", daemon=True
+    ).start()
@@ -1,12 +1,131 @@
 # Core
+import logging
 import os
 import re
+import threading
+import time
+
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse  # Python < 3.11
 
 # External
 import flask
 import yaml
 import yamlordereddictloader
 
+# Local
+import lru
+
+
+# How many request paths to remember the redirect (or lack of one) for
+REDIRECT_CACHE_SIZE = int(os.getenv("REDIRECT_CACHE_SIZE", 10000))
+
+# How often to check the redirect files for changes, in seconds
+# (0 turns it off, so they're only loaded once)
+REDIRECTS_RELOAD_INTERVAL = int(os.getenv("REDIRECTS_RELOAD_INTERVAL", 10))
+
+_NOT_CACHED = object()
+
+
+def _parse_literals(pattern):
+    """
+    Parse a regular expression, returning the literal text that any
+    match must start with, and whether that text is the whole pattern.
+
+    E.g. "/news/?" starts with "/news", "/home" is entirely literal,
+    and "/a|/b" or "(?i)/news" have no literal start.
+    """
+
+    parsed = sre_parse.parse(pattern)
+    state = getattr(parsed, "state", None) or parsed.pattern
+
+    if state.flags & (re.IGNORECASE | re.LOCALE):
+        return "", False
+
+    characters = []
+
+    for opcode, argument in parsed:
+        if opcode != sre_parse.LITERAL:
+            return "".join(characters), False
+
+        characters.append(chr(argument))
+
+    return "".join(characters), True
+
+
+class RedirectMatcher:
+    """
+    Find the first in an ordered list of (compiled regex, target) rules
+    to fully match a path, without trying every regex in turn:
+
+    - Entirely literal rules are looked up in a dictionary
+    - The other rules are indexed in a trie by the literal text
+      they start with, so only those whose start matches the path
+      are tried
+    """
+
+    def __init__(self, rules):
+        self.rules = rules
+        self._exact = {}
+        self._prefixes = {}
+
+        for index, (regex, target) in enumerate(rules):
+            prefix, is_literal = _parse_literals(regex.pattern)
+
+            if is_literal:
+                self._exact.setdefault(prefix, index)
+                continue
+
+            node = self._prefixes
+
+            for character in prefix:
+                node = node.setdefault(character, {})
+
+            node.setdefault(None, []).append(index)
+
+    def _candidates(self, path):
+        """
+        The indexes of the rules which could match a path, in order
+        """
+
+        node = self._prefixes
+        candidates = list(node.get(None, []))
+
+        for character in path:
+            node = node.get(character)
+
+            if node is None:
+                break
+
+            candidates.extend(node.get(None, []))
+
+        return sorted(candidates)
+
+    def match(self, path):
+        """
+        Return the regex match object and target of the first rule
+        to match the path, or None
+        """
+
+        exact_index = self._exact.get(path)
+
+        for index in self._candidates(path):
+            if exact_index is not None and index > exact_index:
+                break
+
+            regex, target = self.rules[index]
+            result = regex.fullmatch(path)
+
+            if result:
+                return result, target
+
+        if exact_index is not None:
+            regex, target = self.rules[exact_index]
+
+            return regex.fullmatch(path), target
+
 
 class YamlRegexMap:
     def __init__(self, filepath):
@@ -41,34 +160,108 @@ class YamlRegexMap:
                             (re.compile(url_match), target_url)
                         )
 
+        self.matcher = RedirectMatcher(self.matches)
+
+    def get_path_target(self, url_path):
+        """
+        The target for a path, without the request's query string,
+        or None if no rule matches
+        """
+
+        matched = self.matcher.match(url_path)
+
+        if matched:
+            result, target = matched
+            parts = {}
+            for name, value in result.groupdict().items():
+                parts[name] = value or ""
+
+            return target.format(**parts)
+
     def get_target(self, url_path):
-        for (match, target) in self.matches:
-            result = match.fullmatch(url_path)
+        target_url = self.get_path_target(url_path)
 
-            if result:
-                parts = {}
-                for name, value in result.groupdict().items():
-                    parts[name] = value or ""
+        if target_url and flask.request.query_string:
+            target_url += "?" + flask.request.query_string.decode("utf-8")
+
+        return target_url
+
+
+def _file_versions(filepaths):
+    """
+    The modification time and size of each file, or None if it's missing
+    """
+
+    versions = []
 
-                target_url = target.format(**parts)
+    for filepath in filepaths:
+        try:
+            stat = os.stat(filepath)
+            versions.append((stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            versions.append(None)
 
-                if flask.request.query_string:
-                    target_url += "?" + flask.request.query_string.decode(
-                        "utf-8"
-                    )
+    return versions
 
-                return target_url
+
+class _RedirectMaps:
+    """
+    The permanent and temporary redirect maps from a pair of files,
+    the versions of the files they were loaded from,
+    and a cache of the outcomes of looking up paths in them
+    """
+
+    def __init__(self, permanent_redirects_path, redirects_path, cache_size):
+        self.filepaths = [permanent_redirects_path, redirects_path]
+
+        # Checked before loading, so a change made while loading
+        # is picked up by the next check
+        self.file_versions = _file_versions(self.filepaths)
+
+        self.permanent_redirect_map = YamlRegexMap(permanent_redirects_path)
+        self.redirect_map = YamlRegexMap(redirects_path)
+        self.lookups = lru.LRUCache(maxsize=cache_size)
+
+    def files_changed(self):
+        return _file_versions(self.filepaths) != self.file_versions
+
+    def find_redirect(self, path):
+        """
+        The status code and target URL to redirect a path to,
+        or None if it isn't redirected
+        """
+
+        permanent_redirect_url = self.permanent_redirect_map.get_path_target(
+            path
+        )
+        if permanent_redirect_url:
+            return 301, permanent_redirect_url
+
+        redirect_url = self.redirect_map.get_path_target(path)
+        if redirect_url:
+            return 302, redirect_url
 
 
 def prepare_redirects(
     permanent_redirects_path="permanent-redirects.yaml",
     redirects_path="redirects.yaml",
+    cache_size=REDIRECT_CACHE_SIZE,
+    reload_interval=REDIRECTS_RELOAD_INTERVAL,
 ):
     """
     Create a regex map from the provided yaml files,
     and return a view function "apply_redirects" which encloses
     the maps to apply redirect where relevant.
 
+    The outcome of looking up each path, including finding no redirect,
+    is remembered for the `cache_size` most recently requested paths.
+    Its hits and misses are counted in `apply_redirects.stats`.
+
+    Every `reload_interval` seconds a background thread checks whether
+    the files have changed, and if so loads them into new maps, which
+    replace the old ones in a single assignment.
+    `apply_redirects.reload_if_changed()` does the same on demand.
+
     Usage:
 
         import flask
@@ -81,8 +274,35 @@ def prepare_redirects(
         app.before_request(apply_redirects)
     """
 
-    permanent_redirect_map = YamlRegexMap(permanent_redirects_path)
-    redirect_map = YamlRegexMap(redirects_path)
+    maps = _RedirectMaps(permanent_redirects_path, redirects_path, cache_size)
+    stats = maps.lookups.stats
+
+    def reload_if_changed():
+        """
+        Load the redirect files again if they have changed,
+        returning whether they were reloaded
+        """
+
+        nonlocal maps
+
+        if not maps.files_changed():
+            return False
+
+        try:
+            new_maps = _RedirectMaps(
+                permanent_redirects_path, redirects_path, cache_size
+            )
+        except Exception as load_error:
+            logging.getLogger(__name__).warning(
+                "Failed to reload redirects: {}".format(str(load_error))
+            )
+            return False
+
+        # Keep counting lookups across reloads
+        new_maps.lookups.stats = stats
+        maps = new_maps
+
+        return True
 
     def apply_redirects():
         """
@@ -91,14 +311,34 @@ def prepare_redirects(
         to send the appropriate redirect responses
         """
 
-        permanent_redirect_url = permanent_redirect_map.get_target(
-            flask.request.path
-        )
-        if permanent_redirect_url:
-            return flask.redirect(permanent_redirect_url, code=301)
+        current_maps = maps
+        path = flask.request.path
+        redirect = current_maps.lookups.get(path, _NOT_CACHED)
 
-        redirect_url = redirect_map.get_target(flask.request.path)
-        if redirect_url:
-            return flask.redirect(redirect_url)
+        if redirect is _NOT_CACHED:
+            redirect = current_maps.find_redirect(path)
+            current_maps.lookups.set(path, redirect)
+
+        if redirect:
+            code, target_url = redirect
+
+            if flask.request.query_string:
+                target_url += "?" + flask.request.query_string.decode("utf-8")
+
+            return flask.redirect(target_url, code=code)
+
+    if reload_interval:
+
+        def reload_forever():
+            while True:
+                time.sleep(reload_interval)
+                reload_if_changed()
+
+        threading.Thread(
+            target=reload_forever, name="redirects-reload", daemon=True
+        ).start()
+
+    apply_redirects.stats = stats
+    apply_redirects.reload_if_changed = reload_if_changed
 
     return apply_redirects
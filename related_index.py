@@ -0,0 +1,363 @@
+"""
+The related posts for every post, worked out in advance in each
+worker process, so that a post's page only needs to look them up.
+
+Each post is a sparse vector of its tags and categories, weighted
+so that rarer terms count for more, and tags for more than categories.
+A post's related posts are those with the most similar vectors
+(by cosine similarity).
+
+To keep this fast with many posts, only the newest posts with each
+term are considered, which favours recent posts, as the blog did when
+it listed the newest posts sharing a tag.
+
+The index is loaded in full on startup, and then kept up to date with
+only the posts modified since the last update. With the post mirror,
+it's updated whenever the mirror is, including removing posts the
+mirror removes. Otherwise, it asks the API for them. Posts sharing
+terms with a changed post only have their related posts worked out
+again if it was among them.
+"""
+
+# Core
+import bisect
+import heapq
+import logging
+import math
+import os
+import threading
+import time
+
+# Local
+import api
+import post_mirror
+
+
+# Related posts index settings
+# ===
+# Seconds between checks for posts modified since the last one
+# (0 turns the index off, so related posts come from the API)
+RELATED_INDEX_REFRESH_INTERVAL = int(
+    os.getenv("RELATED_INDEX_REFRESH_INTERVAL", 300)
+)
+
+# Deleted posts are never listed as modified, so once a day the whole
+# index is rebuilt, which also updates how rare each term is
+FULL_RELOAD_INTERVAL = 24 * 60 * 60
+
+# How many related posts to keep for each post
+RELATED_POSTS_COUNT = 3
+
+# How many of the newest posts with each term are considered
+MAX_POSTS_PER_TERM = 100
+
+# How much a shared term in each field counts
+FIELD_WEIGHTS = {"tags": 1.0, "categories": 0.5}
+
+# Only the fields the index needs are requested from the API
+POST_FIELDS = ["id", "date", "modified", "tags", "categories"]
+
+
+class RelatedIndex:
+    """
+    For each post, the IDs of its most related posts, with their scores.
+    """
+
+    def __init__(self):
+        self.loaded_at = None
+        self.modified_after = None
+
+        # Post ID -> (date, post ID) and terms, as (field, ID) pairs
+        self._posts = {}
+
+        # Term -> its posts' (date, post ID), oldest first,
+        # and the IDs of the newest MAX_POSTS_PER_TERM of them
+        self._postings = {}
+        self._newest = {}
+
+        # How much each term counts, and 1 / the length of each
+        # post's vector, worked out again on every update
+        self._weights = {}
+        self._inverse_norms = {}
+
+        # Post ID -> its related posts' (score, post ID), best first
+        self._related = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._posts)
+
+    def get(self, post_id):
+        """
+        The IDs of a post's related posts, best first,
+        or None if the post isn't in the index
+        """
+
+        related = self._related.get(post_id)
+
+        if related is None:
+            return None
+
+        return [related_id for score, related_id in related]
+
+    def update(self, posts, removed_ids=()):
+        """
+        Add or replace posts, given their ID, date, tags and categories,
+        and remove posts by ID, and work out their related posts.
+        Posts with language tags aren't listed on the blog,
+        so they're removed instead.
+
+        Other posts sharing terms with them only have their related
+        posts worked out again if one of the changed posts was among
+        them, and otherwise just check if a changed post is better.
+        """
+
+        with self._lock:
+            changed_ids = set(removed_ids)
+            changed_terms = set()
+
+            for post_id in removed_ids:
+                changed_terms.update(self._remove(post_id))
+
+            for post in posts:
+                changed_ids.add(post["id"])
+                changed_terms.update(self._remove(post["id"]))
+
+                if post.get("modified"):
+                    self.modified_after = max(
+                        self.modified_after or "", post["modified"]
+                    )
+
+                if set(post.get("tags") or []) & set(api.LANGUAGE_TAG_IDS):
+                    continue
+
+                key = (post["date"], post["id"])
+                terms = tuple(
+                    (field, term_id)
+                    for field in FIELD_WEIGHTS
+                    for term_id in post.get(field) or []
+                )
+                self._posts[post["id"]] = (key, terms)
+
+                for term in terms:
+                    bisect.insort(self._postings.setdefault(term, []), key)
+
+                changed_terms.update(terms)
+
+            self._update_weights(changed_terms)
+            added_ids = changed_ids & set(self._posts)
+
+            for post_id in added_ids:
+                self._related[post_id] = self._find_related(post_id)
+
+            affected_ids = set(
+                post_id
+                for term in changed_terms
+                for date, post_id in self._postings.get(term, [])
+            )
+
+            for post_id in affected_ids - changed_ids:
+                related = self._related[post_id]
+
+                if changed_ids.intersection(
+                    related_id for score, related_id in related
+                ):
+                    self._related[post_id] = self._find_related(post_id)
+                else:
+                    self._related[post_id] = self._add_related(
+                        post_id, related, added_ids
+                    )
+
+    def _remove(self, post_id):
+        """
+        Remove a post, returning its terms
+        """
+
+        self._related.pop(post_id, None)
+
+        if post_id not in self._posts:
+            return ()
+
+        key, terms = self._posts.pop(post_id)
+
+        for term in terms:
+            postings = self._postings[term]
+            del postings[bisect.bisect_left(postings, key)]
+
+            if not postings:
+                del self._postings[term]
+                del self._newest[term]
+
+        return terms
+
+    def _update_weights(self, changed_terms):
+        """
+        Work out how much each term counts (more for rarer terms,
+        and by field), and so the length of each post's vector
+        """
+
+        post_count = len(self._posts)
+
+        for term in changed_terms:
+            if term in self._postings:
+                self._newest[term] = tuple(
+                    post_id
+                    for date, post_id in self._postings[term][
+                        -MAX_POSTS_PER_TERM:
+                    ]
+                )
+
+        self._weights = {
+            term: FIELD_WEIGHTS[term[0]]
+            * math.log(1 + post_count / len(postings))
+            for term, postings in self._postings.items()
+        }
+        self._inverse_norms = {
+            post_id: 1
+            / math.sqrt(sum(self._weights[term] ** 2 for term in terms))
+            for post_id, (key, terms) in self._posts.items()
+            if terms
+        }
+
+    def _find_related(self, post_id):
+        key, terms = self._posts[post_id]
+        scores = {}
+
+        # The dot product of this post's vector with each other post's
+        for term in terms:
+            weight = self._weights[term] ** 2
+
+            for other_id in self._newest[term]:
+                scores[other_id] = scores.get(other_id, 0) + weight
+
+        scores.pop(post_id, None)
+
+        # Dividing by the other post's length gives the same order
+        # as cosine similarity. Newer posts (with higher IDs) first
+        # for equal scores.
+        inverse_norms = self._inverse_norms
+
+        return tuple(
+            heapq.nlargest(
+                RELATED_POSTS_COUNT,
+                (
+                    (score * inverse_norms[other_id], other_id)
+                    for other_id, score in scores.items()
+                ),
+            )
+        )
+
+    def _add_related(self, post_id, related, added_ids):
+        """
+        A post's related posts, with any of the added posts
+        which are more related than those
+        """
+
+        key, terms = self._posts[post_id]
+        terms = set(terms)
+        candidates = list(related)
+
+        for added_id in added_ids:
+            score = sum(
+                self._weights[term] ** 2
+                for term in self._posts[added_id][1]
+                if term in terms
+            )
+
+            if score:
+                candidates.append(
+                    (score * self._inverse_norms[added_id], added_id)
+                )
+
+        return tuple(heapq.nlargest(RELATED_POSTS_COUNT, candidates))
+
+
+index = RelatedIndex()
+
+
+def fetch_posts(modified_after=None):
+    """
+    Every post (or those modified after an ISO date), from the post
+    mirror if it's turned on, or otherwise from the API with only
+    the fields the index needs
+    """
+
+    if post_mirror.POST_MIRROR_REFRESH_INTERVAL:
+        # Rather than fetching every post twice when the worker starts
+        post_mirror.loaded.wait()
+
+        return post_mirror.mirror.modified_since(modified_after)
+
+    return api.get_modified_posts(
+        modified_after, {"_fields": ",".join(POST_FIELDS)}
+    )
+
+
+def load():
+    """
+    Build a new index of every post, then replace the current one
+    """
+
+    global index
+
+    new_index = RelatedIndex()
+    new_index.update(fetch_posts())
+    new_index.loaded_at = time.time()
+    index = new_index
+
+
+def refresh():
+    """
+    Update the index with posts modified since the last load or refresh
+    """
+
+    posts = list(fetch_posts(modified_after=index.modified_after))
+
+    if posts:
+        index.update(posts)
+
+
+def _mirror_refreshed(posts, removed_ids):
+    """
+    Update the index with the changes from a refresh of the post mirror
+    """
+
+    index.update(posts, removed_ids)
+
+
+def start_background_refresh(interval=RELATED_INDEX_REFRESH_INTERVAL):
+    """
+    Load the index in a background thread, then refresh it
+    every `interval` seconds, and reload it every day
+    """
+
+    if not interval:
+        return
+
+    if post_mirror.POST_MIRROR_REFRESH_INTERVAL:
+        post_mirror.listeners.append(_mirror_refreshed)
+
+    logger = logging.getLogger(__name__)
+
+    def refresh_forever():
+        while True:
+            try:
+                if (
+                    not index.loaded_at
+                    or time.time() - index.loaded_at > FULL_RELOAD_INTERVAL
+                ):
+                    load()
+                else:
+                    refresh()
+            except Exception as refresh_error:
+                logger.warning(
+                    "Failed to update the related posts index: {}".format(
+                        str(refresh_error)
+                    )
+                )
+
+            time.sleep(interval)
+
+    threading.Thread(
+        target=refresh_forever, name="related-index-refresh", daemon=True
+    ).start()
@@ -0,0 +1,370 @@
+"""
+A full-text search index of every post, kept in each worker process,
+so that /search doesn't need to ask WordPress to search its database.
+
+Posts are ranked with BM25, over their title, tags, excerpt and content
+(with the title and tags counting for more). Every word in the query
+must be in a post for it to match, as with WordPress's own search.
+
+The index is loaded in full on startup, and then kept up to date with
+only the posts modified since the last update, from the post mirror
+if it's turned on, or otherwise from the API. With the post mirror,
+it's also updated whenever the mirror is, so posts the mirror
+removes are removed from the index too.
+"""
+
+# Core
+import heapq
+import html
+import logging
+import math
+import os
+import re
+import threading
+import time
+from array import array
+from collections import Counter
+from operator import itemgetter
+
+# Local
+import api
+import post_mirror
+import taxonomy
+
+
+# Search index settings
+# ===
+# Seconds between checks for posts modified since the last one
+# (0, the default, turns the index off, so /search uses the API).
+# Each worker process builds its own index, of about 4 KiB per post,
+# so it's only worth turning on with few workers, or few posts.
+SEARCH_INDEX_REFRESH_INTERVAL = int(
+    os.getenv("SEARCH_INDEX_REFRESH_INTERVAL", 0)
+)
+
+# Deleted posts are never listed as modified, so once a day the whole
+# index is rebuilt, which also drops space left by replaced posts
+FULL_RELOAD_INTERVAL = 24 * 60 * 60
+
+# How much more a word in each field counts than one in the content
+FIELD_WEIGHTS = {"title": 3, "tags": 2, "excerpt": 1, "content": 1}
+
+# BM25 parameters: how quickly repeated words stop counting for more,
+# and how much longer posts are penalised
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Only the fields the index needs are requested from the API
+POST_FIELDS = ["id", "modified", "title", "excerpt", "content", "tags"]
+
+STOP_WORDS = set(
+    "a an and are as at be but by for from has have how in is it its of "
+    "on or that the this to was what when where which who why will with "
+    "you your".split()
+)
+
+_html_tag = re.compile(r"<[^>]*>")
+_word = re.compile(r"\w+")
+
+
+def tokenize(text):
+    """
+    The lower-case words in some HTML, except stop words
+    """
+
+    text = html.unescape(_html_tag.sub(" ", text)).lower()
+
+    return [word for word in _word.findall(text) if word not in STOP_WORDS]
+
+
+class SearchIndex:
+    """
+    An inverted index of posts: for each word, the posts it's in
+    and how often (weighted by field), in compact arrays.
+
+    Each version of a post added gets the next "document number".
+    Replacing or removing a post marks its old number as removed,
+    rather than rewriting every word's arrays.
+    """
+
+    def __init__(self):
+        self.loaded_at = None
+        self.modified_after = None
+
+        # Word -> (document numbers, weighted word counts)
+        self._postings = {}
+
+        # Document number -> post ID (0 once removed), and length
+        self._post_ids = array("L")
+        self._lengths = array("L")
+        self._numbers = {}
+        self._total_length = 0
+
+        # BM25's length normalisation, by document number,
+        # worked out again after posts are added or removed
+        self._norms = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._numbers)
+
+    def add(self, post, tag_names={}):
+        """
+        Add or replace a post, given its ID, title, excerpt, content
+        and tag IDs, with `tag_names` by ID. Posts with language tags
+        aren't listed on the blog, so they're removed instead.
+        """
+
+        if set(post.get("tags") or []) & set(api.LANGUAGE_TAG_IDS):
+            self.remove(post["id"])
+            return
+
+        fields = {
+            "title": post["title"]["rendered"],
+            "tags": " ".join(
+                tag_names.get(tag_id, "") for tag_id in post.get("tags") or []
+            ),
+            "excerpt": post["excerpt"]["rendered"],
+            "content": post["content"]["rendered"],
+        }
+        words = []
+
+        # Repeating each field's words by its weight lets Counter
+        # count them all at once
+        for field, text in fields.items():
+            words.extend(tokenize(text) * FIELD_WEIGHTS[field])
+
+        counts = Counter(words)
+
+        with self._lock:
+            self._remove(post["id"])
+            number = len(self._post_ids)
+            self._post_ids.append(post["id"])
+            self._lengths.append(len(words))
+            self._numbers[post["id"]] = number
+            self._total_length += len(words)
+            self._norms = None
+            postings = self._postings
+
+            for word, count in counts.items():
+                posting = postings.get(word)
+
+                if posting is None:
+                    posting = postings[word] = (array("I"), array("H"))
+
+                posting[0].append(number)
+                posting[1].append(min(count, 0xFFFF))
+
+            if post.get("modified"):
+                self.modified_after = max(
+                    self.modified_after or "", post["modified"]
+                )
+
+    def remove(self, post_id):
+        with self._lock:
+            self._remove(post_id)
+
+    def _remove(self, post_id):
+        number = self._numbers.pop(post_id, None)
+
+        if number is not None:
+            self._post_ids[number] = 0
+            self._total_length -= self._lengths[number]
+            self._norms = None
+
+    def _length_norms(self):
+        """
+        How much each post's length lowers the score of its words,
+        or None for removed posts
+        """
+
+        if self._norms is None:
+            # Posts without words would otherwise divide by zero
+            average_length = self._total_length / len(self._numbers) or 1
+            self._norms = [
+                (
+                    BM25_K1 * (1 - BM25_B + BM25_B * length / average_length)
+                    if post_id
+                    else None
+                )
+                for post_id, length in zip(self._post_ids, self._lengths)
+            ]
+
+        return self._norms
+
+    def search(self, query, page=1, per_page=12):
+        """
+        Find the posts containing every word in the query,
+        returning the IDs of one page of them, best first,
+        and the number of posts found
+        """
+
+        words = set(tokenize(query))
+
+        if not words:
+            return [], 0
+
+        with self._lock:
+            postings = [self._postings.get(word) for word in words]
+
+            if not self._numbers or not all(postings):
+                return [], 0
+
+            post_count = len(self._numbers)
+            norms = self._length_norms()
+            scores = None
+
+            # Start with the rarest word, as no other post can match
+            for numbers, word_counts in sorted(
+                postings, key=lambda posting: len(posting[0])
+            ):
+                # Removed posts still count here, until the next reload
+                frequency = min(len(numbers), post_count)
+                weight = (BM25_K1 + 1) * math.log(
+                    1 + (post_count - frequency + 0.5) / (frequency + 0.5)
+                )
+
+                if scores is None:
+                    scores = {
+                        number: weight * count / (count + norms[number])
+                        for number, count in zip(numbers, word_counts)
+                        if norms[number] is not None
+                    }
+                else:
+                    scores = {
+                        number: scores[number]
+                        + weight * count / (count + norms[number])
+                        for number, count in zip(numbers, word_counts)
+                        if number in scores
+                    }
+
+                if not scores:
+                    return [], 0
+
+            # Only the posts up to the end of the page need sorting.
+            # For equal scores, the most recently modified comes first.
+            start = (page - 1) * per_page
+            ranked = heapq.nlargest(
+                start + per_page, scores.items(), key=itemgetter(1, 0)
+            )
+
+            return (
+                [self._post_ids[number] for number, score in ranked[start:]],
+                len(scores),
+            )
+
+
+index = SearchIndex()
+
+
+def fetch_posts(modified_after=None):
+    """
+    Every post (or those modified after an ISO date), from the post
+    mirror if it's turned on, or otherwise from the API with only
+    the fields the index needs
+    """
+
+    if post_mirror.POST_MIRROR_REFRESH_INTERVAL:
+        # Rather than fetching every post twice when the worker starts
+        post_mirror.loaded.wait()
+
+        return post_mirror.mirror.modified_since(modified_after)
+
+    return api.get_modified_posts(
+        modified_after, {"_fields": ",".join(POST_FIELDS)}
+    )
+
+
+def _tags():
+    """
+    The taxonomy index of tags, or a copy of all tags
+    if that index hasn't been loaded (or is turned off)
+    """
+
+    if len(taxonomy.tags):
+        return taxonomy.tags
+
+    tags = taxonomy.TaxonomyIndex("tags", taxonomy.tags.fetch)
+    tags.load()
+
+    return tags
+
+
+def _add_all(search_index, posts):
+    posts = list(posts)
+    tag_ids = set(tag_id for post in posts for tag_id in post.get("tags", []))
+    tag_names = {tag["id"]: tag["name"] for tag in _tags().get_loaded(tag_ids)}
+
+    for post in posts:
+        search_index.add(post, tag_names)
+
+
+def load():
+    """
+    Build a new index of every post, then replace the current one
+    """
+
+    global index
+
+    new_index = SearchIndex()
+    _add_all(new_index, fetch_posts())
+    new_index.loaded_at = time.time()
+    index = new_index
+
+
+def refresh():
+    """
+    Add posts modified since the last load or refresh to the index
+    """
+
+    _add_all(index, fetch_posts(modified_after=index.modified_after))
+
+
+def _mirror_refreshed(posts, removed_ids):
+    """
+    Update the index with the changes from a refresh of the post mirror,
+    which are the only way it learns of posts being removed
+    """
+
+    for post_id in removed_ids:
+        index.remove(post_id)
+
+    _add_all(index, posts)
+
+
+def start_background_refresh(interval=SEARCH_INDEX_REFRESH_INTERVAL):
+    """
+    Load the index in a background thread, then refresh it
+    every `interval` seconds, and reload it every day
+    """
+
+    if not interval:
+        return
+
+    if post_mirror.POST_MIRROR_REFRESH_INTERVAL:
+        post_mirror.listeners.append(_mirror_refreshed)
+
+    logger = logging.getLogger(__name__)
+
+    def refresh_forever():
+        while True:
+            try:
+                if (
+                    not index.loaded_at
+                    or time.time() - index.loaded_at > FULL_RELOAD_INTERVAL
+                ):
+                    load()
+                else:
+                    refresh()
+            except Exception as refresh_error:
+                logger.warning(
+                    "Failed to update the search index: {}".format(
+                        str(refresh_error)
+                    )
+                )
+
+            time.sleep(interval)
+
+    threading.Thread(
+        target=refresh_forever, name="search-index-refresh", daemon=True
+    ).start()
@@ -0,0 +1,155 @@
+# Core
+import logging
+import os
+import threading
+import time
+from collections import Counter
+
+# Local
+import api
+import helpers
+
+# How often to reload every index from the API, in seconds.
+# 0 turns the indexes off, so every lookup goes to the API.
+TAXONOMY_REFRESH_INTERVAL = int(os.getenv("TAXONOMY_REFRESH_INTERVAL", 3600))
+
+
+class TaxonomyIndex:
+    """
+    An in-memory copy of every term in a WordPress taxonomy
+    (or every user), for looking terms up by slug or ID without
+    an API call.
+
+    Until the index has been loaded, or if a term is missing from it,
+    lookups fall back to the API.
+    """
+
+    def __init__(self, endpoint, fetch):
+        """
+        :param endpoint: The API endpoint listing all terms, e.g. "tags"
+        :param fetch: The function to query the API for specific terms,
+                      accepting `slugs` or `ids`, e.g. api.get_tags
+        """
+
+        self.endpoint = endpoint
+        self.fetch = fetch
+        self.stats = Counter()
+        self.loaded_at = None
+        self._stats_lock = threading.Lock()
+
+        # Replaced in a single assignment on every load,
+        # so readers never see a half-built index
+        self._index = ({}, {})
+
+    def __len__(self):
+        return len(self._index[1])
+
+    def load(self):
+        """
+        Page through the whole endpoint and replace the index
+        """
+
+        terms = []
+        page = 1
+        total_pages = 1
+
+        while page <= total_pages:
+            response = api.get(self.endpoint, {"per_page": 100, "page": page})
+            terms.extend(response.json())
+            total_pages = helpers.to_int(
+                response.headers.get("X-WP-TotalPages"), default=1
+            )
+            page += 1
+
+        self._index = (
+            {term["slug"]: term for term in terms},
+            {term["id"]: term for term in terms},
+        )
+        self.loaded_at = time.time()
+
+    def get(self, slugs=[], ids=[]):
+        """
+        Get a list of terms by slugs or by IDs, from the index if
+        they're all in it, or otherwise from the API
+        """
+
+        by_slug, by_id = self._index
+
+        if slugs:
+            terms = [by_slug.get(slug) for slug in slugs]
+        else:
+            terms = [by_id.get(term_id) for term_id in ids]
+
+        if all(terms):
+            self._record("hits")
+
+            return terms
+
+        self._record("misses")
+
+        if slugs:
+            return self.fetch(slugs=slugs)
+
+        return self.fetch(ids=ids)
+
+    def get_loaded(self, ids):
+        """
+        Get the terms with these IDs which are in the index,
+        without falling back to the API for any which aren't
+        """
+
+        by_slug, by_id = self._index
+
+        return [by_id[term_id] for term_id in ids if term_id in by_id]
+
+    def _record(self, stat):
+        with self._stats_lock:
+            self.stats[stat] += 1
+
+
+groups = TaxonomyIndex("group", lambda **kwargs: api.get_groups(**kwargs))
+categories = TaxonomyIndex(
+    "categories", lambda **kwargs: api.get_categories(**kwargs)
+)
+tags = TaxonomyIndex("tags", lambda **kwargs: api.get_tags(**kwargs))
+users = TaxonomyIndex("users", lambda **kwargs: api.get_users(**kwargs))
+
+indexes = [groups, categories, tags, users]
+
+
+def load_all():
+    """
+    Load every index, logging (rather than raising) any failures
+    so that one bad endpoint doesn't stop the rest loading
+    """
+
+    logger = logging.getLogger(__name__)
+
+    for index in indexes:
+        try:
+            index.load()
+        except Exception as load_error:
+            logger.warning(
+                "Failed to load {} index: {}".format(
+                    index.endpoint, str(load_error)
+                )
+            )
+
+
+def start_background_refresh(interval=TAXONOMY_REFRESH_INTERVAL):
+    """
+    Load the indexes in a background thread, then reload them
+    every `interval` seconds
+    """
+
+    if not interval:
+        return
+
+    def refresh_forever():
+        while True:
+            load_all()
+            time.sleep(interval)
+
+    threading.Thread(
+        target=refresh_forever, name="taxonomy-refresh", daemon=True
+    ).start()
@@ -0,0 +1,13 @@
+# Core
+import os
+
+
+# The tests point the API at a local stub WordPress, and count the
+# requests it gets, so nothing should be requested in the background
+os.environ.setdefault("TAXONOMY_REFRESH_INTERVAL", "0")
+os.environ.setdefault("UPSTREAM_WARM_CONNECTIONS", "0")
+os.environ.setdefault("PREWARM_ENABLED", "false")
+os.environ.setdefault("SEARCH_INDEX_REFRESH_INTERVAL", "0")
+os.environ.setdefault("POST_MIRROR_REFRESH_INTERVAL", "0")
+os.environ.setdefault("ARCHIVE_INDEX_REFRESH_INTERVAL", "0")
+os.environ.setdefault("RELATED_INDEX_REFRESH_INTERVAL", "0")
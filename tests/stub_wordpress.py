@@ -0,0 +1,726 @@
+# Core
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+UPSTREAM_HOST = "https://admin.insights.ubuntu.com"
+
+GROUPS = [
+    {"id": 1479, "name": "Cloud and Server", "slug": "cloud-and-server"},
+    {"id": 1666, "name": "Internet of Things", "slug": "internet-of-things"},
+    {"id": 1665, "name": "Desktop", "slug": "desktop"},
+    {
+        "id": 2051,
+        "name": "Canonical announcements",
+        "slug": "canonical-announcements",
+    },
+]
+
+CATEGORIES = [
+    {"id": 1453, "name": "Articles", "slug": "articles"},
+    {"id": 1187, "name": "Case Studies", "slug": "case-studies"},
+    {"id": 1485, "name": "White papers", "slug": "white-papers"},
+    {"id": 1175, "name": "Events", "slug": "events"},
+    {"id": 1509, "name": "Webinars", "slug": "webinars"},
+    {"id": 1172, "name": "News", "slug": "news"},
+    {"id": 1190, "name": "Videos", "slug": "videos"},
+]
+
+TAGS = [
+    {"id": 1262, "name": "security", "slug": "security"},
+    {"id": 1304, "name": "MAAS", "slug": "maas"},
+    {"id": 1311, "name": "design", "slug": "design"},
+    {"id": 1291, "name": "juju", "slug": "juju"},
+    {"id": 2080, "name": "snappy", "slug": "snappy"},
+    {"id": 2720, "name": "robotics", "slug": "robotics"},
+    {"id": 2996, "name": "sc:snapcraft.io", "slug": "snapcraft-io"},
+    {"id": 3184, "name": "lang:jp", "slug": "lang-jp"},
+    {"id": 3265, "name": "lang:cn", "slug": "lang-cn"},
+]
+
+USERS = [
+    {"id": 217, "name": "Canonical", "slug": "canonical"},
+    {"id": 301, "name": "Robin Winslow", "slug": "robin"},
+    {"id": 302, "name": "Anthony Dillon", "slug": "anthony-dillon"},
+    {"id": 303, "name": "Igor Ljubuncic", "slug": "igor-ljubuncic"},
+]
+
+TOPICS = [
+    {"id": 4001, "name": "MAAS", "slug": "maas"},
+    {"id": 4002, "name": "Juju", "slug": "juju"},
+]
+
+# Posts whose URLs are used directly by tests/tests.py
+NAMED_POSTS = [
+    ("meltdown-spectre-and-ubuntu-what-you-need-to-know", "2018-01-24"),
+    ("openstack-weekly-update-august-31-2017", "2017-08-31"),
+]
+
+LOREM = (
+    "Ubuntu is an open source software operating system that runs from "
+    "the desktop, to the cloud, to all your internet connected things. "
+)
+
+
+def _user(user):
+    return dict(
+        user,
+        description="",
+        link="{}/author/{}/".format(UPSTREAM_HOST, user["slug"]),
+        avatar_urls={
+            "24": "https://secure.gravatar.com/avatar/{}?s=24".format(
+                user["id"]
+            ),
+            "96": "https://secure.gravatar.com/avatar/{}?s=96".format(
+                user["id"]
+            ),
+        },
+        user_photo="",
+        user_job_title="",
+        user_twitter="",
+        user_facebook="",
+    )
+
+
+def _taxonomy(term, taxonomy):
+    return dict(
+        term,
+        count=0,
+        description="",
+        link="{}/{}/{}/".format(UPSTREAM_HOST, taxonomy, term["slug"]),
+        taxonomy=taxonomy,
+        parent=0,
+    )
+
+
+def _links(post_id, author_id, media_id):
+    """
+    The links WordPress adds to each post it returns
+    """
+
+    api_url = UPSTREAM_HOST + "/wp-json/wp/v2"
+
+    return {
+        "self": [{"href": "{}/posts/{}".format(api_url, post_id)}],
+        "collection": [{"href": api_url + "/posts"}],
+        "about": [{"href": api_url + "/types/post"}],
+        "author": [
+            {
+                "embeddable": True,
+                "href": "{}/users/{}".format(api_url, author_id),
+            }
+        ],
+        "replies": [
+            {
+                "embeddable": True,
+                "href": "{}/comments?post={}".format(api_url, post_id),
+            }
+        ],
+        "wp:featuredmedia": [
+            {
+                "embeddable": True,
+                "href": "{}/media/{}".format(api_url, media_id),
+            }
+        ],
+        "wp:attachment": [
+            {"href": "{}/media?parent={}".format(api_url, post_id)}
+        ],
+        "wp:term": [
+            {
+                "taxonomy": taxonomy,
+                "embeddable": True,
+                "href": "{}/{}?post={}".format(api_url, endpoint, post_id),
+            }
+            for taxonomy, endpoint in [
+                ("category", "categories"),
+                ("post_tag", "tags"),
+            ]
+        ],
+        "curies": [
+            {
+                "name": "wp",
+                "href": "https://api.w.org/{rel}",
+                "templated": True,
+            }
+        ],
+    }
+
+
+def _content(post_id, paragraphs):
+    """
+    Post body HTML of a realistic size, with images in both the plain and
+    the already-cloudinary-proxied forms WordPress produces
+    """
+
+    html = []
+
+    for index in range(paragraphs):
+        html.append("<p>{}</p>\n".format(LOREM * 4))
+
+        if index % 3 == 0:
+            html.append(
+                '<p><img class="aligncenter size-large" '
+                'src="https://assets.ubuntu.com/v1/{}-{}.png" '
+                'alt="" width="1024" height="576" /></p>\n'.format(
+                    post_id, index
+                )
+            )
+        if index % 5 == 0:
+            html.append(
+                '<p><img class="alignnone" '
+                'src="https://res.cloudinary.com/canonical/image/fetch/'
+                "f_auto,q_auto/https://assets.ubuntu.com/v1/"
+                '{}-{}-c.jpg" alt="" /></p>\n'.format(post_id, index)
+            )
+
+    return "".join(html)
+
+
+def generate_corpus(post_count=240, seed=1):
+    """
+    Build a deterministic set of WordPress-shaped post dictionaries
+    (newest first) covering every group, category, tag and author above
+    """
+
+    generator = random.Random(seed)
+    newest = datetime(2019, 6, 1, 9, 30)
+    posts = []
+
+    for index in range(post_count):
+        post_id = 90000 - index
+        date = newest - timedelta(days=index * 3, hours=index % 7)
+        slug = "synthetic-post-{}".format(post_id)
+
+        if index < len(NAMED_POSTS):
+            slug, day = NAMED_POSTS[index]
+            date = datetime.strptime(day, "%Y-%m-%d").replace(hour=10)
+
+        group = GROUPS[index % len(GROUPS)]
+        category = CATEGORIES[index % len(CATEGORIES)]
+        tags = [TAGS[index % 6]["id"], TAGS[(index * 7 + 1) % 6]["id"]]
+
+        if index % 17 == 0:
+            tags.append(2996)
+        if index % 23 == 5:
+            tags.append(3184)
+
+        author = USERS[index % len(USERS)]
+        is_event = category["slug"] in ["events", "webinars"]
+        event_date = date + timedelta(days=30)
+
+        posts.append(
+            {
+                "id": post_id,
+                "date": date.isoformat(),
+                "date_gmt": date.isoformat(),
+                "modified": date.isoformat(),
+                "modified_gmt": date.isoformat(),
+                "guid": {
+                    "rendered": "{}/?p={}".format(UPSTREAM_HOST, post_id)
+                },
+                "slug": slug,
+                "status": "publish",
+                "type": "post",
+                "link": "{}/{}/{}/".format(
+                    UPSTREAM_HOST, date.strftime("%Y/%m/%d"), slug
+                ),
+                "title": {"rendered": slug.replace("-", " ").title()},
+                "content": {
+                    "rendered": _content(post_id, generator.randint(6, 30)),
+                    "protected": False,
+                },
+                "excerpt": {
+                    "rendered": "<p>{} [&hellip;]</p>\n".format(LOREM * 3),
+                    "protected": False,
+                },
+                # The second named post has no author, like the real one
+                "author": 0 if index == 1 else author["id"],
+                "featured_media": post_id + 100000,
+                "comment_status": "closed",
+                "ping_status": "closed",
+                "sticky": index % 40 == 3,
+                "template": "",
+                "format": "standard",
+                "meta": [],
+                "categories": [category["id"]],
+                "tags": tags,
+                "group": [group["id"]],
+                "topic": [TOPICS[index % 2]["id"]] if index % 9 == 0 else [],
+                "_start_day": event_date.strftime("%d") if is_event else "",
+                "_start_month": str(event_date.month) if is_event else "",
+                "_start_year": str(event_date.year) if is_event else "",
+                "_end_day": event_date.strftime("%d") if is_event else "",
+                "_end_month": str(event_date.month) if is_event else "",
+                "_end_year": str(event_date.year) if is_event else "",
+                "_event_venue": "Online" if is_event else "",
+                "_event_location": "London" if is_event else "",
+                "_links": _links(post_id, author["id"], post_id + 100000),
+                "_embedded": {
+                    "author": [] if index == 1 else [_user(author)],
+                    "wp:featuredmedia": [
+                        {
+                            "id": post_id + 100000,
+                            "source_url": (
+                                "https://assets.ubuntu.com/v1/"
+                                "{}-featured.jpg".format(post_id)
+                            ),
+                            "alt_text": "",
+                            "media_details": {
+                                "width": 1200,
+                                "height": 600,
+                                "sizes": {
+                                    size: {
+                                        "source_url": (
+                                            "https://assets.ubuntu.com/v1/"
+                                            "{}-{}.jpg".format(post_id, size)
+                                        ),
+                                        "width": width,
+                                    }
+                                    for size, width in [
+                                        ("thumbnail", 150),
+                                        ("medium", 300),
+                                        ("large", 1024),
+                                        ("full", 1200),
+                                    ]
+                                },
+                            },
+                        }
+                    ],
+                    "wp:term": [
+                        [_taxonomy(category, "category")],
+                        [
+                            _taxonomy(tag, "post_tag")
+                            for tag in TAGS
+                            if tag["id"] in tags
+                        ],
+                    ],
+                },
+            }
+        )
+
+    return posts
+
+
+def load_fixtures(path):
+    """
+    Load responses recorded from a real WordPress API by
+    benchmarks/record_fixtures.py: a JSON object with lists of
+    "posts" (with "_embedded"), "categories", "tags", "group", "topic"
+    and "users"
+    """
+
+    with open(path) as fixtures_file:
+        return json.load(fixtures_file)
+
+
+def _ids(value):
+    return [int(item) for item in value.split(",") if item]
+
+
+def _slugs(value):
+    return [item for item in value.split(",") if item]
+
+
+class StubWordPress:
+    """
+    A local, threaded HTTP server imitating the parts of the WordPress
+    REST API (and RSS feeds) on admin.insights.ubuntu.com that the app uses.
+
+    Every request is counted in `hits` (by path) so tests and benchmarks
+    can see exactly how many upstream calls were made, and every
+    connection in `connection_count`.
+
+    Given an `ssl_context`, it serves HTTPS, so each connection
+    costs a TLS handshake.
+
+    It serves a generated corpus of posts, unless given the path to
+    `fixtures` recorded from the real API (see load_fixtures).
+
+    Usage:
+
+        with StubWordPress() as wordpress:
+            os.environ["INSIGHTS_ADMIN_URL"] = wordpress.url
+            ...
+            print(wordpress.request_count)
+    """
+
+    def __init__(
+        self,
+        posts=None,
+        tags=None,
+        latency=0,
+        port=0,
+        ssl_context=None,
+        fixtures=None,
+    ):
+        if fixtures:
+            recorded = load_fixtures(fixtures)
+            self.posts = recorded["posts"]
+            self.terms = {
+                name: recorded[name]
+                for name in ["categories", "tags", "group", "topic", "users"]
+            }
+        else:
+            self.posts = posts if posts is not None else generate_corpus()
+            self.terms = {
+                "categories": [
+                    _taxonomy(term, "category") for term in CATEGORIES
+                ],
+                "tags": [
+                    _taxonomy(term, "post_tag")
+                    for term in (tags if tags is not None else TAGS)
+                ],
+                "group": [_taxonomy(term, "group") for term in GROUPS],
+                "topic": [_taxonomy(term, "topic") for term in TOPICS],
+                "users": [_user(user) for user in USERS],
+            }
+
+        self.latency = latency
+        self.hits = Counter()
+        self.connection_count = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(
+            ("127.0.0.1", port), self._handler_class()
+        )
+        self.server.daemon_threads = True
+        scheme = "http"
+
+        if ssl_context:
+            # Handshake in each connection's own thread, not on accept
+            self.server.socket = ssl_context.wrap_socket(
+                self.server.socket,
+                server_side=True,
+                do_handshake_on_connect=False,
+            )
+            scheme = "https"
+
+        self.url = "{}://127.0.0.1:{}".format(
+            scheme, self.server.server_port
+        )
+        self._thread = None
+
+    @property
+    def request_count(self):
+        with self._lock:
+            return sum(self.hits.values())
+
+    def reset(self):
+        with self._lock:
+            self.hits.clear()
+            self.connection_count = 0
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self.server.serve_forever, daemon=True
+        )
+        self._thread.start()
+
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def _count(self, path):
+        with self._lock:
+            self.hits[path] += 1
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def setup(self):
+                with stub._lock:
+                    stub.connection_count += 1
+
+                super().setup()
+
+            def do_HEAD(self):
+                stub._count(urlsplit(self.path).path)
+
+                if stub.latency:
+                    time.sleep(stub.latency)
+
+                self.send_response(200)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                stub._count(url.path)
+
+                if stub.latency:
+                    time.sleep(stub.latency)
+
+                query = {
+                    key: values[0]
+                    for key, values in parse_qs(url.query).items()
+                }
+                status, headers, body = stub.respond(url.path, query)
+                self.send_response(status)
+
+                for name, value in headers.items():
+                    self.send_header(name, value)
+
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+    def respond(self, path, query):
+        """
+        Route a request path and query to a (status, headers, body) response
+        """
+
+        api_prefix = "/wp-json/wp/v2/"
+
+        if path.endswith("/feed"):
+            return self._feed()
+
+        if not path.startswith(api_prefix):
+            return self._json({"code": "rest_no_route"}, status=404)
+
+        endpoint = path.replace(api_prefix, "", 1).strip("/")
+
+        if endpoint == "posts":
+            return self._posts(path, query)
+
+        name, _, term_id = endpoint.partition("/")
+
+        if name in self.terms:
+            terms = self.terms[name]
+
+            if term_id:
+                for term in terms:
+                    if str(term["id"]) == term_id:
+                        return self._json(term)
+
+                return self._json({"code": "rest_term_invalid"}, status=404)
+
+            # Each taxonomy's endpoint is named after the posts' field
+            if "post" in query:
+                post = self._post_by_id(int(query["post"]))
+                term_ids = post.get(name, []) if post else []
+                terms = [term for term in terms if term["id"] in term_ids]
+
+            return self._terms(path, terms, query)
+
+        return self._json({"code": "rest_no_route"}, status=404)
+
+    def _post_by_id(self, post_id):
+        for post in self.posts:
+            if post["id"] == post_id:
+                return post
+
+    def _terms(self, path, terms, query):
+        if query.get("slug"):
+            slugs = _slugs(query["slug"])
+            terms = [term for term in terms if term["slug"] in slugs]
+
+        if query.get("include"):
+            include = _ids(query["include"])
+            terms = [term for term in terms if term["id"] in include]
+
+        return self._paginated(path, terms, query, per_page_default=10)
+
+    def _posts(self, path, query):
+        posts = self.posts
+        filters = [
+            ("slug", _slugs, lambda post, values: post["slug"] in values),
+            ("include", _ids, lambda post, values: post["id"] in values),
+            ("exclude", _ids, lambda post, values: post["id"] not in values),
+            (
+                "categories",
+                _ids,
+                lambda post, values: set(post["categories"]) & set(values),
+            ),
+            (
+                "tags",
+                _ids,
+                lambda post, values: set(post["tags"]) & set(values),
+            ),
+            (
+                "tags_exclude",
+                _ids,
+                lambda post, values: not set(post["tags"]) & set(values),
+            ),
+            (
+                "group",
+                _ids,
+                lambda post, values: set(post["group"]) & set(values),
+            ),
+            ("author", _ids, lambda post, values: post["author"] in values),
+            ("before", str, lambda post, value: post["date"] < value),
+            ("after", str, lambda post, value: post["date"] > value),
+            (
+                "search",
+                str.lower,
+                lambda post, value: value in post["title"]["rendered"].lower()
+                or value in post["content"]["rendered"].lower(),
+            ),
+            (
+                "modified_after",
+                str,
+                lambda post, value: post["modified"] > value,
+            ),
+        ]
+
+        for name, parse, matches in filters:
+            if query.get(name):
+                value = parse(query[name])
+                posts = [post for post in posts if matches(post, value)]
+
+        if query.get("sticky"):
+            sticky = query["sticky"].lower() in ["true", "1"]
+            posts = [post for post in posts if post["sticky"] == sticky]
+
+        # Newest first, like WordPress, unless asked otherwise
+        order_field = "date"
+
+        if query.get("orderby") == "modified":
+            order_field = "modified"
+
+        posts = sorted(
+            posts,
+            key=lambda post: (post[order_field], post["id"]),
+            reverse=query.get("order") != "asc",
+        )
+
+        if not query.get("_embed"):
+            posts = [
+                {
+                    key: value
+                    for key, value in post.items()
+                    if key != "_embedded"
+                }
+                for post in posts
+            ]
+
+        if query.get("_fields"):
+            fields = query["_fields"].split(",")
+            posts = [
+                {key: post[key] for key in fields if key in post}
+                for post in posts
+            ]
+
+        return self._paginated(path, posts, query, per_page_default=10)
+
+    def _paginated(self, path, items, query, per_page_default):
+        per_page = min(int(query.get("per_page") or per_page_default), 100)
+        page = int(query.get("page") or 1)
+        total = len(items)
+        total_pages = int(math.ceil(total / per_page))
+
+        if page < 1 or (page > 1 and page > total_pages):
+            return self._json(
+                {
+                    "code": "rest_post_invalid_page_number",
+                    "message": (
+                        "The page number requested is larger than "
+                        "the number of pages available."
+                    ),
+                    "data": {"status": 400},
+                },
+                status=400,
+            )
+
+        end = page * per_page
+        headers = {
+            "X-WP-Total": str(total),
+            "X-WP-TotalPages": str(total_pages),
+            "Access-Control-Expose-Headers": "X-WP-Total, X-WP-TotalPages",
+            "Allow": "GET",
+        }
+        links = [
+            '<{}{}?{}>; rel="{}"'.format(
+                UPSTREAM_HOST, path, urlencode(dict(query, page=number)), rel
+            )
+            for number, rel in [(page - 1, "prev"), (page + 1, "next")]
+            if 1 <= number <= total_pages
+        ]
+
+        if links:
+            headers["Link"] = ", ".join(links)
+
+        return self._json(items[end - per_page:end], headers=headers)
+
+    def _feed(self):
+        items = []
+
+        for post in self.posts[:30]:
+            categories = [
+                "<category><![CDATA[{}]]></category>".format(tag["name"])
+                for tag in self.terms["tags"]
+                if tag["id"] in post["tags"]
+            ]
+            items.append(
+                "<item><title>{title}</title><link>{link}</link>"
+                '<guid isPermaLink="false">{host}/?p={id}</guid>'
+                "<pubDate>{date}</pubDate>{categories}"
+                "<description><![CDATA[{excerpt}]]></description>"
+                "</item>".format(
+                    title=post["title"]["rendered"],
+                    link=post["link"],
+                    host=UPSTREAM_HOST,
+                    id=post["id"],
+                    date=datetime.strptime(
+                        post["date_gmt"], "%Y-%m-%dT%H:%M:%S"
+                    ).strftime("%a, %d %b %Y %H:%M:%S +0000"),
+                    categories="".join(categories),
+                    excerpt=post["excerpt"]["rendered"],
+                )
+            )
+
+        body = (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<rss version="2.0"><channel><title>Ubuntu Insights</title>'
+            "<link>{host}</link><description>Ubuntu blog</description>"
+            "{items}</channel></rss>".format(
+                host=UPSTREAM_HOST, items="".join(items)
+            )
+        )
+
+        last_modified = max(
+            [post["modified_gmt"] for post in self.posts[:30]]
+            or ["2018-01-01T00:00:00"]
+        )
+
+        return (
+            200,
+            {
+                "Content-Type": "application/rss+xml; charset=UTF-8",
+                "Last-Modified": datetime.strptime(
+                    last_modified, "%Y-%m-%dT%H:%M:%S"
+                ).strftime("%a, %d %b %Y %H:%M:%S GMT"),
+                "ETag": '"{}"'.format(
+                    hashlib.md5(body.encode("utf-8")).hexdigest()
+                ),
+            },
+            body.encode("utf-8"),
+        )
+
+    def _json(self, data, status=200, headers={}):
+        return (
+            status,
+            dict(headers, **{"Content-Type": "application/json"}),
+            json.dumps(data).encode("utf-8"),
+        )
@@ -0,0 +1,192 @@
+# Core
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+
+# Third-party
+from dateutil.relativedelta import relativedelta
+
+# Local
+import api
+import app
+import archive_index
+import feeds
+import page_cache
+from tests.stub_wordpress import StubWordPress
+
+
+def _post(post_id, date, groups=[], categories=[], tags=[]):
+    return {
+        "id": post_id,
+        "date": date,
+        "modified": date,
+        "group": groups,
+        "categories": categories,
+        "tags": tags,
+    }
+
+
+class ArchiveIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.index = archive_index.ArchiveIndex()
+
+        for post in [
+            _post(1, "2017-12-31T10:00:00", groups=[10], categories=[20]),
+            _post(2, "2018-01-05T10:00:00", groups=[10], categories=[21]),
+            _post(3, "2018-01-20T10:00:00", groups=[11], categories=[20]),
+            _post(4, "2018-03-01T10:00:00", groups=[10], categories=[20]),
+        ]:
+            self.index.add(post)
+
+    def test_find(self):
+        self.assertEqual(self.index.find(), ([4, 3, 2, 1], 4, 1))
+        self.assertEqual(self.index.find(year=2018), ([4, 3, 2], 3, 1))
+        self.assertEqual(self.index.find(2018, 1), ([3, 2], 2, 1))
+        self.assertEqual(self.index.find(2018, 2), ([], 0, 0))
+        self.assertEqual(self.index.find(2099), ([], 0, 0))
+        self.assertEqual(self.index.find(group_id=10), ([4, 2, 1], 3, 1))
+        self.assertEqual(
+            self.index.find(group_id=10, category_id=20), ([4, 1], 2, 1)
+        )
+
+    def test_pagination(self):
+        self.assertEqual(self.index.find(page=2, per_page=3), ([1], 4, 2))
+        self.assertEqual(
+            self.index.find(group_id=10, category_id=20, page=2, per_page=1),
+            ([1], 2, 2),
+        )
+        self.assertEqual(self.index.find(page=3, per_page=3), ([], None, None))
+
+    def test_replace_and_remove(self):
+        self.index.add(_post(2, "2018-03-02T10:00:00", groups=[11]))
+        self.index.add(_post(3, "2018-01-20T10:00:00", tags=[3184]))
+        self.index.remove(4)
+
+        self.assertEqual(self.index.find(2018), ([2], 1, 1))
+        self.assertEqual(self.index.find(group_id=10), ([1], 1, 1))
+        self.assertEqual(self.index.modified_after, "2018-03-02T10:00:00")
+        self.assertEqual(len(self.index), 2)
+
+    def test_calendar(self):
+        self.assertEqual(
+            self.index.calendar(),
+            [(2018, 3, [(1, 2), (3, 1)]), (2017, 1, [(12, 1)])],
+        )
+        self.assertEqual(
+            self.index.calendar(group_id=10, category_id=20),
+            [(2018, 1, [(3, 1)]), (2017, 1, [(12, 1)])],
+        )
+        self.assertEqual(self.index.calendar(category_id=99), [])
+
+
+class ArchivesViewTestCase(unittest.TestCase):
+    def setUp(self):
+        self.wordpress = StubWordPress().start()
+        api_url_patch = patch.object(
+            api, "API_URL", self.wordpress.url + "/wp-json/wp/v2"
+        )
+        api_url_patch.start()
+        self.addCleanup(api_url_patch.stop)
+        index_patch = patch.object(
+            archive_index, "index", archive_index.ArchiveIndex()
+        )
+        index_patch.start()
+        self.addCleanup(index_patch.stop)
+        cache_patch = patch.object(
+            page_cache, "cache", page_cache.PageCache(1024 * 1024, ttl=60)
+        )
+        cache_patch.start()
+        self.addCleanup(cache_patch.stop)
+        feeds.cached_session.cache.clear()
+
+    def tearDown(self):
+        self.wordpress.stop()
+
+    def test_listings_match_the_api(self):
+        archive_index.load()
+        post = self.wordpress.posts[7]
+
+        for year, month, group_id, category_id, page in [
+            (2018, 1, None, None, 1),
+            (2018, None, None, None, 2),
+            (2017, None, post["group"][0], None, 1),
+            (2017, None, post["group"][0], post["categories"][0], 1),
+            (None, None, None, post["categories"][0], 3),
+        ]:
+            after = before = None
+
+            if year:
+                after = datetime(year, month or 1, 1)
+                before = after + relativedelta(months=1 if month else 12)
+
+            posts, total_posts, total_pages = api.get_posts(
+                page=page,
+                after=after,
+                before=before,
+                group_ids=[group_id] if group_id else [],
+                category_ids=[category_id] if category_id else [],
+            )
+
+            with self.subTest(year=year, month=month, page=page):
+                self.assertEqual(
+                    archive_index.index.find(
+                        year, month, group_id, category_id, page
+                    ),
+                    (
+                        [post["id"] for post in posts],
+                        total_posts,
+                        total_pages,
+                    ),
+                )
+
+    def test_refresh_purges_pages(self):
+        archive_index.load()
+
+        # Nothing modified yet, then the same poll again once there is
+        archive_index.refresh()
+        post = self.wordpress.posts[7]
+        previous_categories = post["categories"]
+        post["categories"] = [1172]
+        post["modified"] = "2099-01-01T00:00:00"
+
+        with patch("page_cache.purge") as purge:
+            archive_index.refresh()
+
+        self.assertEqual(purge.call_args[1]["posts"], [post["id"]])
+        self.assertEqual(
+            purge.call_args[1]["categories"], set(previous_categories + [1172])
+        )
+        self.assertEqual(
+            archive_index.index.find(category_id=1172, per_page=100)[0][0],
+            post["id"],
+        )
+
+    def test_updated_with_the_post_mirror(self):
+        archive_index.load()
+        post = self.wordpress.posts[7]
+        year = int(post["date"][:4])
+
+        archive_index._mirror_refreshed([], {post["id"]})
+        removed_ids, _, _ = archive_index.index.find(year, per_page=100)
+        archive_index._mirror_refreshed([post], set())
+        added_ids, _, _ = archive_index.index.find(year, per_page=100)
+
+        self.assertNotIn(post["id"], removed_ids)
+        self.assertIn(post["id"], added_ids)
+
+    def test_archives_view(self):
+        archive_index.load()
+        self.wordpress.reset()
+        client = app.app.test_client()
+
+        response = client.get("/archives?year=2099")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.wordpress.hits["/wp-json/wp/v2/posts"], 0)
+
+        response = client.get("/archives?year=2018&month=1")
+
+        self.assertIn(b"Meltdown Spectre", response.data)
+        self.assertIn(b"/archives?year=2018&amp;month=1", response.data)
+        self.assertNotIn(b"/archives?year=2020", response.data)
+        self.assertEqual(self.wordpress.hits["/wp-json/wp/v2/posts"], 1)
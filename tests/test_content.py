@@ -0,0 +1,103 @@
+# Core
+import random
+import re
+import unittest
+
+# Local
+import content
+from tests.stub_wordpress import generate_corpus
+
+
+LEGACY_CLOUDINARY = (
+    "https://res.cloudinary.com/" "canonical/image/fetch/q_auto,f_auto,"
+)
+
+
+def legacy_remove_cloudinary_urls(html):
+    """
+    The regular expression format_post used to remove Cloudinary URLs
+    """
+
+    return re.sub(
+        r'img(.*)src="https://res.cloudinary.com/canonical'
+        r'(.[^http]*)/http(.[^"]*)"',
+        r'img\1 src="\3"',
+        html,
+    )
+
+
+def legacy_rewrite_images(html):
+    """
+    The regular expressions format_post used to rewrite images
+    """
+
+    return re.sub(
+        r"img(.*) src=\"(.[^\"]*)\"",
+        r'img\1 decoding="async" src="{url}w_560/\2"'
+        r'srcset="{url}w_375/\2 375w,'
+        r'{url}w_480/\2 480w, {url}w_560/\2 560w"'
+        r'sizes="(max-width: 375px) 280px,'
+        r"(max-width: 480px) 440px,"
+        r'560px"'.format(url=LEGACY_CLOUDINARY),
+        legacy_remove_cloudinary_urls(html),
+    )
+
+
+class RewriteImagesTestCase(unittest.TestCase):
+    # Fragments which exercise the edge cases of the old expressions
+    fragments = [
+        "img",
+        "<img ",
+        ' src="',
+        'src="https://res.cloudinary.com/canonical',
+        "/http",
+        "s://assets.ubuntu.com/v1/a.png",
+        "/w_560",
+        "/image/fetch",
+        '"',
+        "\n",
+        ">",
+        " ",
+        "h",
+        "t",
+        "p",
+        "x",
+    ]
+
+    def test_matches_legacy_expressions_on_posts(self):
+        for post in generate_corpus(post_count=30):
+            html = post["content"]["rendered"]
+
+            self.assertEqual(
+                content.rewrite_images(html), legacy_rewrite_images(html)
+            )
+
+    def test_matches_legacy_expressions_on_fragments(self):
+        generator = random.Random(0)
+
+        for iteration in range(20000):
+            html = "".join(
+                generator.choice(self.fragments)
+                for index in range(generator.randint(0, 20))
+            )
+
+            self.assertEqual(
+                content.remove_cloudinary_urls(html),
+                legacy_remove_cloudinary_urls(html),
+                html,
+            )
+            self.assertEqual(
+                content.rewrite_images(html), legacy_rewrite_images(html), html
+            )
+
+    def test_tidy_summary(self):
+        self.assertEqual(
+            content.tidy_summary(
+                '<h2>Title</h2><p><img src="a.png" />Text [&hellip;]</p>'
+            ),
+            "<p>Title</p><p>>Text &hellip;</p>",
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
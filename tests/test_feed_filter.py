@@ -0,0 +1,129 @@
+# Core
+import unittest
+from unittest.mock import patch
+
+# Local
+import api
+import app
+import feed_filter
+import feeds
+import lru
+from tests.stub_wordpress import StubWordPress
+
+
+FEED = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<rss version="2.0" xmlns:dc="http://purl.org/dc/elements/1.1/">'
+    "<channel><title>Ubuntu Insights</title>"
+    "<link>https://admin.insights.ubuntu.com</link>"
+    "<item><title>One</title>"
+    "<link>https://admin.insights.ubuntu.com/one/</link>"
+    "<category><![CDATA[security]]></category>"
+    "<dc:creator>Canonical</dc:creator></item>"
+    "<item><title>Two</title>"
+    "<category><![CDATA[lang:cn]]></category></item>"
+    "<item><title>Three &amp; more</title>"
+    "<category>maas</category><category>lang:jp</category></item>"
+    '<item><title>Four</title><guid isPermaLink="false">'
+    "https://admin.insights.ubuntu.com/?p=4</guid></item>"
+    "</channel></rss>"
+).encode("utf-8")
+
+
+def filter_in_chunks(feed, size):
+    chunks = [feed[start:][:size] for start in range(0, len(feed), size)]
+
+    return b"".join(feed_filter.filter_feed(chunks)).decode("utf-8")
+
+
+class FilterFeedTestCase(unittest.TestCase):
+    def test_removes_excluded_items(self):
+        output = filter_in_chunks(FEED, len(FEED))
+
+        self.assertIn("<title>One</title>", output)
+        self.assertIn("<title>Four</title>", output)
+        self.assertNotIn("<title>Two</title>", output)
+        self.assertNotIn("Three", output)
+        self.assertEqual(output.count("<item>"), 2)
+        self.assertIn("<dc:creator>Canonical</dc:creator>", output)
+
+    def test_replaces_admin_hostname(self):
+        output = filter_in_chunks(FEED, len(FEED))
+
+        self.assertNotIn("admin.insights", output)
+        self.assertIn("<link>https://insights.ubuntu.com/one/</link>", output)
+        self.assertIn(
+            '<guid isPermaLink="false">https://insights.ubuntu.com/?p=4',
+            output,
+        )
+
+    def test_output_independent_of_chunk_size(self):
+        expected = filter_in_chunks(FEED, len(FEED))
+
+        for size in [1, 7, 64]:
+            self.assertEqual(filter_in_chunks(FEED, size), expected)
+
+    def test_invalid_feed(self):
+        with self.assertRaises(Exception):
+            list(feed_filter.filter_feed([b"<html><p>Error</html>"]))
+
+
+class FeedViewTestCase(unittest.TestCase):
+    def setUp(self):
+        self.wordpress = StubWordPress().start()
+        url_patch = patch.object(api, "INSIGHTS_ADMIN_URL", self.wordpress.url)
+        url_patch.start()
+        self.addCleanup(url_patch.stop)
+        cache_patch = patch.object(
+            feed_filter, "filtered_feeds", lru.LRUCache(maxsize=5)
+        )
+        cache_patch.start()
+        self.addCleanup(cache_patch.stop)
+        feeds.cached_session.cache.clear()
+        self.client = app.app.test_client()
+
+    def tearDown(self):
+        self.wordpress.stop()
+
+    def test_filtered_once(self):
+        with patch.object(
+            feed_filter, "filter_feed", wraps=feed_filter.filter_feed
+        ) as filter_feed:
+            first = self.client.get("/feed", buffered=True)
+            second = self.client.get("/feed")
+
+        self.assertEqual(filter_feed.call_count, 1)
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(first.headers["ETag"], second.headers["ETag"])
+        self.assertIn("Last-Modified", first.headers)
+        self.assertEqual(self.wordpress.hits["/feed"], 1)
+
+    def test_conditional_requests(self):
+        first = self.client.get("/feed")
+
+        with patch.object(feed_filter, "filter_feed") as filter_feed:
+            by_etag = self.client.get(
+                "/feed", headers={"If-None-Match": first.headers["ETag"]}
+            )
+            by_date = self.client.get(
+                "/feed",
+                headers={"If-Modified-Since": first.headers["Last-Modified"]},
+            )
+
+        filter_feed.assert_not_called()
+        self.assertEqual(by_etag.status_code, 304)
+        self.assertEqual(by_date.status_code, 304)
+        self.assertEqual(by_etag.data, b"")
+
+    def test_new_upstream_version_filtered_again(self):
+        first = self.client.get("/feed", buffered=True)
+        self.wordpress.posts[0]["title"]["rendered"] = "Changed"
+        feeds.cached_session.cache.clear()
+        second = self.client.get("/feed")
+
+        self.assertNotEqual(first.headers["ETag"], second.headers["ETag"])
+        self.assertIn(b"<title>Changed</title>", second.data)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,300 @@
+# Core
+import asyncio
+import contextvars
+import datetime
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+# Local
+import feeds
+from tests.stub_wordpress import StubWordPress
+
+
+class StaleWhileRevalidateTestCase(unittest.TestCase):
+    def setUp(self):
+        self.wordpress = StubWordPress(latency=0.2).start()
+        self.url = self.wordpress.url + "/wp-json/wp/v2/tags?slug=security"
+        ttls = {
+            "CACHE_SOFT_TTL": datetime.timedelta(0),
+            "CACHE_HARD_TTL": datetime.timedelta(hours=1),
+        }
+
+        for name, value in ttls.items():
+            ttl_patch = patch.object(feeds, name, value)
+            ttl_patch.start()
+            self.addCleanup(ttl_patch.stop)
+
+    def tearDown(self):
+        self.wordpress.stop()
+
+    def test_stale_response_served_and_refreshed_once(self):
+        # Warm the cache
+        feeds.cached_request(self.url)
+        self.assertEqual(self.wordpress.request_count, 1)
+        stale_count = feeds.cache_stats["stale"]
+
+        # The entry is immediately past its soft TTL, so both of these
+        # should be served from the cache without waiting for upstream
+        start = time.time()
+        first = feeds.cached_request(self.url)
+        second = feeds.cached_request(self.url)
+        request_time = time.time() - start
+
+        self.assertEqual(first.json(), second.json())
+        self.assertLess(request_time, 0.2)
+        self.assertEqual(feeds.cache_stats["stale"], stale_count + 2)
+
+        # Only one background refresh for the URL was started
+        time.sleep(0.5)
+        self.assertEqual(self.wordpress.request_count, 2)
+
+
+class UncachedRequestTestCase(unittest.TestCase):
+    def setUp(self):
+        self.wordpress = StubWordPress().start()
+        feeds.cached_session.cache.clear()
+
+    def tearDown(self):
+        self.wordpress.stop()
+
+    def test_never_cached(self):
+        url = self.wordpress.url + "/wp-json/wp/v2/posts?per_page=100"
+
+        first = feeds.uncached_request(url)
+        second = feeds.uncached_request(url)
+
+        self.assertFalse(getattr(second, "from_cache", False))
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(feeds.cache_size()["entries"], 0)
+        self.assertEqual(self.wordpress.request_count, 2)
+
+
+class SingleFlightTestCase(unittest.TestCase):
+    callers = 50
+
+    def setUp(self):
+        self.wordpress = StubWordPress(latency=0.3).start()
+
+    def tearDown(self):
+        self.wordpress.stop()
+
+    def _call_concurrently(self, url):
+        """
+        Request a URL from many threads at once,
+        returning the responses and errors
+        """
+
+        barrier = threading.Barrier(self.callers)
+        responses = []
+        errors = []
+
+        def call():
+            barrier.wait()
+
+            try:
+                responses.append(feeds.cached_request(url))
+            except Exception as request_error:
+                errors.append(request_error)
+
+        threads = [
+            threading.Thread(target=call) for index in range(self.callers)
+        ]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        return responses, errors
+
+    def test_concurrent_callers_share_one_upstream_request(self):
+        url = self.wordpress.url + "/wp-json/wp/v2/posts?slug=single-flight"
+        coalesced_count = feeds.cache_stats["coalesced"]
+
+        responses, errors = self._call_concurrently(url)
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(responses), self.callers)
+        self.assertEqual(self.wordpress.request_count, 1)
+        self.assertGreater(feeds.cache_stats["coalesced"], coalesced_count)
+
+    def test_concurrent_callers_share_errors(self):
+        url = self.wordpress.url + "/wp-json/wp/v2/group/404"
+
+        responses, errors = self._call_concurrently(url)
+
+        self.assertEqual(responses, [])
+        self.assertEqual(len(errors), self.callers)
+        self.assertEqual(self.wordpress.request_count, 1)
+
+
+class ConnectionPoolTestCase(unittest.TestCase):
+    def setUp(self):
+        self.wordpress = StubWordPress(latency=0.1).start()
+        feeds.cached_session.cache.clear()
+
+        # A fresh pool, so the connection stats only count these tests
+        adapter_patch = patch.dict(
+            feeds.cached_session.adapters,
+            {"http://": feeds.upstream_adapter(pool_maxsize=4)},
+        )
+        adapter_patch.start()
+        self.addCleanup(adapter_patch.stop)
+
+    def tearDown(self):
+        self.wordpress.stop()
+
+    def _request_concurrently(self, count, slug):
+        barrier = threading.Barrier(count)
+
+        def request(index):
+            barrier.wait()
+            feeds.cached_request(
+                "{}/wp-json/wp/v2/tags?slug={}-{}".format(
+                    self.wordpress.url, slug, index
+                )
+            )
+
+        threads = [
+            threading.Thread(target=request, args=(index,))
+            for index in range(count)
+        ]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+    def test_connections_kept_alive(self):
+        for slug in ["ubuntu", "snap", "juju"]:
+            self._request_concurrently(4, slug)
+
+        self.assertEqual(self.wordpress.connection_count, 4)
+        self.assertEqual(
+            feeds.connection_stats(),
+            {"requests": 12, "new_connections": 4, "reused_connections": 8},
+        )
+
+    def test_warm_up_connections(self):
+        feeds.warm_up_connections(self.wordpress.url, count=4)
+
+        self.assertEqual(self.wordpress.connection_count, 4)
+
+        self._request_concurrently(4, "ubuntu")
+
+        self.assertEqual(self.wordpress.connection_count, 4)
+        self.assertEqual(feeds.connection_stats()["reused_connections"], 4)
+
+
+class AsyncUpstreamTestCase(unittest.TestCase):
+    callers = 50
+
+    def setUp(self):
+        self.wordpress = StubWordPress(latency=0.3).start()
+        self.loop = asyncio.new_event_loop()
+        feeds.cached_session.cache.clear()
+
+    def tearDown(self):
+        self.loop.run_until_complete(feeds.close_async_upstream())
+        self.loop.close()
+        self.wordpress.stop()
+
+    def test_concurrent_coroutines_share_one_upstream_request(self):
+        url = self.wordpress.url + "/wp-json/wp/v2/posts?slug=async"
+
+        async def call_concurrently():
+            return await asyncio.gather(
+                *[feeds.cached_request_async(url) for index in range(50)]
+            )
+
+        responses = self.loop.run_until_complete(call_concurrently())
+
+        self.assertEqual(len(responses), 50)
+        self.assertEqual(responses[0].json(), responses[-1].json())
+        self.assertEqual(self.wordpress.request_count, 1)
+
+        # The response is cached for synchronous callers too
+        self.assertTrue(feeds.cached_request(url).from_cache)
+        self.assertEqual(self.wordpress.request_count, 1)
+
+    def test_errors_raised(self):
+        url = self.wordpress.url + "/wp-json/wp/v2/group/404"
+
+        with self.assertRaises(feeds.requests.HTTPError):
+            self.loop.run_until_complete(feeds.cached_request_async(url))
+
+    def test_synchronous_callers_in_async_mode(self):
+        url = self.wordpress.url + "/wp-json/wp/v2/tags?slug=security"
+
+        with patch.object(feeds, "ASYNC_UPSTREAM", True):
+            first = feeds.cached_request(url)
+            second = feeds.cached_request(url)
+
+        feeds.run_async(feeds.close_async_upstream())
+
+        self.assertFalse(first.from_cache)
+        self.assertTrue(second.from_cache)
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(self.wordpress.request_count, 1)
+
+    def test_cache_calls_off_the_event_loop(self):
+        url = self.wordpress.url + "/wp-json/wp/v2/posts?slug=threads"
+        cache = feeds.cached_session.cache
+        get_response_and_time = cache.get_response_and_time
+        threads = []
+
+        def record_thread(key):
+            threads.append(threading.current_thread())
+
+            return get_response_and_time(key)
+
+        with patch.object(feeds, "CACHE_BACKEND", "sqlite"), patch.object(
+            cache, "get_response_and_time", record_thread
+        ):
+            self.loop.run_until_complete(feeds.cached_request_async(url))
+
+        self.assertEqual(len(threads), 1)
+        self.assertIsNot(threads[0], threading.current_thread())
+        self.assertTrue(feeds.cached_request(url).from_cache)
+
+    def test_requests_recorded_with_talisker(self):
+        url = self.wordpress.url + "/wp-json/wp/v2/posts?slug=talisker"
+        hooks = {"response": [feeds.talisker.requests.metrics_response_hook]}
+
+        with patch.object(feeds.cached_session, "hooks", hooks), patch(
+            "talisker.requests.record_request"
+        ) as record_request:
+            response = self.loop.run_until_complete(
+                feeds.cached_request_async(url)
+            )
+
+        record_request.assert_called_once_with(
+            response.request, response, None
+        )
+        self.assertGreater(response.elapsed.total_seconds(), 0)
+
+    def test_run_async_in_callers_context(self):
+        variable = contextvars.ContextVar("variable", default=None)
+        variable.set("caller")
+
+        async def get_variable():
+            return variable.get()
+
+        self.assertEqual(feeds.run_async(get_variable()), "caller")
+        feeds.run_async(feeds.close_async_upstream())
+
+    def test_rss_feed_content(self):
+        entries = self.loop.run_until_complete(
+            feeds.get_rss_feed_content_async(self.wordpress.url + "/feed")
+        )
+
+        self.assertEqual(len(entries), 6)
+        self.assertIn("updated_datetime", entries[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
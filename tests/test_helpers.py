@@ -0,0 +1,96 @@
+# Core
+import copy
+import unittest
+from unittest.mock import patch
+
+# Local
+import api
+import feeds
+import helpers
+import lru
+from tests.stub_wordpress import StubWordPress, generate_corpus
+
+
+class ExpandedPostsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.wordpress = StubWordPress().start()
+        api_url_patch = patch.object(
+            api, "API_URL", self.wordpress.url + "/wp-json/wp/v2"
+        )
+        api_url_patch.start()
+        self.addCleanup(api_url_patch.stop)
+        feeds.cached_session.cache.clear()
+
+    def tearDown(self):
+        self.wordpress.stop()
+
+    def test_constant_upstream_calls_per_page(self):
+        """
+        A page of 12 posts should take one call for the posts,
+        one for their groups and one for their categories
+        """
+
+        posts, _, _ = helpers.get_formatted_expanded_posts(per_page=12)
+
+        self.assertEqual(len(posts), 12)
+        self.assertEqual(self.wordpress.request_count, 3)
+        self.assertEqual(
+            set(self.wordpress.hits),
+            {
+                "/wp-json/wp/v2/posts",
+                "/wp-json/wp/v2/group",
+                "/wp-json/wp/v2/categories",
+            },
+        )
+
+        for post in posts:
+            source = self.wordpress._post_by_id(post["id"])
+            self.assertEqual(post["group"]["id"], source["group"][0])
+            self.assertEqual(post["category"]["id"], source["categories"][0])
+
+    def test_forced_group(self):
+        posts, _, _ = helpers.get_formatted_expanded_posts(group_ids=[1479])
+
+        self.assertTrue(posts)
+        self.assertEqual(self.wordpress.request_count, 3)
+
+        for post in posts:
+            self.assertEqual(post["group"]["slug"], "cloud-and-server")
+
+
+class FormatPostTestCase(unittest.TestCase):
+    def setUp(self):
+        cache_patch = patch.object(
+            helpers, "formatted_posts", lru.LRUCache(maxsize=2)
+        )
+        cache_patch.start()
+        self.addCleanup(cache_patch.stop)
+        self.corpus = generate_corpus(post_count=3)
+
+    def test_formatted_once_per_version(self):
+        post = self.corpus[0]
+        first = helpers.format_post(copy.deepcopy(post))
+        second = helpers.format_post(copy.deepcopy(post))
+
+        self.assertEqual(first, second)
+        self.assertEqual(helpers.formatted_posts.stats["hits"], 1)
+
+        edited = copy.deepcopy(post)
+        edited["modified_gmt"] = "2030-01-01T00:00:00"
+        edited["excerpt"]["rendered"] = "<p>Edited</p>"
+
+        self.assertEqual(
+            helpers.format_post(edited)["summary"], "<p>Edited</p>"
+        )
+        self.assertEqual(helpers.formatted_posts.stats["misses"], 2)
+
+    def test_least_recently_used_evicted(self):
+        for post in self.corpus:
+            helpers.format_post(copy.deepcopy(post))
+
+        self.assertEqual(len(helpers.formatted_posts), 2)
+        self.assertEqual(helpers.formatted_posts.stats["evictions"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
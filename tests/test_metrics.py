@@ -0,0 +1,115 @@
+# Core
+import os
+import socket
+import unittest
+from unittest.mock import patch
+
+# Third-party
+import requests
+
+# Local
+import api
+import app
+import feeds
+import metrics
+import page_cache
+from tests.stub_wordpress import StubWordPress
+
+
+class LatencyStatsTestCase(unittest.TestCase):
+    def test_endpoint(self):
+        self.assertEqual(
+            metrics.endpoint("https://a.com/wp-json/wp/v2/posts/12?x=1"),
+            "/wp-json/wp/v2/posts/<id>",
+        )
+        self.assertEqual(
+            metrics.endpoint("https://a.com/wp-json/wp/v2/tags?slug=1"),
+            "/wp-json/wp/v2/tags",
+        )
+
+    def test_report(self):
+        stats = metrics.LatencyStats(window=100)
+
+        for index in range(1, 201):
+            stats.record("http://a.com/posts", index / 1000, error=index > 190)
+
+        report = stats.report()["/posts"]
+
+        self.assertEqual(report["requests"], 200)
+        self.assertEqual(report["errors"], 10)
+        self.assertEqual(report["error_rate"], 0.05)
+        # Only the latest 100 requests count towards the percentiles
+        self.assertEqual(report["p50_ms"], 150)
+        self.assertEqual(report["p99_ms"], 199)
+
+
+class UpstreamStatsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.wordpress = StubWordPress().start()
+        api_url_patch = patch.object(
+            api, "API_URL", self.wordpress.url + "/wp-json/wp/v2"
+        )
+        api_url_patch.start()
+        self.addCleanup(api_url_patch.stop)
+        stats_patch = patch.object(
+            feeds, "upstream_stats", metrics.LatencyStats()
+        )
+        stats_patch.start()
+        self.addCleanup(stats_patch.stop)
+        page_cache_patch = patch.object(
+            page_cache,
+            "cache",
+            page_cache.PageCache(max_bytes=1024 * 1024, ttl=60),
+        )
+        page_cache_patch.start()
+        self.addCleanup(page_cache_patch.stop)
+        feeds.cached_session.cache.clear()
+
+    def tearDown(self):
+        self.wordpress.stop()
+
+    def test_only_upstream_requests_recorded(self):
+        url = self.wordpress.url + "/wp-json/wp/v2/tags?slug=security"
+        feeds.cached_request(url)
+        feeds.cached_request(url)
+
+        report = feeds.upstream_stats.report()["/wp-json/wp/v2/tags"]
+
+        self.assertEqual(report["requests"], 1)
+        self.assertEqual(report["errors"], 0)
+
+    def test_connection_errors_recorded(self):
+        with socket.socket() as closed:
+            closed.bind(("127.0.0.1", 0))
+            port = closed.getsockname()[1]
+
+        session = requests.Session()
+        session.mount("http://", feeds._MeasuredAdapter())
+
+        with self.assertRaises(requests.ConnectionError):
+            session.get("http://127.0.0.1:{}/feed".format(port))
+
+        self.assertEqual(feeds.upstream_stats.report()["/feed"]["errors"], 1)
+
+    def test_status_metrics(self):
+        client = app.app.test_client()
+        client.get("/press-centre")
+
+        with patch.dict(os.environ, {"CACHE_PURGE_TOKEN": "secret"}):
+            hidden = client.get("/status/metrics")
+            response = client.get(
+                "/status/metrics", headers={"Authorization": "Bearer secret"}
+            )
+
+        report = response.get_json()
+
+        self.assertEqual(hidden.status_code, 404)
+        self.assertTrue(report["ready"])
+        self.assertGreater(report["upstream_cache"]["entries"], 0)
+        self.assertGreater(report["upstream_cache"]["bytes"], 0)
+        self.assertIn("hit_ratio", report["page_cache"])
+        self.assertEqual(
+            set(report["formatted_posts_cache"]),
+            {"entries", "hit_ratio", "hits", "misses", "evictions"},
+        )
+        self.assertIn("/wp-json/wp/v2/posts", report["upstream"])
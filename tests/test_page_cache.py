@@ -0,0 +1,105 @@
+# Core
+import os
+import unittest
+from unittest.mock import patch
+
+# Local
+import api
+import app
+import feeds
+import page_cache
+from tests.stub_wordpress import StubWordPress
+
+
+class PageCacheTestCase(unittest.TestCase):
+    def _dependencies(self, *tags):
+        dependencies = page_cache._Dependencies()
+        dependencies.tags.update(tags)
+
+        return dependencies
+
+    def test_least_recently_used_pages_are_evicted(self):
+        cache = page_cache.PageCache(max_bytes=10, ttl=60)
+        cache.set("/a", b"aaaa", "text/html", self._dependencies("post:1"))
+        cache.set("/b", b"bbbb", "text/html", self._dependencies("post:2"))
+        cache.get("/a")
+        cache.set("/c", b"cccc", "text/html", self._dependencies("post:3"))
+
+        self.assertIsNotNone(cache.get("/a"))
+        self.assertIsNone(cache.get("/b"))
+        self.assertEqual(cache.bytes, 8)
+        self.assertEqual(cache.stats["evictions"], 1)
+
+    def test_invalidate_by_tag(self):
+        cache = page_cache.PageCache(max_bytes=100, ttl=60)
+        cache.set("/a", b"a", "text/html", self._dependencies("tag:1"))
+        cache.set("/b", b"b", "text/html", self._dependencies("tag:1", "x:2"))
+        cache.set("/c", b"c", "text/html", self._dependencies("tag:2"))
+
+        self.assertEqual(len(cache.invalidate({"tag:1"})), 2)
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.bytes, 1)
+        self.assertEqual(cache._keys_by_tag, {"tag:2": {"/c"}})
+
+
+class CachedViewsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.wordpress = StubWordPress().start()
+        api_url_patch = patch.object(
+            api, "API_URL", self.wordpress.url + "/wp-json/wp/v2"
+        )
+        api_url_patch.start()
+        self.addCleanup(api_url_patch.stop)
+        feeds.cached_session.cache.clear()
+        self.client = app.app.test_client()
+
+    def tearDown(self):
+        self.wordpress.stop()
+
+    def _posts_requests(self):
+        return self.wordpress.hits["/wp-json/wp/v2/posts"]
+
+    def test_page_served_from_cache_until_purged(self):
+        uri = "/tag/security?page=2&utm_source=test"
+
+        first = self.client.get(uri)
+        posts_requests = self._posts_requests()
+        second = self.client.get("/tag/security?page=2")
+
+        self.assertEqual(first.headers["X-Page-Cache"], "miss")
+        self.assertEqual(second.headers["X-Page-Cache"], "hit")
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(self._posts_requests(), posts_requests)
+
+        with patch.dict(os.environ, {"CACHE_PURGE_TOKEN": "secret"}):
+            purge = self.client.post(
+                "/_cache/purge",
+                json={"tags": [1262]},
+                headers={"Authorization": "Bearer secret"},
+            )
+
+        self.assertEqual(purge.get_json()["purged"], 1)
+
+        third = self.client.get(uri)
+
+        self.assertEqual(third.headers["X-Page-Cache"], "miss")
+        self.assertEqual(self._posts_requests(), posts_requests + 1)
+
+    def test_encoded_query_parameters_have_their_own_pages(self):
+        with patch.object(
+            page_cache, "cache", page_cache.PageCache(1024 * 1024, ttl=60)
+        ):
+            encoded = self.client.get("/archives?category=a%26group%3Dx")
+            separate = self.client.get("/archives?category=a&group=x")
+
+        self.assertEqual(encoded.headers["X-Page-Cache"], "miss")
+        self.assertEqual(separate.headers["X-Page-Cache"], "miss")
+
+    def test_purge_needs_token(self):
+        response = self.client.post("/_cache/purge", json={"posts": [1]})
+
+        self.assertEqual(response.status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
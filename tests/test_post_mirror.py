@@ -0,0 +1,185 @@
+# Core
+import threading
+import unittest
+from datetime import datetime
+from unittest.mock import Mock, patch
+
+# Local
+import api
+import feeds
+import post_mirror
+import search_index
+from tests.stub_wordpress import StubWordPress
+
+
+class PostMirrorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.wordpress = StubWordPress().start()
+        api_url_patch = patch.object(
+            api, "API_URL", self.wordpress.url + "/wp-json/wp/v2"
+        )
+        api_url_patch.start()
+        self.addCleanup(api_url_patch.stop)
+
+        for name, value in [
+            ("mirror", post_mirror.PostMirror()),
+            ("loaded", threading.Event()),
+        ]:
+            mirror_patch = patch.object(post_mirror, name, value)
+            mirror_patch.start()
+            self.addCleanup(mirror_patch.stop)
+
+        feeds.cached_session.cache.clear()
+
+    def tearDown(self):
+        self.wordpress.stop()
+
+    def _listing(self, kwargs):
+        posts, total_posts, total_pages = api.get_posts(**kwargs)
+
+        return [post["id"] for post in posts], total_posts, total_pages
+
+    def test_listings_match_the_api(self):
+        post = self.wordpress.posts[5]
+        cases = [
+            {},
+            {"page": 2},
+            {"page": 3, "per_page": 100},
+            {"page": 100},
+            {"per_page": 100},
+            {"sticky": True},
+            {"sticky": False, "page": 2},
+            {"slugs": [post["slug"]]},
+            {"group_ids": post["group"]},
+            {"category_ids": post["categories"], "page": 2},
+            {"tag_ids": post["tags"]},
+            {"tag_ids": post["tags"], "group_ids": post["group"]},
+            {"tags_exclude_ids": []},
+            {"author_ids": [post["author"]]},
+            {"after": datetime(2018, 1, 1), "before": datetime(2018, 2, 1)},
+            {"after": datetime(2030, 1, 1)},
+            {"tag_ids": post["tags"], "exclude": post["id"], "per_page": 3},
+            {"post_ids": [post["id"], self.wordpress.posts[9]["id"]]},
+        ]
+        from_api = [self._listing(kwargs) for kwargs in cases]
+
+        post_mirror.load()
+        self.wordpress.reset()
+
+        for kwargs, expected in zip(cases, from_api):
+            with self.subTest(**kwargs):
+                self.assertEqual(self._listing(kwargs), expected)
+
+        self.assertEqual(self.wordpress.request_count, 0)
+
+    def test_searches_use_the_api(self):
+        post_mirror.load()
+        self.wordpress.reset()
+
+        api.get_posts(query="ubuntu")
+
+        self.assertEqual(self.wordpress.hits["/wp-json/wp/v2/posts"], 1)
+
+    def test_listed_posts_are_copies(self):
+        post_mirror.load()
+        posts, _, _ = api.get_posts(per_page=1)
+        posts[0]["title"] = "Changed"
+
+        posts, _, _ = api.get_posts(per_page=1)
+
+        self.assertNotEqual(posts[0]["title"], "Changed")
+
+    def test_refresh(self):
+        post_mirror.load()
+        post = self.wordpress.posts[0]
+        post["title"]["rendered"] = "Updated"
+        post["modified"] = "2099-01-01T00:00:00"
+        self.wordpress.reset()
+
+        with patch("page_cache.purge") as purge:
+            post_mirror.refresh()
+
+        # Modified posts, then the number of posts
+        self.assertEqual(self.wordpress.request_count, 2)
+        self.assertEqual(
+            api.get_posts(slugs=[post["slug"]])[0][0]["title"]["rendered"],
+            "Updated",
+        )
+        self.assertEqual(purge.call_args[1]["posts"], [post["id"], post["id"]])
+        self.assertEqual(purge.call_args[1]["tags"], set(post["tags"]))
+        self.assertEqual(
+            post_mirror.mirror.modified_after, post["modified"]
+        )
+
+    def test_refresh_again(self):
+        post_mirror.load()
+        removed, edited = self.wordpress.posts[3:5]
+
+        # Nothing changed, then the same requests again once it has
+        with patch("page_cache.purge"):
+            post_mirror.refresh()
+            post_mirror.refresh(post_ids=[edited["id"]])
+            self.wordpress.posts.remove(removed)
+            edited["title"]["rendered"] = "Edited"
+            post_mirror.refresh(post_ids=[edited["id"]])
+            edited["modified"] = "2099-01-01T00:00:00"
+            edited["title"]["rendered"] = "Edited again"
+            post_mirror.refresh()
+
+        self.assertEqual(api.get_posts(slugs=[removed["slug"]]), ([], 0, 0))
+        self.assertEqual(
+            api.get_posts(post_ids=[edited["id"]])[0][0]["title"]["rendered"],
+            "Edited again",
+        )
+
+    def test_refresh_removes_unpublished_posts(self):
+        post_mirror.load()
+        post = self.wordpress.posts[3]
+        self.wordpress.posts.remove(post)
+        listener = Mock()
+
+        with patch("page_cache.purge") as purge, patch.object(
+            post_mirror, "listeners", [listener]
+        ):
+            post_mirror.refresh()
+
+        self.assertEqual(api.get_posts(slugs=[post["slug"]]), ([], 0, 0))
+        self.assertEqual(len(post_mirror.mirror), len(self.wordpress.posts))
+        self.assertEqual(purge.call_args[1]["posts"], [post["id"]])
+        listener.assert_called_once_with([], {post["id"]})
+
+    def test_refresh_checks_posts_by_id(self):
+        post_mirror.load()
+
+        # Replaced by a new post, so the API counts as many as before
+        removed, edited = self.wordpress.posts[3:5]
+        self.wordpress.posts.remove(removed)
+        self.wordpress.posts.append(
+            dict(removed, id=99999, slug="new", modified="2099-01-01T00:00:00")
+        )
+        edited["title"]["rendered"] = "Edited"
+
+        with patch("page_cache.purge") as purge:
+            post_mirror.refresh(post_ids=[removed["id"], edited["id"]])
+
+        self.assertEqual(len(post_mirror.mirror), len(self.wordpress.posts))
+        self.assertEqual(
+            api.get_posts(post_ids=[edited["id"]])[0][0]["title"]["rendered"],
+            "Edited",
+        )
+        self.assertIn(removed["id"], purge.call_args[1]["posts"])
+
+    def test_search_index_uses_the_mirror(self):
+        post_mirror.load()
+        self.wordpress.reset()
+
+        with patch.object(
+            post_mirror, "POST_MIRROR_REFRESH_INTERVAL", 60
+        ), patch.object(search_index, "index", search_index.SearchIndex()):
+            search_index.load()
+
+            # Every post except those with language tags
+            _, total_posts, _ = api.get_posts()
+
+            self.assertEqual(len(search_index.index), total_posts)
+            self.assertEqual(self.wordpress.hits["/wp-json/wp/v2/posts"], 0)
@@ -0,0 +1,97 @@
+# Core
+import unittest
+from unittest.mock import patch
+
+# Third-party
+import flask
+
+# Local
+import api
+import feeds
+import helpers
+from post_records import PostRecord
+from tests.stub_wordpress import StubWordPress, generate_corpus
+
+
+class PostRecordTestCase(unittest.TestCase):
+    def setUp(self):
+        self.post = generate_corpus(1)[0]
+        self.record = PostRecord.from_api(self.post)
+
+    def test_from_api(self):
+        self.assertEqual(self.record["id"], self.post["id"])
+        self.assertEqual(
+            self.record["title"], {"rendered": self.post["title"]["rendered"]}
+        )
+        self.assertEqual(
+            self.record["featuredmedia"],
+            {
+                "source_url": self.post["_embedded"]["wp:featuredmedia"][0][
+                    "source_url"
+                ],
+                "alt_text": "",
+            },
+        )
+        self.assertNotIn("guid", self.record)
+        self.assertNotIn("_links", self.record)
+        self.assertEqual(list(self.record["_embedded"]), ["author"])
+
+    def test_behaves_like_a_dictionary(self):
+        record = self.record.copy()
+        record.update({"summary": "Summary", "category": {"name": "News"}})
+
+        self.assertEqual(record.get("summary"), "Summary")
+        self.assertIsNone(record.get("start_date"))
+        self.assertNotIn("summary", self.record)
+        self.assertEqual(dict(record)["tags"], self.post["tags"])
+
+        with self.assertRaises(KeyError):
+            record["guid"] = {}
+
+    def test_format_and_render(self):
+        post = helpers.format_post(self.record.copy())
+
+        with flask.Flask(__name__).app_context():
+            rendered = flask.render_template_string(
+                "{{ post.title.rendered }} {{ post.author.name }} "
+                "{{ post.featuredmedia.source_url }} {{ post.missing }}",
+                post=post,
+            )
+
+        self.assertEqual(
+            rendered,
+            "{} {} {} ".format(
+                self.post["title"]["rendered"],
+                self.post["_embedded"]["author"][0]["name"],
+                self.post["_embedded"]["wp:featuredmedia"][0]["source_url"],
+            ),
+        )
+
+
+class RestrictedFieldsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.wordpress = StubWordPress().start()
+        api_url_patch = patch.object(
+            api, "API_URL", self.wordpress.url + "/wp-json/wp/v2"
+        )
+        api_url_patch.start()
+        self.addCleanup(api_url_patch.stop)
+        feeds.cached_session.cache.clear()
+
+    def tearDown(self):
+        self.wordpress.stop()
+
+    def test_same_records_with_fewer_fields(self):
+        posts, total_posts, total_pages = api.get_posts(per_page=20)
+
+        with patch.object(api, "RESTRICT_POST_FIELDS", True):
+            restricted = api.get_posts(per_page=20)
+
+        self.assertEqual(
+            [dict(post) for post in restricted[0]],
+            [dict(post) for post in posts],
+        )
+        self.assertEqual(restricted[1:], (total_posts, total_pages))
+
+        # A separate request, with "_fields"
+        self.assertEqual(self.wordpress.hits["/wp-json/wp/v2/posts"], 2)
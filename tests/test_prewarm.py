@@ -0,0 +1,103 @@
+# Core
+import fcntl
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+# Local
+import api
+import app
+import feeds
+import page_cache
+import prewarm
+from tests.stub_wordpress import StubWordPress
+
+
+class PrewarmTestCase(unittest.TestCase):
+    def setUp(self):
+        self.wordpress = StubWordPress().start()
+        api_url_patch = patch.object(
+            api, "API_URL", self.wordpress.url + "/wp-json/wp/v2"
+        )
+        api_url_patch.start()
+        self.addCleanup(api_url_patch.stop)
+        feeds.cached_session.cache.clear()
+
+    def tearDown(self):
+        self.wordpress.stop()
+
+    def test_default_urls_are_pages(self):
+        urls = prewarm.default_urls(app.app)
+
+        self.assertIn("/", urls)
+        self.assertIn("/press-centre", urls)
+        self.assertIn("/upcoming", urls)
+        self.assertNotIn("/status", urls)
+        self.assertNotIn("/_cache/purge", urls)
+        self.assertFalse(any("<" in url for url in urls))
+
+    def test_recent_post_urls(self):
+        urls = prewarm.recent_post_urls(count=3)
+
+        self.assertEqual(len(urls), 3)
+        self.assertRegex(urls[0], r"^/\d{4}/\d{2}/\d{2}/[^/]+$")
+
+    def test_warm_up_fills_caches(self):
+        urls = ["/upcoming"] + prewarm.recent_post_urls(count=2)
+        report = prewarm.warm_up(app.app, urls=urls)
+
+        self.assertEqual([page["url"] for page in report["pages"]], urls)
+        self.assertTrue(all(page["status"] == 200 for page in report["pages"]))
+        self.assertGreater(report["upstream_calls"], 0)
+        self.assertIs(prewarm.last_report, report)
+
+        # Every page is now rendered without waiting on the API
+        request_count = self.wordpress.request_count
+        client = app.app.test_client()
+
+        for url in urls:
+            self.assertEqual(client.get(url).status_code, 200)
+
+        self.assertEqual(self.wordpress.request_count, request_count)
+
+    def test_warm_up_as_the_public_host(self):
+        with patch.object(
+            page_cache, "cache", page_cache.PageCache(1024 * 1024, ttl=60)
+        ):
+            prewarm.warm_up(app.app, urls=["/"])
+            client = app.app.test_client()
+            public = client.get("/", base_url=prewarm.PREWARM_BASE_URL)
+            local = client.get("/")
+
+        self.assertEqual(public.headers["X-Page-Cache"], "hit")
+        self.assertIn(b"http://blog.ubuntu.com/?newsletter=true", public.data)
+        self.assertNotIn(b"localhost", public.data)
+
+        # Pages mentioning other hosts are cached separately
+        self.assertEqual(local.headers["X-Page-Cache"], "miss")
+        self.assertIn(b"http://localhost/?newsletter=true", local.data)
+
+    def test_not_ready_until_warm(self):
+        with patch.object(prewarm, "ready", threading.Event()):
+            client = app.app.test_client()
+            warming = client.get("/status/ready")
+            alive = client.get("/status")
+            prewarm.ready.set()
+            ready = client.get("/status/ready")
+
+        self.assertEqual(warming.status_code, 503)
+        self.assertEqual(alive.data, b"alive")
+        self.assertEqual(ready.data, b"ready")
+
+    def test_warm_up_in_turn(self):
+        with tempfile.NamedTemporaryFile() as lock_file, patch.object(
+            prewarm, "PREWARM_LOCK_FILE", lock_file.name
+        ):
+            report = prewarm.warm_up_in_turn(app.app)
+
+            # The lock is released for the next worker process
+            with open(lock_file.name) as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+        self.assertTrue(report["pages"])
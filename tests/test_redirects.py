@@ -0,0 +1,183 @@
+# Core
+import os
+import random
+import re
+import tempfile
+import unittest
+from unittest.mock import patch
+
+# Third-party
+import flask
+
+# Local
+import redirects
+
+
+def linear_match(rules, path):
+    """
+    How YamlRegexMap used to find a rule: trying each in turn
+    """
+
+    for regex, target in rules:
+        result = regex.fullmatch(path)
+
+        if result:
+            return result.groups(), target
+
+
+def compile_rules(patterns):
+    return [
+        (re.compile(pattern), "target {}".format(index))
+        for index, pattern in enumerate(patterns)
+    ]
+
+
+class RedirectMatcherTestCase(unittest.TestCase):
+    def assert_same_as_linear(self, rules, paths):
+        matcher = redirects.RedirectMatcher(rules)
+
+        for path in paths:
+            matched = matcher.match(path)
+
+            self.assertEqual(
+                (matched[0].groups(), matched[1]) if matched else None,
+                linear_match(rules, path),
+                path,
+            )
+
+    def test_first_match_wins(self):
+        rules = compile_rules(["/a/(?P<b>.*)", "/a/b", "/a/b/?"])
+
+        self.assertEqual(
+            redirects.RedirectMatcher(rules).match("/a/b")[1], "target 0"
+        )
+        self.assertEqual(
+            redirects.RedirectMatcher(rules[1:]).match("/a/b")[1], "target 1"
+        )
+
+    def test_patterns_without_literal_start(self):
+        rules = compile_rules(
+            ["/news", "(?i)/NEWS/?", "/a|/b", "[/]c", "/d\\.html"]
+        )
+        matcher = redirects.RedirectMatcher(rules)
+
+        self.assertEqual(matcher.match("/news")[1], "target 0")
+        self.assertEqual(matcher.match("/News/")[1], "target 1")
+        self.assertEqual(matcher.match("/b")[1], "target 2")
+        self.assertEqual(matcher.match("/c")[1], "target 3")
+        self.assertEqual(matcher.match("/d.html")[1], "target 4")
+        self.assertIsNone(matcher.match("/dxhtml"))
+
+    def test_same_as_linear_on_redirects_file(self):
+        rules = redirects.YamlRegexMap("redirects.yaml").matches
+        paths = [
+            "/",
+            "/home",
+            "/admin",
+            "/admin/users",
+            "/wp-login.php",
+            "/page/2",
+            "/page/2/cloud",
+            "/articles",
+            "/articles/",
+            "/category/news/year/2018/",
+            "/topic/cloud",
+            "/topic/other",
+            "/2018/01/24/a-post",
+        ]
+
+        self.assert_same_as_linear(rules, paths)
+
+    def test_same_as_linear_on_random_rules(self):
+        generator = random.Random(0)
+        parts = ["/a", "/b", "/ab", "/([^/]+)", "/?", "/.*", "/a|/b"]
+        patterns = [
+            "".join(generator.choice(parts) for part in range(3))
+            for index in range(200)
+        ]
+        paths = [
+            "".join(
+                generator.choice(["/a", "/b", "/c", "/"]) for part in range(3)
+            )
+            for index in range(500)
+        ]
+
+        self.assert_same_as_linear(compile_rules(patterns), paths)
+
+
+class ApplyRedirectsTestCase(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        permanent_path = os.path.join(directory.name, "permanent.yaml")
+        redirects_path = os.path.join(directory.name, "redirects.yaml")
+        self.redirects_path = redirects_path
+
+        with open(permanent_path, "w") as permanent_file:
+            permanent_file.write("/old/(?P<slug>[^/]+)/?: /new/{slug}\n")
+
+        with open(redirects_path, "w") as redirects_file:
+            redirects_file.write("/home/?: /\n")
+
+        self.app = flask.Flask(__name__)
+        self.apply_redirects = redirects.prepare_redirects(
+            permanent_redirects_path=permanent_path,
+            redirects_path=redirects_path,
+            cache_size=2,
+            reload_interval=0,
+        )
+        self.app.before_request(self.apply_redirects)
+        self.app.route("/<path:path>")(lambda path: "Not redirected")
+        self.client = self.app.test_client()
+
+    def test_lookups_remembered(self):
+        first = self.client.get("/old/post?a=1")
+        second = self.client.get("/old/post?b=2")
+        temporary = self.client.get("/home")
+
+        self.assertEqual(first.status_code, 301)
+        self.assertTrue(first.location.endswith("/new/post?a=1"))
+        self.assertTrue(second.location.endswith("/new/post?b=2"))
+        self.assertEqual(temporary.status_code, 302)
+        self.assertEqual(self.apply_redirects.stats["hits"], 1)
+        self.assertEqual(self.apply_redirects.stats["misses"], 2)
+
+    def test_no_redirect_remembered(self):
+        with patch.object(
+            redirects.YamlRegexMap,
+            "get_path_target",
+            wraps=lambda path: None,
+        ) as get_path_target:
+            self.client.get("/2018/01/24/a-post")
+            response = self.client.get("/2018/01/24/a-post")
+
+        self.assertEqual(response.data, b"Not redirected")
+        self.assertEqual(get_path_target.call_count, 2)
+        self.assertEqual(self.apply_redirects.stats["hits"], 1)
+
+    def test_reload_if_changed(self):
+        self.assertEqual(self.client.get("/home").status_code, 302)
+        self.assertEqual(self.client.get("/about").status_code, 200)
+        self.assertFalse(self.apply_redirects.reload_if_changed())
+
+        with open(self.redirects_path, "w") as redirects_file:
+            redirects_file.write("/about/?: /company/about\n")
+
+        self.assertTrue(self.apply_redirects.reload_if_changed())
+
+        about = self.client.get("/about")
+
+        self.assertEqual(about.status_code, 302)
+        self.assertTrue(about.location.endswith("/company/about"))
+        self.assertEqual(self.client.get("/home").status_code, 200)
+
+    def test_invalid_file_keeps_old_maps(self):
+        with open(self.redirects_path, "w") as redirects_file:
+            redirects_file.write("/home/?: [unclosed\n")
+
+        self.assertFalse(self.apply_redirects.reload_if_changed())
+        self.assertEqual(self.client.get("/home").status_code, 302)
+
+
+if __name__ == "__main__":
+    unittest.main()
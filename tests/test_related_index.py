@@ -0,0 +1,186 @@
+# Core
+import unittest
+from unittest.mock import patch
+
+# Local
+import api
+import app
+import feeds
+import page_cache
+import related_index
+import taxonomy
+from tests.stub_wordpress import StubWordPress
+
+
+def _post(post_id, tags=[], categories=[]):
+    date = "2018-01-{:02d}T10:00:00".format(post_id)
+
+    return {
+        "id": post_id,
+        "date": date,
+        "modified": date,
+        "tags": tags,
+        "categories": categories,
+    }
+
+
+class RelatedIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.index = related_index.RelatedIndex()
+        self.index.update(
+            [
+                _post(1, tags=[10, 11], categories=[1]),
+                _post(2, tags=[10], categories=[1]),
+                _post(3, tags=[11], categories=[2]),
+                _post(4, tags=[10, 11], categories=[2]),
+                _post(5, tags=[12], categories=[1]),
+            ]
+        )
+
+    def test_most_shared_terms_first(self):
+        self.assertEqual(self.index.get(1), [4, 2, 3])
+        self.assertEqual(self.index.get(5), [2, 1])
+        self.assertIsNone(self.index.get(99))
+        self.assertEqual(len(self.index), 5)
+
+    def test_rarer_tags_count_for_more(self):
+        index = related_index.RelatedIndex()
+        index.update(
+            [_post(1, tags=[10, 11]), _post(2, tags=[10]), _post(3, tags=[11])]
+            + [_post(post_id, tags=[11, 20]) for post_id in range(4, 9)]
+        )
+
+        # Tag 10 is on two posts, tag 11 on seven, and post 3 has
+        # nothing but tag 11, so it's more related than posts 4-8
+        self.assertEqual(index.get(1), [2, 3, 8])
+
+    def test_newest_first_for_equal_scores(self):
+        index = related_index.RelatedIndex()
+        index.update([_post(post_id, tags=[10]) for post_id in range(1, 6)])
+
+        self.assertEqual(index.get(1), [5, 4, 3])
+        self.assertEqual(index.get(5), [4, 3, 2])
+
+    def test_language_posts_are_left_out(self):
+        self.index.update([_post(4, tags=[10, 11, 3184])])
+
+        self.assertIsNone(self.index.get(4))
+        self.assertEqual(self.index.get(1), [2, 3, 5])
+        self.assertEqual(len(self.index), 4)
+
+    def test_updates(self):
+        # The same terms as post 2
+        self.index.update([_post(6, tags=[10], categories=[1])])
+
+        self.assertEqual(self.index.get(2), [6, 1, 4])
+        self.assertEqual(self.index.get(6), [2, 1, 4])
+
+        # Post 4 was among the related posts of posts 1 and 2,
+        # and no longer shares their terms
+        self.index.update([_post(4, tags=[13], categories=[2])])
+
+        self.assertEqual(self.index.get(1), [3, 6, 2])
+        self.assertEqual(self.index.get(2), [6, 1, 5])
+        self.assertEqual(self.index.modified_after, "2018-01-06T10:00:00")
+
+    def test_removed_posts(self):
+        self.index.update([], removed_ids={4})
+
+        self.assertIsNone(self.index.get(4))
+        self.assertEqual(self.index.get(1), [2, 3, 5])
+        self.assertEqual(self.index.get(3), [1])
+
+    def test_posts_with_nothing_related(self):
+        self.index.update([_post(6, tags=[99])])
+
+        self.assertEqual(self.index.get(6), [])
+
+
+class PostViewTestCase(unittest.TestCase):
+    def setUp(self):
+        self.wordpress = StubWordPress().start()
+        api_url_patch = patch.object(
+            api, "API_URL", self.wordpress.url + "/wp-json/wp/v2"
+        )
+        api_url_patch.start()
+        self.addCleanup(api_url_patch.stop)
+        index_patch = patch.object(
+            related_index, "index", related_index.RelatedIndex()
+        )
+        index_patch.start()
+        self.addCleanup(index_patch.stop)
+        tags_patch = patch.object(
+            taxonomy,
+            "tags",
+            taxonomy.TaxonomyIndex(
+                "tags", lambda **kwargs: api.get_tags(**kwargs)
+            ),
+        )
+        tags_patch.start()
+        self.addCleanup(tags_patch.stop)
+        cache_patch = patch.object(
+            page_cache, "cache", page_cache.PageCache(1024 * 1024, ttl=60)
+        )
+        cache_patch.start()
+        self.addCleanup(cache_patch.stop)
+        feeds.cached_session.cache.clear()
+
+    def tearDown(self):
+        self.wordpress.stop()
+
+    def test_load_and_refresh(self):
+        related_index.load()
+
+        # Nothing modified yet, then the same poll again once there is
+        related_index.refresh()
+        first, second = self.wordpress.posts[0], self.wordpress.posts[10]
+
+        for post in [first, second]:
+            post["tags"] = [99999]
+            post["categories"] = []
+            post["modified"] = "2099-01-01T00:00:00"
+
+        related_index.refresh()
+
+        self.assertEqual(related_index.index.get(first["id"]), [second["id"]])
+        self.assertEqual(related_index.index.get(second["id"]), [first["id"]])
+
+    def test_related_posts_from_the_index(self):
+        related_index.load()
+        taxonomy.tags.load()
+        post = self.wordpress.posts[10]
+        related_ids = related_index.index.get(post["id"])
+        self.wordpress.reset()
+
+        response = app.app.test_client().get(
+            "/{}/{}".format(post["date"][:10].replace("-", "/"), post["slug"])
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(related_ids), 3)
+
+        for related_id in related_ids:
+            related = self.wordpress._post_by_id(related_id)
+            self.assertIn(related["title"]["rendered"].encode(), response.data)
+
+        # The post itself, then its related posts by ID
+        self.assertEqual(self.wordpress.hits["/wp-json/wp/v2/posts"], 2)
+        self.assertEqual(self.wordpress.hits["/wp-json/wp/v2/tags"], 0)
+
+    def test_no_related_posts_from_the_index(self):
+        related_index.load()
+        taxonomy.tags.load()
+        post = self.wordpress.posts[10]
+        self.wordpress.reset()
+
+        with patch.object(related_index.index, "get", return_value=[]):
+            response = app.app.test_client().get(
+                "/{}/{}".format(
+                    post["date"][:10].replace("-", "/"), post["slug"]
+                )
+            )
+
+        self.assertEqual(response.status_code, 200)
+
+        # Only the post itself, without asking for posts sharing its tags
+        self.assertEqual(self.wordpress.hits["/wp-json/wp/v2/posts"], 1)
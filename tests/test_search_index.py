@@ -0,0 +1,146 @@
+# Core
+import math
+import unittest
+from unittest.mock import patch
+
+# Local
+import api
+import app
+import feeds
+import helpers
+import search_index
+from tests.stub_wordpress import StubWordPress
+
+
+def _post(post_id, title, content="", tags=[], modified="2018-01-01T00:00:00"):
+    return {
+        "id": post_id,
+        "modified": modified,
+        "title": {"rendered": title},
+        "excerpt": {"rendered": ""},
+        "content": {"rendered": content},
+        "tags": tags,
+    }
+
+
+class SearchIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.index = search_index.SearchIndex()
+        self.index.add(_post(1, "Snaps on the desktop", "<p>Ubuntu</p>"))
+        self.index.add(_post(2, "Kubernetes", "<p>Snaps and snaps</p>"))
+        self.index.add(_post(3, "MAAS", "<p>Ubuntu &amp; bare metal</p>"))
+
+    def test_ranking(self):
+        # A word in the title counts for more than in the content
+        self.assertEqual(self.index.search("snaps"), ([1, 2], 2))
+
+    def test_every_word_must_match(self):
+        self.assertEqual(self.index.search("ubuntu snaps"), ([1], 1))
+        self.assertEqual(self.index.search("ubuntu metal"), ([3], 1))
+        self.assertEqual(self.index.search("ubuntu windows"), ([], 0))
+        self.assertEqual(self.index.search("the"), ([], 0))
+
+    def test_pagination(self):
+        self.assertEqual(
+            self.index.search("snaps", page=2, per_page=1), ([2], 2)
+        )
+        self.assertEqual(
+            self.index.search("snaps", page=3, per_page=1), ([], 2)
+        )
+
+    def test_replace_and_remove(self):
+        self.index.add(
+            _post(1, "Juju", "<p>Charms</p>", modified="2018-02-01T00:00:00")
+        )
+
+        self.assertEqual(self.index.search("snaps"), ([2], 1))
+        self.assertEqual(self.index.search("charms"), ([1], 1))
+        self.assertEqual(self.index.modified_after, "2018-02-01T00:00:00")
+
+        self.index.add(_post(2, "Kubernetes", tags=api.LANGUAGE_TAG_IDS[:1]))
+
+        self.assertEqual(self.index.search("kubernetes"), ([], 0))
+        self.assertEqual(len(self.index), 2)
+
+    def test_tag_names(self):
+        self.index.add(_post(4, "Robots", tags=[1262]), {1262: "security"})
+
+        self.assertEqual(self.index.search("security"), ([4], 1))
+
+    def test_posts_without_words(self):
+        index = search_index.SearchIndex()
+        index.add(_post(1, "Snaps"))
+        index.add(_post(2, ""))
+        index.remove(1)
+
+        # Post 1 is still in the postings for "snaps", until a reload
+        self.assertEqual(index.search("snaps"), ([], 0))
+
+
+class SearchViewTestCase(unittest.TestCase):
+    def setUp(self):
+        self.wordpress = StubWordPress().start()
+        api_url_patch = patch.object(
+            api, "API_URL", self.wordpress.url + "/wp-json/wp/v2"
+        )
+        api_url_patch.start()
+        self.addCleanup(api_url_patch.stop)
+        index_patch = patch.object(
+            search_index, "index", search_index.SearchIndex()
+        )
+        index_patch.start()
+        self.addCleanup(index_patch.stop)
+        feeds.cached_session.cache.clear()
+
+    def tearDown(self):
+        self.wordpress.stop()
+
+    def test_load_and_refresh(self):
+        search_index.load()
+        listed_posts = [
+            post
+            for post in self.wordpress.posts
+            if not set(post["tags"]) & set(api.LANGUAGE_TAG_IDS)
+        ]
+        post = listed_posts[0]
+
+        self.assertEqual(len(search_index.index), len(listed_posts))
+
+        # Nothing modified yet, then the same poll again once there is
+        search_index.refresh()
+        post["title"]["rendered"] = "Zygohistomorphic prepromorphisms"
+        post["modified"] = "2099-01-01T00:00:00"
+        self.wordpress.reset()
+        search_index.refresh()
+
+        self.assertEqual(self.wordpress.request_count, 1)
+        self.assertEqual(
+            search_index.index.search("prepromorphisms"), ([post["id"]], 1)
+        )
+
+    def test_search_posts(self):
+        search_index.load()
+        post_ids, total_posts = search_index.index.search("ubuntu", 1, 5)
+
+        posts, total, total_pages = helpers.search_posts("ubuntu", per_page=5)
+
+        self.assertEqual([post["id"] for post in posts], post_ids)
+        self.assertEqual(total, total_posts)
+        self.assertEqual(total_pages, math.ceil(total_posts / 5))
+        self.assertIn("summary", posts[0])
+
+        self.assertEqual(
+            helpers.search_posts("ubuntu", page=total_pages + 1),
+            ([], None, None),
+        )
+        self.assertEqual(helpers.search_posts("windows"), ([], 0, 0))
+
+    def test_search_view(self):
+        search_index.load()
+        self.wordpress.reset()
+
+        response = app.app.test_client().get("/search?q=meltdown+spectre")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"Meltdown Spectre", response.data)
+        self.assertEqual(self.wordpress.hits["/wp-json/wp/v2/posts"], 1)
@@ -0,0 +1,64 @@
+# Core
+import unittest
+from unittest.mock import patch
+
+# Local
+import api
+import feeds
+import taxonomy
+from tests.stub_wordpress import TAGS, StubWordPress
+
+
+class TaxonomyIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        extra_tags = [
+            {"id": 10000 + index, "name": "tag {}".format(index)}
+            for index in range(250)
+        ]
+
+        for tag in extra_tags:
+            tag["slug"] = tag["name"].replace(" ", "-")
+
+        self.wordpress = StubWordPress(tags=TAGS + extra_tags).start()
+        api_url_patch = patch.object(
+            api, "API_URL", self.wordpress.url + "/wp-json/wp/v2"
+        )
+        api_url_patch.start()
+        self.addCleanup(api_url_patch.stop)
+        feeds.cached_session.cache.clear()
+        self.index = taxonomy.TaxonomyIndex(
+            "tags", lambda **kwargs: api.get_tags(**kwargs)
+        )
+
+    def tearDown(self):
+        self.wordpress.stop()
+
+    def test_falls_back_to_api_before_loading(self):
+        tags = self.index.get(slugs=["security"])
+
+        self.assertEqual(tags[0]["id"], 1262)
+        self.assertEqual(self.wordpress.request_count, 1)
+        self.assertEqual(self.index.stats["misses"], 1)
+
+    def test_lookups_after_loading(self):
+        self.index.load()
+
+        # 259 tags, 100 per page
+        self.assertEqual(len(self.index), 259)
+        self.assertEqual(self.wordpress.request_count, 3)
+
+        by_slug = self.index.get(slugs=["maas", "tag-249"])
+        by_id = self.index.get(ids=[1304, 10249])
+
+        self.assertEqual(by_slug, by_id)
+        self.assertEqual([tag["id"] for tag in by_slug], [1304, 10249])
+        self.assertEqual(self.index.stats["hits"], 2)
+        self.assertEqual(self.wordpress.request_count, 3)
+
+        # Unknown slugs are still checked with the API
+        self.assertEqual(self.index.get(slugs=["not-a-tag"]), [])
+        self.assertEqual(self.wordpress.request_count, 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
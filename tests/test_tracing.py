@@ -0,0 +1,77 @@
+# Core
+import unittest
+from unittest.mock import patch
+
+# Third-party
+import flask
+
+# Local
+import api
+import feeds
+import helpers
+import tracing
+from tests.stub_wordpress import StubWordPress
+
+
+class TracingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.wordpress = StubWordPress().start()
+        api_url_patch = patch.object(
+            api, "API_URL", self.wordpress.url + "/wp-json/wp/v2"
+        )
+        api_url_patch.start()
+        self.addCleanup(api_url_patch.stop)
+        feeds.cached_session.cache.clear()
+
+    def tearDown(self):
+        self.wordpress.stop()
+
+    def _client(self, enabled):
+        app = flask.Flask(__name__)
+
+        @app.route("/posts")
+        def posts():
+            posts, total_posts, total_pages = helpers.get_formatted_posts(
+                per_page=3
+            )
+            api.get_tags(slugs=["security"])
+
+            return flask.render_template_string(
+                "{% for post in posts %}{{ post.title.rendered }}{% endfor %}",
+                posts=posts,
+            )
+
+        with patch.object(tracing, "REQUEST_TRACING", enabled):
+            tracing.register(app)
+
+        return app.test_client()
+
+    def test_server_timing(self):
+        client = self._client(enabled=True)
+
+        with self.assertLogs("tracing") as logs:
+            first = client.get("/posts")
+            second = client.get("/posts")
+
+        timing = first.headers["Server-Timing"]
+        self.assertIn('desc="2 calls, 2 misses', timing)
+        self.assertIn("format_post;dur=", timing)
+        self.assertIn("render;dur=", timing)
+        self.assertIn("app;dur=", timing)
+        self.assertIn(
+            'desc="2 calls, 0 misses', second.headers["Server-Timing"]
+        )
+
+        record = logs.records[0]
+        self.assertEqual(record.upstream_calls, 2)
+        self.assertEqual(record.upstream_misses, 2)
+        self.assertGreater(record.upstream_bytes, 0)
+        self.assertIn("tags?slug=security:miss:", record.upstream)
+        self.assertEqual(logs.records[1].upstream_hits, 2)
+
+    def test_off(self):
+        response = self._client(enabled=False).get("/posts")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("Server-Timing", response.headers)
+        self.assertIsNone(tracing._trace.get())
@@ -0,0 +1,216 @@
+# Core
+import contextvars
+import logging
+import os
+import threading
+import time
+from collections import Counter
+
+# Third-party
+import flask
+
+
+# Request tracing settings
+# ===
+# With REQUEST_TRACING, each response gets a Server-Timing header, and
+# a log line, breaking down where the time went: the upstream requests
+# made (and whether they came from the cache), formatting posts and
+# rendering templates. When it's off, each step costs only a context
+# variable lookup.
+REQUEST_TRACING = os.getenv("REQUEST_TRACING", "false").lower() == "true"
+
+# The trace of the request being handled, shared with any threads
+# started by helpers.run_concurrently
+_trace = contextvars.ContextVar("request_trace", default=None)
+
+
+class _Trace:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.upstream = []
+        self.durations = Counter()
+        self._lock = threading.Lock()
+
+    def add_upstream(self, call):
+        with self._lock:
+            self.upstream.append(call)
+
+    def add_duration(self, name, seconds):
+        with self._lock:
+            self.durations[name] += seconds
+
+
+class _Timer:
+    """
+    Adds the time spent in a "with" block to the request's trace
+    """
+
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *args):
+        self.trace.add_duration(self.name, time.perf_counter() - self.start)
+
+
+class _NoTimer:
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *args):
+        pass
+
+
+_no_timer = _NoTimer()
+
+
+def timer(name):
+    """
+    Time a block of code as part of the request's trace, e.g.:
+
+        with tracing.timer("format_post"):
+            ...
+    """
+
+    trace = _trace.get()
+
+    if trace is None:
+        return _no_timer
+
+    return _Timer(trace, name)
+
+
+def record_upstream(url, response, seconds):
+    """
+    Note an upstream lookup made while handling the request:
+    whether it came from the cache, its size and how long it took.
+    `response` is None if the lookup failed.
+    """
+
+    trace = _trace.get()
+
+    if trace is None:
+        return
+
+    if response is None:
+        cache = "error"
+    elif getattr(response, "from_cache", False):
+        cache = "hit"
+    else:
+        cache = "miss"
+
+    trace.add_upstream(
+        {
+            "url": url,
+            "cache": cache,
+            "bytes": len(response.content) if response is not None else 0,
+            "seconds": seconds,
+        }
+    )
+
+
+def _milliseconds(seconds):
+    return round(seconds * 1000, 1)
+
+
+def start_trace():
+    """
+    A "before_request" function to start tracing the request
+    """
+
+    _trace.set(_Trace())
+
+
+def finish_trace(response):
+    """
+    An "after_request" function to add the Server-Timing header,
+    and log the request's upstream lookups and timings
+    """
+
+    trace = _trace.get()
+    _trace.set(None)
+
+    if trace is None:
+        return response
+
+    total = time.perf_counter() - trace.start
+    cache = Counter(call["cache"] for call in trace.upstream)
+    upstream_seconds = sum(call["seconds"] for call in trace.upstream)
+    upstream_bytes = sum(call["bytes"] for call in trace.upstream)
+
+    # Lookups made at the same time overlap,
+    # so "upstream" can add up to more than "app"
+    timings = [
+        'upstream;dur={};desc="{} calls, {} misses, {} bytes"'.format(
+            _milliseconds(upstream_seconds),
+            len(trace.upstream),
+            cache["miss"],
+            upstream_bytes,
+        )
+    ]
+    timings.extend(
+        "{};dur={}".format(name, _milliseconds(seconds))
+        for name, seconds in sorted(trace.durations.items())
+    )
+    timings.append("app;dur={}".format(_milliseconds(total)))
+    response.headers["Server-Timing"] = ", ".join(timings)
+
+    extra = {
+        "upstream_calls": len(trace.upstream),
+        "upstream_hits": cache["hit"],
+        "upstream_misses": cache["miss"],
+        "upstream_errors": cache["error"],
+        "upstream_bytes": upstream_bytes,
+        "upstream_ms": _milliseconds(upstream_seconds),
+        "upstream": " ".join(
+            "{}:{}:{}ms:{}B".format(
+                call["url"],
+                call["cache"],
+                _milliseconds(call["seconds"]),
+                call["bytes"],
+            )
+            for call in trace.upstream
+        ),
+        "total_ms": _milliseconds(total),
+    }
+
+    for name, seconds in trace.durations.items():
+        extra[name + "_ms"] = _milliseconds(seconds)
+
+    logging.getLogger(__name__).info(
+        "Request trace for {}".format(flask.request.path), extra=extra
+    )
+
+    return response
+
+
+def _template_render_started(app, template, context):
+    trace = _trace.get()
+
+    if trace is not None:
+        flask.g.render_start = time.perf_counter()
+
+
+def _template_rendered(app, template, context):
+    trace = _trace.get()
+    start = flask.g.pop("render_start", None)
+
+    if trace is not None and start is not None:
+        trace.add_duration("render", time.perf_counter() - start)
+
+
+def register(app):
+    """
+    Trace every request to the app, if REQUEST_TRACING is on
+    """
+
+    if not REQUEST_TRACING:
+        return
+
+    app.before_request(start_trace)
+    app.after_request(finish_trace)
+    flask.before_render_template.connect(_template_render_started, app)
+    flask.template_rendered.connect(_template_rendered, app)